@@ -0,0 +1,214 @@
+import collections
+import math
+import random
+import time
+from typing import *
+
+from core import Pool, SpaceObject, SpatialHash
+
+# ? Level of detail, how many steps an agent waits between updates depending on how far from the player it is
+# * Agents that aren't updated keep drifting on whatever impulse they were given last, so from far away
+# * (or off screen) it's hard to tell they're thinking less often
+NEAR_DISTANCE = 200
+FAR_DISTANCE = 450
+NEAR_INTERVAL = 1
+MID_INTERVAL = 4
+FAR_INTERVAL = 12
+OFFSCREEN_INTERVAL = 24
+
+# ? Enemies sharing a broadphase cell with more than this many others get pushed out of it
+CROWD_SIZE = 3
+
+# ? SpaceObject.group every wave enemy (and enemy bullet) gets, so a crowd of them doesn't flood the collision pass
+ENEMY_GROUP = 1
+
+
+class Agent:
+    # ? AI state of one enemy, kept out of SpaceObject since it's slotted and most objects don't think
+    __slots__ = ("obj", "nextUpdate", "lastUpdate", "nextShot", "wander")
+
+    def __init__(self, obj: SpaceObject, frame: int, wander: Tuple[float, float]):
+        self.obj = obj
+        self.nextUpdate = frame
+        self.lastUpdate = frame
+        self.nextShot = frame
+        self.wander = wander  # ? Fixed offset added to the steering so a wave doesn't collapse onto one point
+
+
+class AIDirector:
+    # ? Updates every agent round robin under a per step time budget, agents that are due but don't fit
+    # ? in the budget get deferred to the front of the next step, so a huge wave makes enemies react a
+    # ? little later instead of making the frame late
+    # * Replays need every step to update exactly the same agents, so with maxUpdates set the budget is
+    # * counted in agent updates instead of seconds (see WaveController)
+    def __init__(self, bounds: Tuple[int, int], impulses: Pool, fire, rng: random.Random, budget: float = 0.002, maxUpdates: Optional[int] = None):
+        self.bounds = bounds
+        self.impulses = impulses
+        self.fire = fire  # ? fire(obj, dx, dy) shoots from obj in the (normalised) direction dx, dy
+        self.rng = rng
+        self.budget = budget
+        self.maxUpdates = maxUpdates
+
+        self.agents: List[Agent] = []
+        self.cursor = 0
+
+        self.thrust = 1.2
+        self.separation = 1.0
+        self.falloff = 0.3
+        self.maxSpeed = 3
+        self.fireRange = 350
+        self.fireInterval = 90  # ? Steps between shots, plus up to the same again at random
+
+        # ? Stats of the last update(), costs keeps the last few hundred for percentiles
+        self.cost = 0.0
+        self.updated = 0
+        self.deferred = 0
+        self.costs = collections.deque(maxlen=600)
+
+    def add(self, obj: SpaceObject, frame: int):
+        self.agents.append(Agent(obj, frame, (self.rng.uniform(-0.5, 0.5), self.rng.uniform(-0.5, 0.5))))
+
+    def interval(self, pos, distance: float) -> int:
+        if pos[0] < 0 or pos[1] < 0 or pos[0] > self.bounds[0] or pos[1] > self.bounds[1]:
+            return OFFSCREEN_INTERVAL
+        if distance < NEAR_DISTANCE:
+            return NEAR_INTERVAL
+        if distance < FAR_DISTANCE:
+            return MID_INTERVAL
+        return FAR_INTERVAL
+
+    def update(self, frame: int, target: SpaceObject, neighbours: Optional[SpatialHash] = None):
+        # ? Called once per simulation step, before the game ticks, neighbours is the broadphase from the last tick
+        # ? and only gets used to keep agents from piling up
+        start = time.perf_counter()
+        self.prune()
+
+        deadline = start + self.budget
+        updated = 0
+        deferred = 0
+        resume = None  # ? The first deferred agent, next step starts from there
+
+        agents = self.agents
+        count = len(agents)
+        for n in range(count):
+            i = (self.cursor + n) % count
+            agent = agents[i]
+            if frame < agent.nextUpdate:
+                continue
+
+            if self.maxUpdates is not None:
+                full = updated >= self.maxUpdates
+            else:
+                full = updated != 0 and time.perf_counter() >= deadline
+            if full:
+                deferred += 1
+                if resume is None:
+                    resume = i
+            else:
+                self.think(agent, frame, target, neighbours)
+                updated += 1
+
+        if resume is not None:
+            self.cursor = resume
+        self.updated = updated
+        self.deferred = deferred
+        self.cost = time.perf_counter() - start
+        self.costs.append(self.cost)
+
+    def prune(self):  # ? Drops the agents of dead enemies, keeping the order (and the cursor pointing at the same agent)
+        dead = 0
+        for agent in self.agents:
+            if agent.obj.isDead:
+                dead += 1
+        if dead == 0:
+            return
+
+        alive = []
+        cursor = 0
+        for i, agent in enumerate(self.agents):
+            if agent.obj.isDead:
+                continue
+            if i < self.cursor:
+                cursor += 1
+            alive.append(agent)
+        self.agents = alive
+        self.cursor = cursor if cursor < len(alive) else 0
+
+    def think(self, agent: Agent, frame: int, target: SpaceObject, neighbours: Optional[SpatialHash] = None):
+        obj = agent.obj
+        pos = obj.pos
+        dx = target.pos[0] - pos[0]
+        dy = target.pos[1] - pos[1]
+        distance = math.hypot(dx, dy)
+
+        # * Agents that were skipped for a while get a bigger push so they cover about the same ground,
+        # * the velocity's maxSpeed keeps that from turning into a dash
+        elapsed = min(frame - agent.lastUpdate, FAR_INTERVAL) if frame != agent.lastUpdate else 1
+        agent.lastUpdate = frame
+        agent.nextUpdate = frame + self.interval(pos, distance)
+
+        if target.isDead == False and distance > 1:
+            ux = dx / distance + agent.wander[0]
+            uy = dy / distance + agent.wander[1]
+        else:  # ? Nothing to chase, just drift
+            ux, uy = agent.wander
+
+        if neighbours is not None:  # ? Away from the middle of a crowded cell
+            size = neighbours.cellSize
+            cx = int(pos[0] // size)
+            cy = int(pos[1] // size)
+            bucket = neighbours.cells.get((cx, cy))
+            if bucket is not None and len(bucket) > CROWD_SIZE:
+                ox = pos[0] - (cx + 0.5) * size
+                oy = pos[1] - (cy + 0.5) * size
+                length = math.hypot(ox, oy)
+                if length > 1:
+                    ux += ox / length * self.separation
+                    uy += oy / length * self.separation
+                else:
+                    ux += agent.wander[0] * 2 * self.separation
+                    uy += agent.wander[1] * 2 * self.separation
+        scale = self.thrust * math.sqrt(elapsed)
+        obj.addForce(self.impulses.acquire(ux * scale, uy * scale, self.falloff, False, self.maxSpeed))
+
+        # ? Right on top of the target there's no direction to shoot in, it gets another go next update
+        if target.isDead == False and 0 < distance < self.fireRange and frame >= agent.nextShot:
+            agent.nextShot = frame + self.fireInterval + self.rng.randrange(self.fireInterval)
+            self.fire(obj, dx / distance, dy / distance)
+
+    def percentile(self, p: float) -> float:  # ? Seconds, over the last few hundred updates
+        if len(self.costs) == 0:
+            return 0.0
+        samples = sorted(self.costs)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    def __len__(self):
+        return len(self.agents)
+
+    def __str__(self):
+        return f"ai {self.cost * 1000:.2f}ms (p99 {self.percentile(0.99) * 1000:.2f}ms) | {self.updated} updated | {self.deferred} deferred | {len(self.agents)} agents"
+
+
+class WaveSpawner:
+    # ? Sends in a bigger wave every time the last one is wiped out, spawns trickle in a few per step
+    # ? so a wave of hundreds doesn't land as one huge spike
+    def __init__(self, spawn, baseCount: int = 20, growth: float = 1.6, maxCount: int = 600, perStep: int = 8):
+        self.spawn = spawn  # ? Called once for every enemy that should appear
+        self.baseCount = baseCount
+        self.growth = growth
+        self.maxCount = maxCount
+        self.perStep = perStep
+
+        self.wave = 0
+        self.pending = 0
+
+    def size(self, wave: int) -> int:
+        return min(self.maxCount, int(self.baseCount * self.growth ** (wave - 1)))
+
+    def update(self, alive: int):
+        if self.pending == 0 and alive == 0:
+            self.wave += 1
+            self.pending = self.size(self.wave)
+        for _ in range(min(self.perStep, self.pending)):
+            self.spawn()
+            self.pending -= 1
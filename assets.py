@@ -0,0 +1,197 @@
+import glob
+import mmap
+import os
+import struct
+import sys
+from typing import *
+
+import pygame
+
+# ? Everything gets looked up next to the game's own files, so it starts the same from any working directory
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_PATH = os.path.join(ROOT, "assets.bundle")
+
+# ? Asset Bundle Protocol Description (version 1):
+# ? Header:     [4 Bytes "BLAB"] | [1 Byte (int) version] | [2 Bytes (int) entry count]
+# ? Then an index with one entry per asset:
+# ? Entry:      [1 Byte (int) kind] | [1 Byte (int) name size] | [name size Bytes name] | [4 Bytes (int) offset]
+# ?             | [4 Bytes (int) size] | [2 Bytes (int) width] | [2 Bytes (int) height]
+# ? Then the assets themselves, at the offsets (from the start of the file) the index says
+# * Sprites get stored as raw RGBA pixels rather than PNGs, so loading one is pointing a Surface at the
+# * mapped file instead of decoding it, and every instance running on a host shares the same pages
+BUNDLE_MAGIC = b"BLAB"
+BUNDLE_VERSION = 1
+
+KIND_RAW = 0
+KIND_RGBA = 1
+
+BUNDLE_HEADER = struct.Struct("!4sBH")
+BUNDLE_ENTRY = struct.Struct("!BB")
+BUNDLE_LOCATION = struct.Struct("!IIHH")
+
+BUNDLED = ["*.png", "menu.txt"]  # ? Globs (relative to ROOT) of everything buildBundle() packs
+
+
+class AssetBundle:
+    # ? Read only view of a bundle built by buildBundle(), the file is memory mapped and only the index gets
+    # ? parsed up front, nothing is read off disk or decoded until somebody asks for it
+    # * Surfaces handed out by surface() keep pointing into the mapping, so a bundle stays open for as long as the process runs
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        magic, version, count = BUNDLE_HEADER.unpack_from(self.view)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError(f"{path} isn't a version {BUNDLE_VERSION} asset bundle")
+
+        self.index: Dict[str, Tuple[int, int, int, int, int]] = {}  # ? name -> (kind, offset, size, width, height)
+        offset = BUNDLE_HEADER.size
+        for _ in range(count):
+            kind, nameSize = BUNDLE_ENTRY.unpack_from(self.view, offset)
+            offset += BUNDLE_ENTRY.size
+            name = bytes(self.view[offset:offset + nameSize]).decode("utf-8")
+            offset += nameSize
+            self.index[name] = (kind, *BUNDLE_LOCATION.unpack_from(self.view, offset))
+            offset += BUNDLE_LOCATION.size
+
+    def data(self, name: str) -> memoryview:
+        _, offset, size, _, _ = self.index[name]
+        return self.view[offset:offset + size]
+
+    def text(self, name: str) -> str:
+        return str(self.data(name), "utf-8")
+
+    def surface(self, name: str) -> pygame.Surface:
+        kind, offset, size, width, height = self.index[name]
+        if kind != KIND_RGBA:
+            raise ValueError(f"{name} in {self.path} isn't a sprite")
+        return pygame.image.frombuffer(self.view[offset:offset + size], (width, height), "RGBA")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+
+_bundle: Optional[AssetBundle] = None
+_bundleChecked = False
+
+
+def defaultBundle() -> Optional[AssetBundle]:
+    # ? The bundle next to the game, opened once per process and shared by every AssetManager,
+    # ? None when it hasn't been built or is out of date (then everything gets loaded from the loose files)
+    global _bundle, _bundleChecked
+    if not _bundleChecked:
+        _bundleChecked = True
+        if os.path.exists(BUNDLE_PATH):
+            stale = staleSources()
+            if len(stale) != 0:
+                # * The bundle isn't tracked by git, so an old one would quietly keep showing sprites that have since been edited
+                print(f"{BUNDLE_PATH} is older than {', '.join(stale)}, loading the loose files instead (python assets.py rebuilds it)", file=sys.stderr)
+            else:
+                _bundle = AssetBundle(BUNDLE_PATH)
+    return _bundle
+
+
+def sourceNames(root: str = ROOT, patterns: List[str] = BUNDLED) -> List[str]:  # ? Everything matching patterns, as names relative to root
+    return sorted({os.path.relpath(match, root).replace(os.sep, "/") for pattern in patterns for match in glob.glob(os.path.join(root, pattern))})
+
+
+def staleSources(path: str = BUNDLE_PATH, root: str = ROOT, patterns: List[str] = BUNDLED) -> List[str]:
+    # ? Names of the files buildBundle() would pack that were changed (or added) after the bundle at path was written
+    built = os.path.getmtime(path)
+    return [name for name in sourceNames(root, patterns) if os.path.getmtime(os.path.join(root, name)) > built]
+
+
+def buildBundle(path: str = BUNDLE_PATH, root: str = ROOT, patterns: List[str] = BUNDLED) -> List[str]:
+    # ? Packs the assets matching patterns into a bundle at path, returns the names it packed
+    # * Written to a temporary file and moved into place, so games that have the old bundle mapped keep working
+    names = sourceNames(root, patterns)
+
+    entries = []
+    for name in names:
+        if name.endswith(".png"):
+            surface = pygame.image.load(os.path.join(root, name))
+            entries.append((name, KIND_RGBA, pygame.image.tostring(surface, "RGBA"), *surface.get_size()))
+        else:
+            with open(os.path.join(root, name), "rb") as f:
+                entries.append((name, KIND_RAW, f.read(), 0, 0))
+
+    index = bytearray(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(entries)))
+    offset = len(index) + sum(BUNDLE_ENTRY.size + len(name.encode("utf-8")) + BUNDLE_LOCATION.size for name, *_ in entries)
+    for name, kind, data, width, height in entries:
+        encoded = name.encode("utf-8")
+        index += BUNDLE_ENTRY.pack(kind, len(encoded)) + encoded + BUNDLE_LOCATION.pack(offset, len(data), width, height)
+        offset += len(data)
+
+    temp = f"{path}.tmp"
+    with open(temp, "wb") as f:
+        f.write(index)
+        for _, _, data, _, _ in entries:
+            f.write(data)
+    os.replace(temp, path)
+    return names
+
+
+class AssetManager:
+    # ? Loads every image once and hands out the same Surface to everyone who asks for it
+    # * SpaceObjects never draw onto their sprites so sharing a single Surface is safe
+    # ? Assets come out of the bundle when there is one (python assets.py builds it) and from the loose files next to the game otherwise
+    def __init__(self, bundle: Optional[AssetBundle] = None, root: str = ROOT, useBundle: bool = True):
+        self.bundle = None if not useBundle else defaultBundle() if bundle is None else bundle
+        self.root = root
+        self.surfaces: Dict[Any, pygame.Surface] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def image(self, path: str) -> pygame.Surface:
+        surface = self.surfaces.get(path)
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        if self.bundle is not None and path in self.bundle:
+            surface = self.bundle.surface(path)
+        else:
+            surface = pygame.image.load(os.path.join(self.root, path))
+
+        # ? Converting to the display's pixel format makes blits a lot cheaper, but it needs a
+        # ? window to exist so headless games just keep the surface as it was decoded
+        if pygame.display.get_init() and pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+
+        self.surfaces[path] = surface
+        return surface
+
+    def text(self, path: str) -> str:
+        if self.bundle is not None and path in self.bundle:
+            return self.bundle.text(path)
+        with open(os.path.join(self.root, path), "r") as f:
+            return f.read()
+
+    def blank(self, size: Tuple[int, int]) -> pygame.Surface:  # ? Shared empty surface, used for sprites that shouldn't show anything
+        key = ("blank", size)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = pygame.Surface(size)
+        self.surfaces[key] = surface
+        return surface
+
+    def __str__(self):
+        return f"[{len(self.surfaces)} assets|{self.hits} hits|{self.misses} misses|{'bundle' if self.bundle is not None else 'loose files'}]"
+
+
+if __name__ == "__main__":
+    # ? python assets.py [path] packs the sprites and menu into the bundle the game loads at startup,
+    # ? rerun it whenever one of them changes
+    path = sys.argv[1] if len(sys.argv) > 1 else BUNDLE_PATH
+    names = buildBundle(path)
+    print(f"Packed {len(names)} assets into {path} ({os.path.getsize(path)} bytes)")
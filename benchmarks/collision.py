@@ -0,0 +1,167 @@
+# ? Tick cost vs entity count, then the cost of a single overlap test, run from the repo root with:
+# ?   python -m benchmarks.collision [ticks per count]
+
+import os
+import random
+import sys
+import time
+import types
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from core import *
+
+COUNTS = [10, 100, 1000, 10000]
+ALL_PAIRS_LIMIT = 1000  # ? All-pairs at 10,000 entities is 100M inside() calls per tick, not worth waiting for
+SCR_DIMENSIONS = (800, 800)
+PAIR_TESTS = 100000
+
+
+class CollisionBox:
+    # ? The float box SpaceObjects used to collide with before they got a pygame.Rect, kept as the reference
+    def __init__(self, pos, dimensions):
+        self.top_left = (pos[0], pos[1])
+        self.bottom_right = (pos[0] + dimensions[0], pos[1] + dimensions[1])
+
+    def inside(self, coords):
+        return self.top_left[0] <= coords[0] <= self.bottom_right[0] and self.top_left[1] <= coords[1] <= self.bottom_right[1]
+
+    def corners(self, other):  # ? Whether a corner of other is inside this box, what the all-pairs loop tested
+        return self.inside(other.top_left) or self.inside(other.bottom_right) or \
+            self.inside((other.top_left[0], other.bottom_right[1])) or self.inside((other.bottom_right[0], other.top_left[1]))
+
+
+def makeGame(count, seed=0):
+    rng = random.Random(seed)
+    screen = pygame.Surface(SCR_DIMENSIONS)
+    sprite = pygame.Surface((8, 8))
+    children = []
+    for i in range(count):
+        children.append(SpaceObject(
+            pos=[rng.randint(0, SCR_DIMENSIONS[0]), rng.randint(0, SCR_DIMENSIONS[1])],
+            scr=screen,
+            sprite=sprite,
+            dead=sprite,
+            velocityQueue=[],
+            maxVelStack=1,
+            maxVelSpeed=5,
+            onWallCollided=lambda obj: None,
+            onCollision=lambda obj, target: None,
+            givenID=f"Bench_{i}",
+            velocityFalloff=0.1
+        ))
+    return Game(screen, children, 1)
+
+
+def allPairsCollide(game):  # ? The collision loop SpaceObject.tick used to run, kept here as the reference
+    objs = game.children
+    boxes = [CollisionBox(obj.pos, obj.dimensions) for obj in objs]
+    for obj, box in zip(objs, boxes):
+        for other, otherBox in zip(objs, boxes):
+            if other != obj:
+                if otherBox.corners(box):
+                    obj.onCollision(obj, other)
+
+
+def timeTicks(game, ticks):
+    start = time.perf_counter()
+    for _ in range(ticks):
+        game.tick()
+    return (time.perf_counter() - start) / ticks
+
+
+def makePairs(count, seed=0):
+    # ? Ships against bullets, both at random spots of the same 64x64 cell, so about a third of them overlap
+    # ? Bullets are thin and tall, when one crosses a ship edge-on none of the corners are inside the other
+    rng = random.Random(seed)
+    ship = pygame.Surface((16, 16), pygame.SRCALPHA)
+    pygame.draw.circle(ship, (255, 255, 255, 255), (8, 8), 8)
+    bullet = pygame.Surface((2, 24), pygame.SRCALPHA)
+    bullet.fill((255, 255, 255, 255))
+    pairs = []
+    for _ in range(count):
+        a = ship.get_rect(topleft=(rng.randint(0, 48), rng.randint(0, 48)))
+        b = bullet.get_rect(topleft=(rng.randint(0, 48), rng.randint(0, 48)))
+        pairs.append((a, ship, b, bullet))
+    return pairs
+
+
+def timePairs(pairs, test):  # ? ns per overlap test, tests return (hits, how many tests they ran)
+    start = time.perf_counter()
+    hits, tests = test(pairs)
+    return (time.perf_counter() - start) / tests * 1e9, hits
+
+
+def cornerTest(pairs):
+    hits = 0
+    for a, _, b, _ in pairs:
+        boxA = CollisionBox(a.topleft, a.size)
+        boxB = CollisionBox(b.topleft, b.size)
+        if boxA.corners(boxB) or boxB.corners(boxA):
+            hits += 1
+    return hits, len(pairs)
+
+
+def rectTest(pairs):
+    hits = 0
+    for a, _, b, _ in pairs:
+        if a.colliderect(b):
+            hits += 1
+    return hits, len(pairs)
+
+
+def batchedTest(pairs, batch=32):
+    # ? How SpatialHash.pairs tests a cell, one collidelistall() per ship against every bullet in its batch
+    # ? (about what a crowded cell holds), so hits aren't comparable with the other tests
+    ships = [a for a, _, _, _ in pairs]
+    bullets = [b for _, _, b, _ in pairs]
+    hits = 0
+    tests = 0
+    for start in range(0, len(pairs), batch):
+        others = bullets[start:start + batch]
+        for ship in ships[start:start + batch]:
+            hits += len(ship.collidelistall(others))
+            tests += len(others)
+    return hits, tests
+
+
+def maskTest(pairs):
+    masks = MaskCache()
+    hits = 0
+    for a, shipSprite, b, bulletSprite in pairs:
+        if a.colliderect(b) and masks.get(shipSprite).overlap(masks.get(bulletSprite), (b.x - a.x, b.y - a.y)) is not None:
+            hits += 1
+    return hits, len(pairs)
+
+
+def runPairs(count=PAIR_TESTS):
+    pairs = makePairs(count)
+    overlapping, _ = rectTest(pairs)
+    print(f"\n{count} ship/bullet pairs, {overlapping} with overlapping rects")
+    print(f"{'test':>24} | {'ns/test':>8} | {'hits':>6}")
+    for name, test in [("corners inside (old)", cornerTest), ("Rect.colliderect", rectTest), ("collidelistall (batched)", batchedTest), ("colliderect + mask", maskTest)]:
+        ns, hits = timePairs(pairs, test)
+        print(f"{name:>24} | {ns:>8.1f} | {hits:>6}")
+    print(f"corners inside missed {overlapping - cornerTest(pairs)[0]} overlaps (rects crossing edge-on)")
+
+
+def run(ticks=20):
+    print(f"{'entities':>10} | {'spatial hash (ms/tick)':>24} | {'all pairs (ms/tick)':>20}")
+    for count in COUNTS:
+        game = makeGame(count)
+        grid = timeTicks(game, ticks)
+
+        allPairs = "skipped"
+        if count <= ALL_PAIRS_LIMIT:
+            game = makeGame(count)
+            game.collide = types.MethodType(allPairsCollide, game)
+            allPairs = f"{timeTicks(game, ticks) * 1000:.3f}"
+
+        print(f"{count:>10} | {grid * 1000:>24.3f} | {allPairs:>20}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+    runPairs()
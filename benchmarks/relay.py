@@ -0,0 +1,289 @@
+# ? Relay load test, run from the repo root with:
+# ?   python -m benchmarks.relay [--clients 16,32,64,128,254] [--room-size 4] [--duration 5] [--workers N] [--procs N] [--out results.json]
+# ? For every client count it starts a fresh relay on loopback and a few processes full of bot clients that join
+# ? (Packet Type 0), send inputs (6) and peer states (8) at the rate NetworkController does and quit (4) at the end.
+# ? Peer states carry the time they were sent, which gives end to end relay latency and loss, and the relay
+# ? workers' CPU time gets read out of /proc (so this needs Linux). Ends with the most clients that stayed
+# ? under --max-p99 and --max-loss
+# * The relay's directory only has MAX_CLIENTS slots, so that's as far as one relay can be pushed. Bots run on the
+# * same machine as the relay, if the generator's CPU column gets near 100% per process the numbers are the bots' limit, not the relay's
+
+import argparse
+import array
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import struct
+import sys
+import time
+from typing import *
+
+from core import SPACE_OBJECT_STRUCT, Velocity
+from netcode import PEER_STATE, QUANTIZE, ROOM_STRUCT, InputSender
+from server import MAX_CLIENTS, startWorkers, worker
+
+ADDR = "127.0.0.1"
+
+SEND_RATE = 30  # ? NetworkController.networkRate, inputs and peer states each go out this often
+KEYS_HELD = 0.5  # ? Chance a bot is holding a key at any given send
+REDUNDANCY = 3
+
+# ? Appended to every peer state, the relay (and real clients) ignore anything past PEER_STATE
+# ? [8 Bytes (double) perf_counter() when it was sent]
+# * perf_counter() is system wide on Linux, so it means the same thing in the bots' and the relay's processes
+PROBE = struct.Struct("!d")
+
+STARTUP = 1.0  # ? Seconds the bots get to start and join before anything gets sent
+WARMUP = 1.0  # ? Seconds of sending before measuring starts
+DRAIN = 0.5  # ? Seconds after the last measured send that late packets still count
+RESULT_TIMEOUT = 10.0  # ? Seconds past the end of the run the bot processes get to hand in their results
+
+
+def quietWorker(*args):  # ? A relay worker that doesn't print a line for every bot that joins and leaves
+    sys.stdout = open(os.devnull, "w")
+    worker(*args)
+
+
+def cpuSeconds(pid: int) -> float:  # ? User + system time a process has used so far
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def freePort() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind((ADDR, 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class Bot(asyncio.DatagramProtocol):
+    # ? One simulated player, sends what a NetworkController would and keeps track of the probes it gets back
+    def __init__(self, room: int, rng: random.Random, window: Tuple[float, float], latencies: array.array):
+        self.room = room
+        self.rng = rng
+        self.window = window
+        self.latencies = latencies
+        self.transport = None
+
+        self.inputs = InputSender(SEND_RATE, REDUNDANCY)
+        self.pos = [rng.uniform(20, 780), rng.uniform(20, 780)]
+        self.frame = 0
+        self.probes = 0  # ? Peer states sent inside the window
+        self.received = 0  # ? Probes from other bots received that were sent inside the window
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def join(self):  # ? Packet Type 0: Player Join
+        spaceObject = SPACE_OBJECT_STRUCT.pack(int(self.pos[0]), int(self.pos[1]), 1, 5, 0.1)
+        self.transport.sendto(b"\x00" + spaceObject + ROOM_STRUCT.pack(self.room))
+
+    def send(self, now: float):
+        self.frame += 1
+        if self.rng.random() < KEYS_HELD:
+            vel = Velocity(self.rng.uniform(-0.2, 0.2), self.rng.uniform(-0.2, 0.2), 0.1, False, 5)
+            self.inputs.add(vel)
+            self.pos[0] = min(790, max(10, self.pos[0] + vel.x * 10))
+            self.pos[1] = min(790, max(10, self.pos[1] + vel.y * 10))
+        # ? Packet Type 6: Input, every tick makes a frame, held key or not, same as a real client
+        # * Nobody acks through the relay, every frame goes out REDUNDANCY times
+        self.inputs.endTick(self.frame)
+        self.transport.sendto(bytes(self.inputs.packet(now)))
+
+        # ? Packet Type 8: Peer State, with the probe on the end
+        self.transport.sendto(PEER_STATE.pack(8, self.frame, int(self.pos[0] * QUANTIZE), int(self.pos[1] * QUANTIZE), False) + PROBE.pack(now))
+        if self.window[0] <= now < self.window[1]:
+            self.probes += 1
+
+    def quit(self):  # ? Packet Type 4: Player Quit
+        self.transport.sendto(b"\x04")
+
+    def datagram_received(self, b, addr):
+        # * Relayed packets start with the sender's index, probes are the only ones that need looking at
+        if len(b) == 1 + PEER_STATE.size + PROBE.size and b[1] == 8:
+            now = time.perf_counter()
+            sentAt = PROBE.unpack_from(b, 1 + PEER_STATE.size)[0]
+            if self.window[0] <= sentAt < self.window[1]:
+                self.received += 1
+                self.latencies.append((now - sentAt) * 1000)
+
+
+async def driveBots(port: int, rooms: List[int], seed: int, start: float, window: Tuple[float, float]) -> dict:
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    latencies = array.array("d")
+
+    bots = []
+    for room in rooms:
+        _, bot = await loop.create_datagram_endpoint(lambda: Bot(room, random.Random(rng.random()), window, latencies), remote_addr=(ADDR, port))
+        bots.append(bot)
+    for bot in bots:
+        bot.join()
+
+    # ? Every bot sends once per interval, spread evenly over it instead of all at once
+    interval = 1 / SEND_RATE
+    cycle = 0
+    while start + cycle * interval < window[1]:
+        base = start + cycle * interval
+        for i, bot in enumerate(bots):
+            due = base + interval * i / len(bots)
+            delay = due - time.perf_counter()
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            bot.send(time.perf_counter())
+        cycle += 1
+
+    await asyncio.sleep(max(0.0, window[1] + DRAIN - time.perf_counter()))
+    for bot in bots:
+        bot.quit()
+    await asyncio.sleep(0.1)
+    for bot in bots:
+        bot.transport.close()
+
+    return {
+        "probes": [bot.probes for bot in bots],
+        "received": sum(bot.received for bot in bots),
+        "latencies": latencies.tobytes(),
+    }
+
+
+def botProcess(port: int, rooms: List[int], seed: int, start: float, window: Tuple[float, float], results):
+    results.put((os.getpid(), asyncio.run(driveBots(port, rooms, seed, start, window))))
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if len(ordered) == 0:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def runStep(clients: int, roomSize: int, duration: float, workers: int, procs: int, seed: int) -> dict:
+    port = freePort()
+    relay, _ = startWorkers(ADDR, port, workers, workers > 1, target=quietWorker)
+    time.sleep(0.3)  # ? Long enough for the workers to bind
+
+    rooms = [i // roomSize for i in range(clients)]
+    roomSizes = {room: rooms.count(room) for room in rooms}
+
+    start = time.perf_counter() + STARTUP
+    window = (start + WARMUP, start + WARMUP + duration)
+
+    results = multiprocessing.Queue()
+    procs = min(procs, clients)
+    shares = [rooms[i::procs] for i in range(procs)]
+    generators = [
+        multiprocessing.Process(target=botProcess, args=(port, share, seed + i, start, window, results), daemon=True)
+        for i, share in enumerate(shares)
+    ]
+    for generator in generators:
+        generator.start()
+
+    time.sleep(max(0.0, window[0] - time.perf_counter()))
+    relayBefore = sum(cpuSeconds(process.pid) for process in relay)
+    generatorBefore = {generator.pid: cpuSeconds(generator.pid) for generator in generators}
+    time.sleep(max(0.0, window[1] - time.perf_counter()))
+    relayCPU = sum(cpuSeconds(process.pid) for process in relay) - relayBefore
+    generatorCPU = max(cpuSeconds(pid) - before for pid, before in generatorBefore.items())
+
+    # * Results have to come off the queue before joining, a process with a big result waiting in the pipe never exits
+    collected = {}
+    deadline = window[1] + DRAIN + RESULT_TIMEOUT
+    try:
+        while len(collected) != len(generators):
+            try:
+                pid, result = results.get(timeout=0.5)
+                collected[pid] = result
+                continue
+            except queue.Empty:
+                pass
+            # ? A bot process that crashed is never going to put anything, no point waiting for it
+            crashed = [generator.pid for generator in generators if generator.exitcode not in (None, 0)]
+            if len(crashed) != 0:
+                raise RuntimeError(f"Bot process(es) {crashed} crashed, see their traceback above")
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"Bot processes didn't hand in their results within {RESULT_TIMEOUT:g}s of the run ending")
+    finally:
+        for generator in generators:
+            if generator.pid not in collected:
+                generator.terminate()
+            generator.join()
+        for process in relay:
+            process.terminate()
+            process.join()
+
+    expected = 0
+    received = 0
+    latencies = array.array("d")
+    for generator, share in zip(generators, shares):
+        result = collected[generator.pid]
+        expected += sum(probes * (roomSizes[room] - 1) for probes, room in zip(result["probes"], share))
+        received += result["received"]
+        latencies.frombytes(result["latencies"])
+    ordered = sorted(latencies)
+
+    sent = sum(sum(result["probes"]) for result in collected.values())
+    return {
+        "clients": clients,
+        "rooms": len(roomSizes),
+        "probesPerSecond": sent / duration,
+        "relayedPerSecond": received / duration,
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if len(ordered) != 0 else 0.0,
+        "loss": 1 - received / expected if expected != 0 else 0.0,
+        "relayCPU": relayCPU / duration,  # ? Cores the relay kept busy
+        "relayCPUPerClient": relayCPU / duration / clients * 1000,  # ? ms of relay CPU per second per client
+        "generatorCPU": generatorCPU / duration,  # ? Cores the busiest bot process kept busy
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load tests the UDP relay with simulated clients on loopback")
+    parser.add_argument("--clients", default=f"16,32,64,128,{MAX_CLIENTS - 1}", help="comma separated client counts to try")
+    parser.add_argument("--room-size", type=int, default=4, help="clients per room")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds measured per client count")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="relay worker processes")
+    parser.add_argument("--procs", type=int, default=max(1, os.cpu_count() // 2), help="bot processes")
+    parser.add_argument("--max-p99", type=float, default=50.0, help="p99 latency (ms) a client count still counts as carried at")
+    parser.add_argument("--max-loss", type=float, default=0.01, help="loss (0.01 = 1%%) a client count still counts as carried at")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the capacity curve to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/stat"):
+        sys.exit("Reading the relay's CPU time needs /proc (Linux)")
+
+    counts = [int(count) for count in args.clients.split(",")]
+    if max(counts) >= MAX_CLIENTS:
+        sys.exit(f"The relay only has room for {MAX_CLIENTS - 1} clients")
+
+    print(f"{args.workers} relay worker(s), {args.procs} bot process(es), rooms of {args.room_size}, {SEND_RATE} sends/s per client")
+    print(f"{'clients':>7} | {'probes/s':>8} | {'relayed/s':>9} | {'p50':>7} | {'p95':>7} | {'p99':>7} | {'loss':>6} | {'relay CPU':>9} | {'per client':>10} | {'bots CPU':>8}")
+
+    curve = []
+    capacity = 0
+    for clients in counts:
+        try:
+            result = runStep(clients, args.room_size, args.duration, args.workers, args.procs, args.seed)
+        except RuntimeError as e:
+            sys.exit(f"{clients} clients: {e}")
+        curve.append(result)
+        print(
+            f"{clients:>7} | {result['probesPerSecond']:>8.0f} | {result['relayedPerSecond']:>9.0f} | "
+            f"{result['p50']:>5.2f}ms | {result['p95']:>5.2f}ms | {result['p99']:>5.2f}ms | {result['loss'] * 100:>5.2f}% | "
+            f"{result['relayCPU'] * 100:>8.1f}% | {result['relayCPUPerClient']:>6.2f}ms/s | {result['generatorCPU'] * 100:>7.1f}%"
+        )
+        if result["p99"] <= args.max_p99 and result["loss"] <= args.max_loss:
+            capacity = max(capacity, clients)
+
+    print(f"Carried up to {capacity} clients with p99 under {args.max_p99:g}ms and loss under {args.max_loss * 100:g}%")
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump({"roomSize": args.room_size, "workers": args.workers, "procs": args.procs, "capacity": capacity, "curve": curve}, f, indent=2)
@@ -0,0 +1,89 @@
+# ? Launch time benchmarks, run from the repo root with:
+# ?   python -m benchmarks.startup [--runs 10] [--out results.json]
+# ? Starts main.py --startup over and over (from a scratch working directory, so that keeps working too) and reports
+# ? the median time from launching the process to the menu, to a ready headless game and to the first frame drawn,
+# ? then compares loading every sprite from the loose PNGs against the bundle (python assets.py builds it)
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import *
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from assets import BUNDLE_PATH, ROOT, AssetBundle, AssetManager, buildBundle
+
+MAIN = os.path.join(ROOT, "main.py")
+
+# ? name -> what gets typed into the menu, 9 isn't a mode so that launch quits right after showing the menu
+LAUNCHES = {
+    "menu": "9\n",
+    "headless": "2\n1\n",
+    "window": "0\n",
+}
+
+
+def launch(stdin: str, cwd: str) -> dict:
+    # ? ms from just before the process got started to every mark it reported, plus until it exited
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, MAIN, "--startup"], input=stdin, cwd=cwd, capture_output=True, text=True, env=os.environ)
+    end = time.perf_counter()
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py --startup failed:\n{result.stderr}")
+
+    marks = {}
+    for line in result.stderr.splitlines():
+        parts = line.split()
+        if len(parts) == 4 and parts[0] == "startup":
+            marks[parts[1]] = (float(parts[3]) - start) * 1000
+    marks["exit"] = (end - start) * 1000
+    return marks
+
+
+def launchScenario(stdin: str, runs: int, cwd: str) -> dict:
+    samples = [launch(stdin, cwd) for _ in range(runs)]
+    return {name: statistics.median(sample[name] for sample in samples) for name in samples[0].keys()}
+
+
+def spritesScenario(bundle: Optional[AssetBundle], runs: int) -> float:
+    # ? Median ms to load every sprite through a fresh AssetManager, from the loose PNGs when bundle is None
+    names = sorted(name for name in os.listdir(ROOT) if name.endswith(".png"))
+    samples = []
+    for _ in range(runs):
+        assets = AssetManager(bundle, useBundle=bundle is not None)
+        start = time.perf_counter()
+        for name in names:
+            assets.image(name)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks how long the game takes to start")
+    parser.add_argument("--runs", type=int, default=10, help="launches per scenario, the median gets reported")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {"bundle": os.path.exists(BUNDLE_PATH), "launches": {}, "sprites": {}}
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, stdin in LAUNCHES.items():
+            results["launches"][name] = launchScenario(stdin, args.runs, cwd)
+            print(f"{name:<10}" + "".join(f" | {mark} {ms:7.1f}ms" for mark, ms in results["launches"][name].items()))
+
+        path = os.path.join(cwd, "bench.bundle")
+        buildBundle(path)
+        bundle = AssetBundle(path)
+        results["sprites"]["loose"] = spritesScenario(None, args.runs * 10)
+        results["sprites"]["bundle"] = spritesScenario(bundle, args.runs * 10)
+        print(f"{'sprites':<10} | loose {results['sprites']['loose']:.3f}ms | bundle {results['sprites']['bundle']:.3f}ms")
+
+    if not results["bundle"]:
+        print("No bundle built, launches loaded the loose files (python assets.py builds one)")
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,318 @@
+# ? Hot path benchmarks for core, run from the repo root with:
+# ?   python -m benchmarks.suite [--out results.json] [--baseline baseline.json] [--threshold 0.15] [--quick]
+# ? Exits with 1 when --baseline is given and anything got slower than the threshold allows, so it can gate PRs
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from ai import AIDirector
+from core import *
+
+SCR_DIMENSIONS = (800, 800)
+DEATH_FRAMES = 72
+
+
+def spaceObject(pos, sprite, velocityQueue=None, wallMode=WALL_CLAMP, givenID="Bench", onCollision=lambda obj, target: None, onWallCollided=lambda obj: None):
+    return SpaceObject(
+        pos=pos,
+        scr=None,
+        sprite=sprite,
+        dead=sprite,
+        velocityQueue=[] if velocityQueue is None else velocityQueue,
+        maxVelStack=2,
+        maxVelSpeed=5,
+        onWallCollided=onWallCollided,
+        onCollision=onCollision,
+        givenID=givenID,
+        velocityFalloff=0.1,
+        wallMode=wallMode
+    )
+
+
+def makeGame(children, store):
+    return Game(None, children, DEATH_FRAMES, store=EntityStore(SCR_DIMENSIONS) if store else None)
+
+
+# ? Every scenario returns (setup, op), setup builds fresh state and returns it, op(state) is what gets timed
+
+def idleScenario(store):
+    def setup():
+        rng = random.Random(0)
+        sprite = pygame.Surface((32, 32))
+        return makeGame([spaceObject([rng.randint(0, 800), rng.randint(0, 800)], sprite, givenID=f"Player_{i}") for i in range(2)], store)
+    return setup, lambda game: game.tick()
+
+
+def bulletsScenario(store, count=1000):
+    # ? Bullets flying up from the bottom of the screen and dying (and getting recycled) at the top, like a long firefight
+    def setup():
+        rng = random.Random(0)
+        sprite = pygame.Surface((4, 8))
+        game = makeGame([], store)
+
+        def limitBullet(obj):  # ? Same as GenericController.limitBullet
+            if (obj.pos[0] <= 0 or obj.pos[0] >= SCR_DIMENSIONS[0]) or (obj.pos[1] <= 0 or obj.pos[1] >= SCR_DIMENSIONS[1]):
+                game.kill(obj)
+
+        game.pool = Pool(lambda pos, velocityQueue: spaceObject(pos, sprite, velocityQueue, WALL_KILL, "Bullet", onWallCollided=limitBullet))
+        for _ in range(count):
+            game.summon(game.pool.acquire([rng.randint(1, 799), rng.randint(1, 799)], [Velocity(0, -4, 0, True, 6)]))
+        game.rng = rng
+        return game
+
+    def op(game):
+        # ? Keeps the population steady by firing a new bullet for every one that left the screen
+        for _ in range(count - len(game.children) - len(game.spawnQueue)):
+            game.summon(game.pool.acquire([game.rng.randint(1, 799), 799], [Velocity(0, -4, 0, True, 6)]))
+        game.tick()
+    return setup, op
+
+
+def massDeathScenario(store, count=1000):
+    # ? Everything gets killed at once, the timed ticks cover the kill, the death animation and the cleanup
+    def setup():
+        rng = random.Random(0)
+        sprite = pygame.Surface((8, 8))
+        game = makeGame([spaceObject([rng.randint(0, 800), rng.randint(0, 800)], sprite, givenID=f"Enemy_{i}") for i in range(count)], store)
+        game.tick()
+        return game
+
+    def op(game):
+        if game.frame % (DEATH_FRAMES + 2) == 1:
+            if len(game.children) == 0:  # ? Refill once the last batch is gone so every run kills the same amount
+                sprite = pygame.Surface((8, 8))
+                for i in range(count):
+                    game.summon(spaceObject([(i * 37) % 800, (i * 91) % 800], sprite, givenID=f"Enemy_{i}"))
+            else:
+                game.kill(*game.children)
+        game.tick()
+    return setup, op
+
+
+def opponentsScenario(store, count=200):
+    # ? Lots of players steering around with impulses, which is what a full server looks like
+    def setup():
+        rng = random.Random(0)
+        sprite = pygame.Surface((32, 32))
+        game = makeGame([spaceObject([rng.randint(0, 800), rng.randint(0, 800)], sprite, givenID=f"Player_{i}") for i in range(count)], store)
+        game.rng = rng
+        game.impulses = Pool(Velocity)
+        return game
+
+    def op(game):
+        for child in game.children:
+            child.addForce(game.impulses.acquire(game.rng.uniform(-1.4, 1.4), game.rng.uniform(-1.4, 1.4), 0.7, False, 5))
+        game.tick()
+    return setup, op
+
+
+def aiScenario(count=500):
+    # ? Every agent updated every step (no budget, no level of detail), so this is the worst case a wave can cost
+    def setup():
+        rng = random.Random(0)
+        sprite = pygame.Surface((32, 32))
+        game = makeGame([spaceObject([rng.randint(0, 800), rng.randint(0, 800)], sprite, givenID="Enemy") for i in range(count)], False)
+        target = spaceObject([400, 400], sprite, givenID="Player")
+        director = AIDirector(SCR_DIMENSIONS, Pool(Velocity), lambda obj, dx, dy: None, rng, budget=float("inf"))
+        for child in game.children:
+            director.add(child, 0)
+        game.tick()
+        return game, director, target
+
+    def op(state):
+        game, director, target = state
+        for agent in director.agents:
+            agent.nextUpdate = 0
+        director.update(game.frame, target, game.broadphase)
+    return setup, op
+
+
+def velocityApplyScenario():
+    def setup():
+        return Velocity(3, -3, 0.1, False, 5)
+
+    def op(vel):
+        vel.apply((100, 100))
+        if vel.finished:
+            vel.reset(3, -3, 0.1, False, 5)
+    return setup, op
+
+
+def objectTickScenario():
+    def setup():
+        obj = spaceObject([400, 400], pygame.Surface((32, 32)))
+        return obj, [obj]
+
+    def op(state):
+        obj, objs = state
+        if len(obj.forces) == 0:
+            obj.addForce(Velocity(1, 1, 0.1, False, 5))
+        obj.tick(objs)
+    return setup, op
+
+
+def spaceObjectCodecScenario():
+    def setup():
+        sprite = pygame.Surface((32, 32))
+        return spaceObject([123, 456], sprite), sprite
+
+    def op(state):
+        obj, sprite = state
+        spaceObjectFromBytes(obj.toBytes(), None, sprite, sprite, None, None, "Decoded", WALL_CLAMP)
+    return setup, op
+
+
+def velocityCodecScenario():
+    def setup():
+        return Velocity(1.5, -2.5, 0.1, False, 5)
+
+    def op(vel):
+        velocityFromBytes(vel.toBytes())
+    return setup, op
+
+
+def scenarios():
+    # ? (name, unit, ops per run, (setup, op))
+    found = [
+        ("Velocity.apply", "op", 100000, velocityApplyScenario()),
+        ("SpaceObject.tick", "op", 50000, objectTickScenario()),
+        ("SpaceObject.toBytes+spaceObjectFromBytes", "op", 20000, spaceObjectCodecScenario()),
+        ("Velocity.toBytes+velocityFromBytes", "op", 50000, velocityCodecScenario()),
+        ("AIDirector.update/agents_500", "step", 300, aiScenario()),
+    ]
+    for store in ([False, True] if EntityStore.available else [False]):
+        suffix = "[store]" if store else ""
+        found += [
+            (f"Game.tick/idle{suffix}", "tick", 5000, idleScenario(store)),
+            (f"Game.tick/bullets_1000{suffix}", "tick", 200, bulletsScenario(store)),
+            (f"Game.tick/mass_death_1000{suffix}", "tick", 300, massDeathScenario(store)),
+            (f"Game.tick/opponents_200{suffix}", "tick", 300, opponentsScenario(store)),
+        ]
+    return found
+
+
+def measure(setup, op, ops, repeat):
+    # ? Timing is the best of several runs, memory gets its own run since tracemalloc slows everything down
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter_ns()
+        for _ in range(ops):
+            op(state)
+        best = min(best, time.perf_counter_ns() - start)
+
+    # * Blocks per op is how many more objects are alive afterwards, so it catches leaks and growing caches,
+    # * not temporaries that get freed again
+    state = setup()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    for _ in range(ops):
+        op(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+
+    nsPerOp = best / ops
+    return {
+        "nsPerOp": nsPerOp,
+        "perSec": 1e9 / nsPerOp,
+        "blocksPerOp": blocks / ops,
+        "peakBytes": peak,
+    }
+
+
+def footprint(count=1000):
+    # ? Bytes each object costs on its own, sprites are shared between objects so they're left out
+    sprite = pygame.Surface((8, 8))
+    found = {}
+    for name, make in [
+        ("SpaceObject", lambda i: spaceObject([i, i], sprite, [Velocity(1, 1, 0.1, False, 5)])),
+        ("Velocity", lambda i: Velocity(i, i, 0.1, False, 5)),
+    ]:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objs = [make(i) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        found[name] = (after - before - sys.getsizeof(objs)) / count
+        del objs
+    return found
+
+
+def compare(results, baseline, threshold):  # ? Returns the names of everything that got slower by more than threshold
+    regressions = []
+    print(f"\n{'benchmark':>44} | {'baseline ns':>12} | {'current ns':>12} | {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = result["nsPerOp"] / base["nsPerOp"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " REGRESSION"
+        print(f"{name:>44} | {base['nsPerOp']:>12.0f} | {result['nsPerOp']:>12.0f} | {change * 100:>+7.1f}%{flag}")
+    return regressions
+
+
+def run(out=None, baselinePath=None, threshold=0.15, quick=False):
+    repeat = 1 if quick else 5
+    results = {}
+    print(f"{'benchmark':>44} | {'ns/op':>12} | {'per sec':>12} | {'blocks/op':>9} | {'peak KiB':>9}")
+    for name, unit, ops, (setup, op) in scenarios():
+        if quick:
+            ops = max(1, ops // 10)
+        result = measure(setup, op, ops, repeat)
+        result["unit"] = unit
+        results[name] = result
+        print(f"{name:>44} | {result['nsPerOp']:>12.0f} | {result['perSec']:>12.0f} | {result['blocksPerOp']:>9.3f} | {result['peakBytes'] / 1024:>9.1f}")
+
+    sizes = footprint()
+    print()
+    for name, size in sizes.items():
+        print(f"{name:>44} | {size:>12.0f} bytes each")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": EntityStore.available,
+        "results": results,
+        "footprint": sizes,
+    }
+    if out is not None:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baselinePath is not None:
+        with open(baselinePath, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, threshold)
+        if len(regressions) != 0:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {threshold * 100:.0f}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the core simulation hot paths")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown (0.15 = 15%%) that counts as a regression")
+    parser.add_argument("--quick", action="store_true", help="a tenth of the ops and no repeats, for a quick sanity check")
+    args = parser.parse_args()
+    sys.exit(run(args.out, args.baseline, args.threshold, args.quick))
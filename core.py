@@ -1,61 +1,169 @@
+import heapq
+import math
 import struct
-import types
+import time
 from typing import *
 
 import pygame
 
+from profiler import Profiler
+
+try:
+    import numpy
+except ImportError:  # ? NumPy is optional, only EntityStore needs it
+    numpy = None
+
 # * Tuple[int, int] and List[int] will both usually refer to position
 # * The reason there are two types used is since Tuple is immutable and
 # * Sometimes that proves a problem when updating position so List[int]
 # * is used instead
 
+# ? Wall modes tell an EntityStore how it can handle an object hitting the edge of the screen
+# ? WALL_CALLBACK: onWallCollided gets called every tick, same as without a store
+# ? WALL_CLAMP: position is clamped inside the bounds by the store, onWallCollided is never called
+# ? WALL_KILL: onWallCollided only gets called on ticks where the object is touching/past the bounds
+WALL_CALLBACK = 0
+WALL_CLAMP = 1
+WALL_KILL = 2
+
+# ? Packets sent by an authoritative server (rather than relayed from another client) use this index
+# ? Packet Type 2: World Snapshot (see netcode.py), Packet Type 3: Welcome (tells a client which index it was given)
+SERVER_INDEX = 255
+
+# ? Precompiled so the codecs don't have to parse the format string every call
+VELOCITY_STRUCT = struct.Struct("!ffff?")
+SPACE_OBJECT_STRUCT = struct.Struct("!IIIIf")
+
+# ? How far (relative) Velocity.limit lets a value past its limit, a 32 bit float is off by at most ~6e-8
+LIMIT_SLACK = 1e-6
+
+
+class MaskCache:
+    # ? Pixel masks for the optional pixel perfect narrowphase (see Game), built once per sprite the first
+    # ? time it's in a collision and shared by every object using that sprite from then on
+    def __init__(self):
+        self.masks: Dict[int, Tuple[pygame.Surface, pygame.mask.Mask]] = {}  # ? id(surface) -> (surface, mask), the surface keeps its id from being reused
+
+    def get(self, surface: pygame.Surface) -> pygame.mask.Mask:
+        entry = self.masks.get(id(surface))
+        if entry is None:
+            entry = self.masks[id(surface)] = (surface, pygame.mask.from_surface(surface))
+        return entry[1]
+
+    def prepare(self, surfaces):  # ? Builds the masks up front, so the first collision of a sprite doesn't pay for it
+        for surface in surfaces:
+            self.get(surface)
+
+
+class SpatialHash:
+    # ? Uniform grid broadphase, every object's rect gets bucketed into each cell it touches
+    # ? so only objects sharing a cell ever reach the proper overlap test
+    def __init__(self, cellSize: int):
+        self.cellSize = cellSize
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def rebuild(self, objs: List["SpaceObject"], skip: Collection["SpaceObject"] = ()):
+        # ? skip is whatever shouldn't collide this tick even though it isn't dead yet (see Game.collide)
+        self.cells.clear()
+        size = self.cellSize
+        for i, obj in enumerate(objs):
+            if obj.isDead or obj in skip:  # ? Corpses are only for show, they shouldn't keep killing things
+                continue
+            rect = obj.rect
+            # * right and bottom are one past the last pixel, an empty rect ends up in no cell (it can't overlap anything anyway)
+            for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+                for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                    bucket = self.cells.get((cx, cy))
+                    if bucket is None:
+                        self.cells[(cx, cy)] = [i]
+                    else:
+                        bucket.append(i)
+
+    def pairs(self, objs: List["SpaceObject"], masks: Optional[MaskCache] = None) -> List[Tuple["SpaceObject", "SpaceObject"]]:
+        # ? Each object's rect gets tested against the rest of its cell in one collidelistall() call, so the
+        # ? overlap tests run in C and only actual hits come back to Python. With masks, hits then also have
+        # ? to share an opaque pixel
+        # * Indices are appended in ascending order so (i, j) always has i < j, which means
+        # * a pair spanning several shared cells can be deduplicated with a single set lookup
+        seen = set()
+        result = []
+        for bucket in self.cells.values():
+            count = len(bucket)
+            if count < 2:
+                continue
+            rects = [objs[i].rect for i in bucket]
+            for a in range(count - 1):
+                i = bucket[a]
+                group = objs[i].group
+                for b in rects[a].collidelistall(rects[a + 1:]):
+                    j = bucket[a + 1 + b]
+                    if group != 0 and objs[j].group == group:  # ? Same team, see SpaceObject.group
+                        continue
+                    if (i, j) in seen:
+                        continue
+                    seen.add((i, j))
+                    if masks is not None:
+                        rectA = rects[a]
+                        rectB = objs[j].rect
+                        if masks.get(objs[i].active).overlap(masks.get(objs[j].active), (rectB.x - rectA.x, rectB.y - rectA.y)) is None:
+                            continue
+                    result.append((objs[i], objs[j]))
+        return result
 
-class CollisionBox:
-    def __init__(self, top_left: List[int], dimensions: List[int]):
-        self.top_left = top_left
-        self.dimensions = dimensions
-        self.bottom_right = [
-            self.top_left[0] + self.dimensions[0],
-            self.top_left[1] + self.dimensions[1]
-        ]
 
-    def inside(self, pos: Tuple[int, int]) -> bool:
-        if (pos[0] <= self.bottom_right[0] and pos[0] >= self.top_left[0]) and (pos[1] >= self.top_left[1] and pos[1] <= self.bottom_right[1]):
-            return True
-        return False
+class Velocity:
+    __slots__ = ("x", "y", "maxSpeed", "_falloff", "finished", "persistent", "pool", "pooled")
 
-    def update(self, top_left: Tuple[int, int]):
-        self.top_left = top_left
-        self.bottom_right = [
-            self.top_left[0] + self.dimensions[0],
-            self.top_left[1] + self.dimensions[1]
-        ]
+    def __init__(self, x: int, y: int, falloff: float, persistent: bool, maxSpeed: float):
+        self.reset(x, y, falloff, persistent, maxSpeed)
 
+        # ? Set by Pool.acquire(), spent velocities get handed back to their pool
+        self.pool = None
+        self.pooled = False
 
-class Velocity:
-    def __init__(self, x: int, y: int, falloff: float, persistent: bool, maxSpeed: float):
+    def reset(self, x: int, y: int, falloff: float, persistent: bool, maxSpeed: float):
         self.x = x
         self.y = y
         self.maxSpeed = maxSpeed
-        self._falloff = falloff  # ? Falloff is immutable
+        self._falloff = falloff  # ? Falloff is immutable (outside of being recycled by a pool)
         self.finished = False
         # ? Persistency defines whether or not a velocity should finish
         self.persistent = persistent
 
-    def apply(self, pos: Tuple[int, int]) -> Tuple[int, int]:
+    def active(self) -> bool:  # ? Whether applying this velocity would do anything, flags it as finished once it's run out
         if self.persistent == True:
-            return self.applyLogic(pos)
+            return True
 
         if self.finished == False:
             if int(self.x) == 0 and int(self.y) == 0:
                 self.finished = True
             else:
-                return self.applyLogic(pos)
+                return True
+        return False
+
+    def apply(self, pos: Tuple[int, int]) -> Tuple[int, int]:
+        if self.active():
+            return self.applyLogic(pos)
         return (pos[0], pos[1])
 
+    def applyTo(self, target: List[float]):  # ? Same as apply() but adds onto target in place instead of building a new tuple
+        if self.active():
+            target[0] += self.x
+            target[1] += self.y
+            self.falloff()
+
+    def applyToVelocity(self, target: "Velocity"):  # ? applyTo() for when the target is another velocity
+        if self.active():
+            target.x += self.x
+            target.y += self.y
+            self.falloff()
+
     def applyLogic(self, pos: Tuple[int, int]) -> Tuple[int, int]:
         result = (pos[0] + self.x, pos[1] + self.y)
+        self.falloff()
+        return result
 
+    def falloff(self):
         # * Note to self: Don't try to shrink this code since that ain't gonna happen
         # * The reason why there must be similar code in different clauses is because if
         # * the velocity was initialized positive, then MIN value of clamping is different
@@ -84,8 +192,6 @@ class Velocity:
             self.y -= self._falloff
             self.y = clamp(self.y, 0, self.maxSpeed)
 
-        return result
-
     def __str__(self):
         return f"[{round(self.x, 1)}|{round(self.y, 1)}]"
 
@@ -96,18 +202,101 @@ class Velocity:
         self.x = inp[0]
         self.y = inp[1]
 
+    def limit(self, maxSize: float = math.inf, minFalloff: float = 0.0, maxSpeed: float = math.inf) -> bool:
+        # ? Reins in a velocity that came from somewhere untrusted (the network) to what the game itself could have made,
+        # ? returns False when it's not usable at all
+        # * Limits only kick in past LIMIT_SLACK since anything that went over the network got rounded to 32 bit floats
+        if not (math.isfinite(self.x) and math.isfinite(self.y) and math.isfinite(self.maxSpeed) and math.isfinite(self._falloff)):
+            return False
+        size = math.hypot(self.x, self.y)
+        if size > maxSize * (1 + LIMIT_SLACK):
+            self.x *= maxSize / size
+            self.y *= maxSize / size
+        if self._falloff < minFalloff * (1 - LIMIT_SLACK):  # ? A tiny (or negative) falloff would keep it pushing forever
+            self._falloff = minFalloff
+        self.maxSpeed = clamp(self.maxSpeed, 0, maxSpeed)
+        self.persistent = False
+        return True
+
     def toBytes(self) -> bytes:
         # ? Velocity as Bytes Protocol Description:
         # ? Buffer size: 17 Bytes
         # ? [4 Bytes (float) X] | [4 Bytes (float) Y] | [4 Bytes (float) maxSpeed] | [4 Bytes (float) falloff] | [1 Byte (Bool) persistency]
-        return struct.pack("!ffff?", self.x, self.y, self.maxSpeed, self._falloff, self.persistent)
+        return VELOCITY_STRUCT.pack(self.x, self.y, self.maxSpeed, self._falloff, self.persistent)
+
+
+class ForceAccumulator:
+    # ? Fixed capacity ring buffer of the impulses waiting to act on an object, only the oldest one
+    # ? acts at a time and it gets popped once it's run out, so nothing shifts around in a list
+    __slots__ = ("capacity", "buffer", "head", "count", "dropped")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer: List[Optional[Velocity]] = [None] * capacity
+        self.head = 0
+        self.count = 0
+        self.dropped = 0  # ? Impulses turned away because the buffer was full
+
+    def push(self, vel: Velocity) -> bool:  # ? False when full, the caller decides what happens to vel
+        if self.count == self.capacity:
+            self.dropped += 1
+            return False
+        self.buffer[(self.head + self.count) % self.capacity] = vel
+        self.count += 1
+        return True
+
+    def peek(self) -> Optional[Velocity]:
+        if self.count == 0:
+            return None
+        return self.buffer[self.head]
+
+    def pop(self) -> Velocity:
+        vel = self.buffer[self.head]
+        self.buffer[self.head] = None
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        return vel
+
+    def clear(self):  # ? Hands every waiting impulse back to its pool
+        while self.count != 0:
+            release(self.pop())
+        self.head = 0
+
+    def full(self) -> bool:
+        return self.count == self.capacity
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):  # ? Oldest first
+        for i in range(self.count):
+            yield self.buffer[(self.head + i) % self.capacity]
 
 
 class SpaceObject:
-    def __init__(self, pos: List[int], scr: pygame.display, sprite: pygame.Surface, dead: pygame.Surface, velocityQueue: List[Velocity], maxVelStack: int, maxVelSpeed: int, onWallCollided, onCollision, givenID: str, velocityFalloff: float):
+    # * Slotted since there can be thousands of these (mostly bullets), which keeps each one
+    # * a lot smaller than a __dict__ would and means a typo'd attribute fails instead of sticking around
+    __slots__ = (
+        "id", "isDead", "store", "row", "wallMode", "slot", "onWallCollided", "onCollision", "_pos",
+        "velocityFalloff", "maxVelSpeed", "velocity", "forces", "screen", "sprite", "dead", "active",
+        "dimensions", "rect", "pool", "pooled", "group"
+    )
+
+    def __init__(self, pos: List[int], scr: pygame.display, sprite: pygame.Surface, dead: pygame.Surface, velocityQueue: List[Velocity], maxVelStack: int, maxVelSpeed: int, onWallCollided, onCollision, givenID: str, velocityFalloff: float, wallMode: int = WALL_CALLBACK):
         self.id = givenID
         self.isDead = False
 
+        # ? Set by EntityStore.attach(), while attached pos is a view onto the store's row
+        self.store = None
+        self.row = -1
+        self.wallMode = wallMode
+
+        self.slot = -1  # ? Index in Game.children, kept up to date by the Game it belongs to
+
+        # ? Objects sharing a non zero group never get tested against each other, for crowds (like a wave
+        # ? of enemies) that couldn't hurt each other anyway, group 0 collides with everything
+        self.group = 0
+
         self.onWallCollided = onWallCollided
         self.onCollision = onCollision
 
@@ -115,8 +304,11 @@ class SpaceObject:
         self.velocityFalloff = velocityFalloff
         self.maxVelSpeed = maxVelSpeed
         self.velocity = Velocity(0, 0, velocityFalloff, True, maxVelSpeed)
-        self.maxVelocityStack = maxVelStack
-        self.velocityQueue = velocityQueue
+
+        # ? velocityQueue is just the impulses the object starts out with, maxVelStack is how many can be waiting at once
+        self.forces = ForceAccumulator(maxVelStack)
+        for vel in velocityQueue:
+            self.addForce(vel)
 
         self.screen = scr
 
@@ -125,101 +317,414 @@ class SpaceObject:
 
         self.active = self.sprite
 
+        # ? What collisions get tested with, kept on the same whole pixels the sprite gets drawn at
         self.dimensions = self.sprite.get_rect().size
-        self.collisionBox = CollisionBox(self.pos, self.dimensions)
+        self.rect = pygame.Rect(int(self.pos[0]), int(self.pos[1]), self.dimensions[0], self.dimensions[1])
+
+        # ? Set by Pool.acquire(), dead objects get handed back to their pool once they're cleaned up
+        self.pool = None
+        self.pooled = False
+
+    def reset(self, pos: List[int], velocityQueue: List[Velocity]):  # ? Brings a recycled object back to life in a new spot
+        self.isDead = False
+        self.active = self.sprite
+
+        self.forces.clear()
+        for vel in velocityQueue:
+            self.addForce(vel)
+
+        self.pos = pos
+        self.velocity.x = 0
+        self.velocity.y = 0
+        self.rect.topleft = (int(pos[0]), int(pos[1]))
+
+    @property
+    def pos(self):
+        if self.store is not None:
+            return self.store.pos[self.row]
+        return self._pos
+
+    @pos.setter
+    def pos(self, value):
+        if self.store is not None:
+            self.store.pos[self.row] = value
+        else:
+            self._pos = value
+
+    @property
+    def maxVelocityStack(self) -> int:
+        return self.forces.capacity
 
     def die(self):
         self.active = self.dead
         self.isDead = True
 
-        # * I'll admit, this is a bit of a "hacky" solution but
-        # * it achieves what I want cleanly in one line and that's
-        # * really all I care about
-        self.tick = types.MethodType(self.deathTick, self)
+        if self.store is not None:
+            self.store.kill(self.row)
 
-    def addForce(self, vel: Velocity, callback = lambda vel : None):
-        if len(self.velocityQueue) != self.maxVelocityStack:
-            self.velocityQueue.append(vel)
+    def addForce(self, vel: Velocity, callback = lambda vel : None) -> bool:  # ? Returns False (and releases vel) if there was no room for it
+        if self.forces.push(vel):
             callback(vel)
+            return True
+        release(vel)
+        return False
 
-    def deathTick(self, s1, objs):  # ? Empty tick function, only renders dead sprite to screen
-        # ? These two other arguments aren't used although I'm assuming s1 refers to 'self' and 'objs' refers to the attribute children of the game instance
-        self.screen.blit(self.active, self.pos)
+    def tickForces(self):  # ? Feeds the oldest waiting impulse into the object's own velocity
+        head = self.forces.peek()
+        if head is not None:
+            if self.store is None:
+                head.applyToVelocity(self.velocity)
+            else:
+                head.applyTo(self.store.vel[self.row])
+            if head.finished == True:
+                release(self.forces.pop())
 
     def tick(self, objs):
-        if len(self.velocityQueue) != 0:
-            self.velocity.fromTuple(
-                self.velocityQueue[0].apply(self.velocity.asTuple()))
-            if self.velocityQueue[0].finished == True:
-                self.velocityQueue.pop(0)
-
-        self.pos = list(self.velocity.apply(self.pos))
+        if self.isDead:  # ? Dead objects don't move, the dead sprite still gets drawn by the Renderer
+            return
 
-        self.onWallCollided(self)
+        # ? Objects attached to a store get their forces, movement and walls handled in bulk by Game.tick
+        if self.store is None:
+            self.tickForces()
 
-        self.collisionBox.update(self.pos)
+            self.velocity.applyTo(self._pos)
 
-        # * This collision detection method is very inefficient, however I don't have any better methods so it's just gonna stay here
-        for obj in objs:
-            if obj != self:
-                if obj.collisionBox.inside(tuple(self.pos)) or \
-                        obj.collisionBox.inside(tuple(self.collisionBox.bottom_right)) or \
-                        obj.collisionBox.inside((self.collisionBox.top_left[0], self.collisionBox.bottom_right[1])) or \
-                        obj.collisionBox.inside((self.collisionBox.bottom_right[0], self.collisionBox.top_left[1])):
+            self.onWallCollided(self)
 
-                    self.onCollision(self, obj)
+        pos = self.pos
+        self.rect.topleft = (int(pos[0]), int(pos[1]))
 
-        self.screen.blit(self.active, self.pos)
+        # ? Collision detection happens in Game.collide() once everything has moved
 
     def toBytes(self):
         # ? SpaceObject as Bytes Protocol Description:
         # ? Buffer size: 20 Bytes
         # ? [4 Bytes (int) X] | [4 Bytes (int) Y] | [4 Bytes (int) maxVelStack] | [4 Bytes (int) maxVelSpeed] | [4 Bytes (float) velocityFalloff]
-        return struct.pack("!IIIIf", self.pos[0], self.pos[1], self.maxVelocityStack, self.maxVelSpeed, self.velocityFalloff)
+        return SPACE_OBJECT_STRUCT.pack(int(self.pos[0]), int(self.pos[1]), self.maxVelocityStack, self.maxVelSpeed, self.velocityFalloff)
+
+
+class EntityStore:
+    # ? Struct of arrays holding the physics state of every attached SpaceObject so Game.tick
+    # ? can integrate, apply falloff, clamp and check walls for the whole population in one go
+    available = numpy is not None
+
+    def __init__(self, bounds: Tuple[int, int], capacity: int = 256):
+        if numpy is None:
+            raise ImportError("EntityStore requires numpy")
+
+        self.bounds = numpy.array(bounds, dtype=numpy.float64)
+        self.owners: List[Optional[SpaceObject]] = []
+        self.free: List[int] = []
+        self.capacity = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        # * Grows every array to the new capacity, rows that already exist keep their values
+        def grow(old, shape, dtype):
+            new = numpy.zeros(shape, dtype=dtype)
+            if old is not None:
+                new[:len(old)] = old
+            return new
+
+        first = self.capacity == 0
+        self.pos = grow(None if first else self.pos, (capacity, 2), numpy.float64)
+        self.vel = grow(None if first else self.vel, (capacity, 2), numpy.float64)
+        self.falloff = grow(None if first else self.falloff, (capacity, 1), numpy.float64)
+        self.maxSpeed = grow(None if first else self.maxSpeed, (capacity, 1), numpy.float64)
+        self.alive = grow(None if first else self.alive, capacity, numpy.bool_)
+        self.wallMode = grow(None if first else self.wallMode, capacity, numpy.int8)
+
+        # ? Scratch buffers so a step doesn't allocate temporaries
+        self._sign = numpy.zeros((capacity, 2), dtype=numpy.float64)
+        self._speed = numpy.zeros((capacity, 2), dtype=numpy.float64)
+        self._outside = numpy.zeros((capacity, 2), dtype=numpy.bool_)
+
+        self.free.extend(reversed(range(self.capacity, capacity)))
+        self.owners.extend([None] * (capacity - self.capacity))
+        self.capacity = capacity
+
+    def attach(self, obj: SpaceObject):
+        if obj.store is not None:
+            return
+        if len(self.free) == 0:
+            self._allocate(self.capacity * 2)
+
+        row = self.free.pop()
+        self.pos[row] = obj._pos
+        self.vel[row] = obj.velocity.asTuple()
+        self.falloff[row] = obj.velocityFalloff
+        self.maxSpeed[row] = obj.maxVelSpeed
+        self.alive[row] = not obj.isDead
+        self.wallMode[row] = obj.wallMode
+        self.owners[row] = obj
+
+        obj.store = self
+        obj.row = row
+
+    def detach(self, obj: SpaceObject):
+        if obj.store is not self:
+            return
+        row = obj.row
+
+        # ? Hand the state back to the object so it's still usable on its own
+        obj._pos = [float(self.pos[row][0]), float(self.pos[row][1])]
+        obj.velocity.fromTuple((float(self.vel[row][0]), float(self.vel[row][1])))
+        obj.store = None
+        obj.row = -1
+
+        self.kill(row)
+        self.owners[row] = None
+        self.free.append(row)
+
+    def kill(self, row: int):  # ? Dead rows stop moving, same as SpaceObject.deathTick
+        self.alive[row] = False
+        self.vel[row] = 0
+
+    def step(self) -> List[SpaceObject]:
+        # ? Integrates every row and returns the objects whose onWallCollided still has to be called
+        # * Dead and free rows always have zero velocity so they can go through the maths untouched
+        numpy.add(self.pos, self.vel, out=self.pos)
+
+        # * Same as Velocity.applyLogic: take the falloff off the magnitude, never let it cross 0
+        # * and never let it go past maxSpeed, then put the sign back on
+        numpy.sign(self.vel, out=self._sign)
+        numpy.multiply(self.vel, self._sign, out=self._speed)
+        numpy.subtract(self._speed, self.falloff, out=self._speed)
+        numpy.clip(self._speed, 0, self.maxSpeed, out=self._speed)
+        numpy.multiply(self._speed, self._sign, out=self.vel)
+
+        clamped = self.alive & (self.wallMode == WALL_CLAMP)
+        numpy.clip(self.pos, 0, self.bounds, out=self.pos, where=clamped[:, None])
+
+        # ? Same check as limitBullet
+        numpy.less_equal(self.pos, 0, out=self._outside)
+        self._outside |= self.pos >= self.bounds
+        walled = self.alive & (self.wallMode == WALL_CALLBACK)
+        walled |= self.alive & (self.wallMode == WALL_KILL) & self._outside.any(axis=1)
+
+        return [self.owners[row] for row in numpy.flatnonzero(walled)]
+
+
+class Scheduler:
+    # ? Min-heap of deferred events keyed on the frame they should run on, used for death cleanup
+    # ? but it works just as well for respawns or timed effects
+    def __init__(self):
+        self.events = []
+        self.count = 0  # ? Tie breaker so events scheduled for the same frame run in the order they were added
+
+    def schedule(self, frame: int, callback, *args) -> list:  # ? The returned event can be passed to cancel()
+        event = [frame, self.count, callback, args]
+        self.count += 1
+        heapq.heappush(self.events, event)
+        return event
+
+    def cancel(self, event: list):  # ? Cancelled events stay in the heap and just get skipped once they're due
+        event[2] = None
+
+    def run(self, frame: int):
+        while len(self.events) != 0 and self.events[0][0] <= frame:
+            _, _, callback, args = heapq.heappop(self.events)
+            if callback is not None:
+                callback(*args)
+
+    def __len__(self):
+        return len(self.events)
 
 
 class Game:
-    def __init__(self, screen: pygame.display, children: List[SpaceObject], deathDuration: int):
+    def __init__(self, screen: pygame.display, children: List[SpaceObject], deathDuration: int, cellSize: int = 64, store: Optional[EntityStore] = None, profiler: Optional[Profiler] = None, masks: Optional[MaskCache] = None):
         self.screen = screen
         self.children = children
-        self.deathDuration = deathDuration
-        self.deathCleanup = {}
+        self.deathDuration = int(deathDuration)
         self.frame = 0
+        self.broadphase = SpatialHash(cellSize)
+        self.scheduler = Scheduler()
+        self.masks = masks  # ? Pixel perfect collisions when set, rects overlapping is enough otherwise
+
+        # * Spawns and kills get queued up and only applied between ticks so nothing changes
+        # * children while it's being iterated (and so neither of them has to run a whole extra tick)
+        self.spawnQueue: List[SpaceObject] = []
+        self.killQueue: List[SpaceObject] = []
+
+        # ? Disabled unless a controller hands over its own, the collision pass is timed as its own phase
+        self.profiler = profiler if profiler is not None else Profiler()
+
+        self.store = store
+        for i, child in enumerate(self.children):
+            child.slot = i
+            if self.store is not None:
+                self.store.attach(child)
+
+    def summon(self, obj: SpaceObject):  # ? Spawning method for spawning space objects, they show up on the next tick
+        self.spawnQueue.append(obj)
+
+    def kill(self, *args: SpaceObject):  # ? Kill method for killing space objects, they die at the end of the current tick
+        self.killQueue.extend(args)
+
+    def after(self, frames: int, callback, *args) -> list:  # ? Runs callback(*args) the given amount of frames from now
+        return self.scheduler.schedule(self.frame + frames, callback, *args)
+
+    def remove(self, obj: SpaceObject):
+        # * Swap remove, the last child takes the removed one's slot so removal is O(1)
+        # * at the cost of children not staying in the order they were spawned in
+        slot = obj.slot
+        if slot < 0 or slot >= len(self.children) or self.children[slot] is not obj:
+            return
+        last = self.children.pop()
+        if last is not obj:
+            self.children[slot] = last
+            last.slot = slot
+        obj.slot = -1
+
+        if obj.store is not None:
+            obj.store.detach(obj)
+        release(obj)
+
+    def flush(self):  # ? Applies every queued spawn and kill
+        for obj in self.spawnQueue:
+            obj.slot = len(self.children)
+            self.children.append(obj)
+            if self.store is not None:
+                self.store.attach(obj)
+        self.spawnQueue.clear()
+
+        for obj in self.killQueue:
+            if obj.isDead == False:  # ? Killing something twice (ex. hit by two bullets at once) shouldn't schedule it twice
+                obj.die()
+                self.after(self.deathDuration, self.remove, obj)
+        self.killQueue.clear()
+
+    def tick(self):  # ? Called every frame, this is what makes the game's "time" progress (but doesn't draw anything, see render.Renderer)
+        self.flush()
+
+        if self.store is not None:
+            for child in self.children:
+                if child.store is not None and child.isDead == False:
+                    child.tickForces()
+            for obj in self.store.step():
+                obj.onWallCollided(obj)
 
-    def summon(self, obj: SpaceObject):  # ? Spawning method for spawning space objects
-        self.children.append(obj)
-        self.tick()
-
-    def kill(self, *args: SpaceObject):  # ? Kill method for killing space objects
-        self.deathCleanup[self.frame + self.deathDuration] = args
-        for obj in args:
-            obj.die()
-        self.tick()
-
-    def tick(self):  # ? Called every frame, you can imagine it is what displays stuff onto the screen and also what makes the game's "time" progress
         for child in self.children:
             child.tick(self.children)
 
-        if self.frame in self.deathCleanup.keys():
-            for obj in self.deathCleanup[self.frame]:
-                try:
-                    self.children.remove(obj)
-                except:
-                    pass
+        with self.profiler.scope("collision"):
+            self.collide()
+        self.flush()
+
+        self.scheduler.run(self.frame)
         self.frame += 1
 
+    def collide(self):
+        # * Pairs are collected before any callback runs, kill() only queues so killing inside
+        # * onCollision is safe, each overlapping pair only gets reported once per tick (to the first object's callback)
+        # ? Objects already queued to die this tick (ex. a bullet that just left the screen) sit the pass out
+        self.broadphase.rebuild(self.children, set(self.killQueue) if len(self.killQueue) != 0 else ())
+        for obj, target in self.broadphase.pairs(self.children, self.masks):
+            obj.onCollision(obj, target)
+
+
+class Pool:
+    # ? Recycles Velocity impulses and SpaceObjects (mostly bullets) instead of allocating new ones,
+    # ? the factory gets called with the same arguments as the pooled object's reset()
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+        self.inUse = 0
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, *args, **kwargs):
+        if len(self.free) != 0:
+            obj = self.free.pop()
+            obj.reset(*args, **kwargs)
+            self.reused += 1
+        else:
+            obj = self.factory(*args, **kwargs)
+            obj.pool = self
+            self.created += 1
+
+        obj.pooled = False
+        self.inUse += 1
+        return obj
+
+    def release(self, obj):
+        if obj.pooled:  # ? Releasing twice would hand the same object out twice
+            return
+        obj.pooled = True
+        self.inUse -= 1
+        self.free.append(obj)
+
+    def __str__(self):
+        return f"[{self.inUse} in use|{len(self.free)} free]"
+
+
+class HeadlessRunner:
+    # ? Advances a Game as fast as the CPU allows without touching pygame.display at all,
+    # ? onTick gets called before every tick so bots can feed in their inputs
+    def __init__(self, game: Game, onTick=lambda game: None):
+        self.game = game
+        self.onTick = onTick
+        self.ticks = 0
+        self.elapsed = 0.0
+
+    def run(self, ticks: int) -> float:  # ? Returns the ticks per second achieved during this run
+        start = time.perf_counter()
+        for _ in range(ticks):
+            self.onTick(self.game)
+            self.game.tick()
+        elapsed = time.perf_counter() - start
+
+        self.ticks += ticks
+        self.elapsed += elapsed
+        return ticks / elapsed if elapsed > 0 else float("inf")
+
+
+class FixedTimestep:
+    # ? Turns real time into a whole number of fixed size simulation steps, whatever is left over carries
+    # ? to the next frame so the game runs at `rate` steps a second no matter how fast it's being drawn
+    # * A frame that took too long only gets maxSteps steps, the rest of the backlog is thrown away
+    # * (and counted in dropped) instead of making the next frame even slower trying to catch up
+    def __init__(self, rate: float, maxSteps: int = 8):
+        self.rate = rate
+        self.step = 1 / rate
+        self.maxSteps = maxSteps
+        self.accumulator = 0.0
+        self.steps = 0
+        self.dropped = 0.0  # ? Seconds of simulation skipped because a frame hit maxSteps
+
+    def advance(self, elapsed: float) -> int:  # ? Returns how many steps to run for elapsed seconds of real time
+        self.accumulator += elapsed
+        steps = int(self.accumulator / self.step)
+        if steps > self.maxSteps:
+            self.dropped += (steps - self.maxSteps) * self.step
+            steps = self.maxSteps
+        self.accumulator -= steps * self.step
+        if self.accumulator >= self.step:
+            self.accumulator %= self.step
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self) -> float:  # ? How far real time is between the last step and the next one, from 0 to 1
+        return self.accumulator / self.step
+
+
+def release(obj):  # ? Hands obj back to the pool it came from, does nothing for objects that weren't pooled
+    if obj.pool is not None:
+        obj.pool.release(obj)
+
 
 def clamp(n, least, most):
     return max(least, min(n, most))
 
 
-def velocityFromBytes(b):
-    velocityParams = struct.unpack("!ffff?", b)
+def velocityFromBytes(b, offset=0):  # ? offset lets b be a whole packet (or a memoryview of one) without slicing it
+    velocityParams = VELOCITY_STRUCT.unpack_from(b, offset)
     return Velocity(velocityParams[0], velocityParams[1], velocityParams[3], velocityParams[4],  velocityParams[2])
 
 
-def spaceObjectFromBytes(b, scr, sprite, dead, onWallCollided, onCollision, givenID):
-    spaceObjectParams = struct.unpack("!IIIIf", b)
+def spaceObjectFromBytes(b, scr, sprite, dead, onWallCollided, onCollision, givenID, wallMode=WALL_CALLBACK, offset=0):
+    spaceObjectParams = SPACE_OBJECT_STRUCT.unpack_from(b, offset)
     return SpaceObject(
         [
             spaceObjectParams[0],
@@ -230,5 +735,5 @@ def spaceObjectFromBytes(b, scr, sprite, dead, onWallCollided, onCollision, give
         spaceObjectParams[3],
         onWallCollided,
         onCollision,
-        givenID, spaceObjectParams[4]
+        givenID, spaceObjectParams[4], wallMode
     )
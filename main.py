@@ -15,53 +15,119 @@
 
 # Note: This game is best played natively
 
+import atexit
+import multiprocessing
 import random
 import socket
 import sys
 import threading
+import time
+
+LAUNCHED = time.perf_counter()  # ? Before pygame gets imported (the slowest part of starting up) so --startup timings include it
 
 import pygame
 from pygame.locals import *
 
+from ai import ENEMY_GROUP, AIDirector, WaveSpawner
+from assets import AssetManager
 from core import *
+from netcode import *
+from profiler import Profiler, ProfilerOverlay, StartupTimer
+from render import FrameBlend, Renderer, hudFont
+from replay import *
+from shared import *
+
+
+# ? Every sprite that can be in a collision, dead ones never are (see SpatialHash.rebuild)
+COLLIDING_SPRITES = ["player.png", "player_bullet.png", "enemy.png", "enemy_bullet.png"]
 
 
 class GenericController():
-    def __init__(self):
+    replayMode = MODE_SINGLEPLAYER
+
+    def __init__(self, headless: bool = False, seed: Optional[int] = None, useEntityStore: bool = False, pixelCollisions: bool = False):
         # ? Settings (I know somebody's gonna change something in here and cheat D:<)
         self.scrDimensions = (800, 800)
 
+        # ? The simulation always steps simRate times a second, targetFPS only caps how often it gets drawn
+        # ? so it can be turned down on weak machines (or up for high refresh displays) without changing gameplay
+        self.simRate = 144
         self.targetFPS = 144
+        self.maxCatchUp = 8  # ? Most steps a single frame can run, a longer stall just loses the rest
 
         self.gameSpeedFactor = 1000
 
-        self.deathFrames = round(self.targetFPS * 0.5, 0)
+        self.deathFrames = round(self.simRate * 0.5, 0)
         self.speed = 0.2
         self.maxSpeed = 5
         self.falloff = 0.1
 
+        # ? Batches physics through NumPy arrays (--store), off by default since it only pays off with
+        # ? a thousand or so objects moving at once, below that the per tick NumPy overhead makes things slower
+        self.useEntityStore = useEntityStore
+
+        # ? Rects overlapping only counts as a hit when the sprites' opaque pixels overlap too (--pixel)
+        self.pixelCollisions = pixelCollisions
+
+        # ? Every random spawn position comes out of this, so a recorded seed gives the same world back
+        self.seed = random.randrange(1 << 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.recorder = None
+
+        # ? Times each phase of the frame, F3 turns it (and its overlay) on and off, F4 exports what it has
+        # * Off by default, a disabled profiler costs one attribute check per scope
+        self.profiler = Profiler()
+        self.startup: Optional[StartupTimer] = None  # ? Set by --startup, quits as soon as the first frame is drawn
+
         # ? Init
 
-        pygame.init()
+        # ? Headless mode never opens a window so it also works on machines without a display
+        self.headless = headless
+
+        if self.headless:
+            self.screen = None
+        else:
+            # ? Only the display (which brings events and the keyboard with it), pygame.init() would also start audio
+            # ? and joysticks nothing here uses, fonts get started by hudFont() once there's something to write
+            pygame.display.init()
+
+            self.screen = pygame.display.set_mode(self.scrDimensions)
+
+        self.assets = AssetManager()
 
-        self.screen = pygame.display.set_mode(self.scrDimensions)
+        # ? Masks get built for every sprite that can collide before the game starts, rather than mid fight
+        # * After the window is open, so they're keyed on the display format surfaces everything actually uses
+        self.masks = None
+        if self.pixelCollisions:
+            self.masks = MaskCache()
+            self.masks.prepare(self.assets.image(name) for name in COLLIDING_SPRITES)
+
+        # ? Bullets and movement impulses get recycled instead of reallocated every shot/frame
+        self.impulses = Pool(Velocity)
+        self.bullets = Pool(self.newBullet)
 
         self.player = SpaceObject(
-            pos=[random.randint(20, self.scrDimensions[0] - 20),
-                 random.randint(20, self.scrDimensions[1] - 20)],
+            pos=[self.rng.randint(20, self.scrDimensions[0] - 20),
+                 self.rng.randint(20, self.scrDimensions[1] - 20)],
             scr=self.screen,
-            sprite=pygame.image.load("player.png"),
-            dead=pygame.image.load("player_death.png"),
+            sprite=self.assets.image("player.png"),
+            dead=self.assets.image("player_death.png"),
             velocityQueue=[],
             maxVelStack=1,
             maxVelSpeed=self.maxSpeed,
             onWallCollided=self.limitPlayers,
             onCollision=self.onAllCollided,
             givenID="Player",
-            velocityFalloff=self.falloff
+            velocityFalloff=self.falloff,
+            wallMode=WALL_CLAMP
         )
 
-        self.game = Game(self.screen, [self.player], self.deathFrames)
+        self.game = Game(self.screen, [self.player], self.deathFrames,
+                         store=EntityStore(self.scrDimensions) if self.useEntityStore else None, profiler=self.profiler,
+                         masks=self.masks)
+
+        self.timestep = FixedTimestep(self.simRate, self.maxCatchUp)
+        self.blend = FrameBlend()
 
     def run(self):
         # ? Some text rendering stuff
@@ -69,79 +135,157 @@ class GenericController():
         BLACK = (0, 0, 0)
 
         fontsize = 20
-        font = pygame.font.SysFont(None, fontsize)
+        font = hudFont(fontsize)
         w, h = self.screen.get_size()
 
+        self.renderer = Renderer(self.screen, WHITE, font, profiler=self.profiler)
+        self.overlay = ProfilerOverlay(self.profiler, (60, 0), fontsize)
+
         self.clock = pygame.time.Clock()
 
         while True:
-            self.clock.tick(self.targetFPS)
+            elapsed = self.clock.tick(self.targetFPS) / 1000
 
             fps = self.clock.get_fps()
             if fps == 0:
                 fps = 1
 
             keystate = pygame.key.get_pressed()
-
-            if keystate[pygame.K_LEFT]:
-                self.player.addForce(
-                    Velocity(-self.speed * (self.gameSpeedFactor / fps), 0,
-                            self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed)
-                )
-            if keystate[pygame.K_RIGHT]:
-                self.player.addForce(
-                    Velocity(self.speed * (self.gameSpeedFactor / fps), 0,
-                            self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed)
-                )
-            if keystate[pygame.K_UP]:
-                self.player.addForce(
-                    Velocity(0, -self.speed * (self.gameSpeedFactor / fps),
-                            self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed)
-                )
-            if keystate[pygame.K_DOWN]:
-                self.player.addForce(
-                    Velocity(0, self.speed * (self.gameSpeedFactor / fps),
-                            self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed)
-                )
-            if keystate[pygame.K_SPACE]:  # ? Shoot
-                # * This is not a great solution especially for lower frame rates however it will do for now
-                if self.game.frame % round(self.targetFPS * 0.15, 0) == 0 and self.player.isDead == False:
-                    self.game.summon(SpaceObject(
-                        pos=self.player.pos,
-                        scr=self.screen,
-                        sprite=pygame.image.load("player_bullet.png"),
-                        dead=pygame.Surface((0, 0)),
-                        velocityQueue=[
-                            Velocity(0, -2 * (self.gameSpeedFactor / fps), 0, False, 6)],
-                        maxVelStack=2,
-                        maxVelSpeed=4,
-                        onWallCollided=self.limitBullet,
-                        onCollision=self.onAllCollided,
-                        givenID="Player_Bullet",
-                        velocityFalloff=self.falloff
-                    ))
             if keystate[pygame.K_ESCAPE]:
                 pygame.quit()
                 sys.exit()
 
-            for vel, i in zip(self.player.velocityQueue, range(len(self.player.velocityQueue))):
-                img = font.render(str(vel), True, BLACK)
-                self.screen.blit(
-                    img, (5, h-fontsize*len(self.player.velocityQueue) + fontsize*i)
+            keys = self.readKeys(keystate)
+            self.update(keys, elapsed)
+
+            for i, vel in enumerate(self.player.forces):
+                self.renderer.label(
+                    ("velocity", i), str(vel), (5, h-fontsize*len(self.player.forces) + fontsize*i), BLACK
                 )
 
-            img = font.render(str(int(fps)), True, BLACK)
-            self.screen.blit(img, (5, 0))
-
-            self.game.tick()
+            self.renderer.label("fps", str(int(fps)), (5, 0), BLACK)
+            self.overlay.label(self.renderer, BLACK)
+            self.labels(fontsize, BLACK)
 
             for event in pygame.event.get():
                 if event.type == QUIT:
                     pygame.quit()
                     sys.exit()
+                self.handleEvent(event)
+
+            self.renderer.draw(self.game.children, self.blend)
+            if self.startup is not None:
+                self.firstFrame()
+
+    def handleEvent(self, event):  # ? Keys that aren't gameplay (so never recorded) get handled here
+        if event.type == KEYDOWN:
+            if event.key == K_F3:
+                self.profiler.toggle()
+            elif event.key == K_F4:
+                tracePath, speedscopePath = self.profiler.export(f"profile-{int(time.time())}")
+                print(f"Profile written to {tracePath} and {speedscopePath}")
+
+    def firstFrame(self):  # ? --startup only wants to know how long it took to get something on screen
+        self.startup.mark("frame")
+        pygame.quit()
+        sys.exit()
+
+    def labels(self, fontsize: int, color):  # ? Extra HUD lines for modes that have something to show
+        pass
+
+    def update(self, keys: int, elapsed: float) -> int:  # ? Everything a frame does to the game, returns how many steps it ran
+        return self.advance(keys, elapsed)
+
+    def quit(self):  # ? Lets anyone else playing know we're leaving, single player has nobody to tell
+        pass
+
+    def advance(self, keys: int, elapsed: float) -> int:
+        # ? Runs however many fixed steps elapsed seconds are worth, every step sees the keys held this frame
+        # * Steps always get simRate as their fps so the per step impulses and fire rate never change
+        steps = self.timestep.advance(elapsed)
+        for i in range(steps):
+            if i == steps - 1:
+                self.blend.capture(self.game.children)
+            now = time.perf_counter()
+            if self.recorder is not None:
+                self.recorder.tick(keys, self.simRate, now)
+            self.step(keys, self.simRate, now)
+            if self.recorder is not None:
+                self.recorder.checkpoint(self.game)
+        self.blend.alpha = self.timestep.alpha
+        return steps
+
+    def record(self, path: str):  # ? Starts writing everything needed to replay this session to a replay log
+        self.recorder = ReplayRecorder(path, self.replayMode, self.seed, self.useEntityStore, self.pixelCollisions)
+
+    @staticmethod
+    def readKeys(keystate) -> int:  # ? Packs the keys the game cares about into one byte so they can be recorded
+        keys = 0
+        if keystate[pygame.K_LEFT]:
+            keys |= KEY_LEFT
+        if keystate[pygame.K_RIGHT]:
+            keys |= KEY_RIGHT
+        if keystate[pygame.K_UP]:
+            keys |= KEY_UP
+        if keystate[pygame.K_DOWN]:
+            keys |= KEY_DOWN
+        if keystate[pygame.K_SPACE]:
+            keys |= KEY_SPACE
+        return keys
+
+    def applyInput(self, keys: int, fps: float, callback=lambda vel: None):
+        if keys & KEY_LEFT:
+            self.player.addForce(
+                self.impulses.acquire(-self.speed * (self.gameSpeedFactor / fps), 0,
+                        self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), callback
+            )
+        if keys & KEY_RIGHT:
+            self.player.addForce(
+                self.impulses.acquire(self.speed * (self.gameSpeedFactor / fps), 0,
+                        self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), callback
+            )
+        if keys & KEY_UP:
+            self.player.addForce(
+                self.impulses.acquire(0, -self.speed * (self.gameSpeedFactor / fps),
+                        self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), callback
+            )
+        if keys & KEY_DOWN:
+            self.player.addForce(
+                self.impulses.acquire(0, self.speed * (self.gameSpeedFactor / fps),
+                        self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), callback
+            )
+        if keys & KEY_SPACE:  # ? Shoot
+            # * This is not a great solution especially for lower frame rates however it will do for now
+            if self.game.frame % round(self.simRate * 0.15, 0) == 0 and self.player.isDead == False:
+                self.shoot(fps)
+
+    def shoot(self, fps: float):
+        self.game.summon(self.bullets.acquire(
+            list(self.player.pos),
+            [self.impulses.acquire(0, -2 * (self.gameSpeedFactor / fps), 0, False, 6)]
+        ))
 
-            pygame.display.update()
-            self.screen.fill(WHITE)
+    def step(self, keys: int, fps: float, now: float):  # ? One tick of the game, everything in it comes from the arguments so replays can drive it
+        with self.profiler.scope("input"):
+            self.applyInput(keys, fps)
+        with self.profiler.scope("physics"):
+            self.game.tick()
+
+    def newBullet(self, pos, velocityQueue):  # ? Only called when the bullet pool has nothing to recycle
+        return SpaceObject(
+            pos=pos,
+            scr=self.screen,
+            sprite=self.assets.image("player_bullet.png"),
+            dead=self.assets.blank((0, 0)),
+            velocityQueue=velocityQueue,
+            maxVelStack=2,
+            maxVelSpeed=4,
+            onWallCollided=self.limitBullet,
+            onCollision=self.onAllCollided,
+            givenID="Player_Bullet",
+            velocityFalloff=self.falloff,
+            wallMode=WALL_KILL
+        )
 
     def limitPlayers(self, obj):
         obj.pos[0] = clamp(obj.pos[0], 0, self.scrDimensions[0])
@@ -157,155 +301,636 @@ class GenericController():
 
 
 class SingleplayerController(GenericController):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, headless: bool = False, seed: Optional[int] = None, useEntityStore: bool = False, pixelCollisions: bool = False):
+        super().__init__(headless, seed, useEntityStore, pixelCollisions)
         self.game.summon(SpaceObject(
-            pos=[random.randint(20, self.scrDimensions[0] - 20),
-                 random.randint(20, self.scrDimensions[1] - 20)],
+            pos=[self.rng.randint(20, self.scrDimensions[0] - 20),
+                 self.rng.randint(20, self.scrDimensions[1] - 20)],
             scr=self.screen,
-            sprite=pygame.image.load("enemy.png"),
-            dead=pygame.image.load("enemy_death.png"),
+            sprite=self.assets.image("enemy.png"),
+            dead=self.assets.image("enemy_death.png"),
             velocityQueue=[],
             maxVelStack=1,
             maxVelSpeed=self.maxSpeed,
             onWallCollided=self.limitPlayers,
             onCollision=self.onAllCollided,
             givenID="Enemy",
-            velocityFalloff=self.falloff
+            velocityFalloff=self.falloff,
+            wallMode=WALL_CLAMP
         ))
 
 
+class HeadlessController(SingleplayerController):
+    # ? Single player world with no window, input or frame cap, for bots and soak tests
+    def __init__(self, seed: Optional[int] = None, useEntityStore: bool = False, pixelCollisions: bool = False):
+        super().__init__(headless=True, seed=seed, useEntityStore=useEntityStore, pixelCollisions=pixelCollisions)
+
+    def run(self, ticks, onTick=lambda game: None):
+        self.runner = HeadlessRunner(self.game, onTick)
+        return self.runner.run(ticks)
+
+
+class WaveController(GenericController):
+    # ? Single player against ever bigger waves of enemies that chase the player and shoot at it
+    replayMode = MODE_WAVES
+
+    def __init__(self, headless: bool = False, seed: Optional[int] = None, useEntityStore: bool = False, pixelCollisions: bool = False):
+        super().__init__(headless, seed, useEntityStore, pixelCollisions)
+
+        self.enemySpeed = 3
+        self.enemyBulletSpeed = 3
+
+        # ? Seconds of AI per step, whatever doesn't fit waits for the next one
+        self.aiBudget = 0.002
+        # ? Agent updates per step when the session is being recorded or replayed, see AIDirector
+        self.replayAIUpdates = 64
+
+        self.enemySprite = self.assets.image("enemy.png")
+        self.enemyDead = self.assets.image("enemy_death.png")
+        self.enemyBullets = Pool(self.newEnemyBullet)
+
+        self.director = AIDirector(self.scrDimensions, self.impulses, self.enemyFire, self.rng, self.aiBudget)
+        self.director.maxSpeed = self.enemySpeed
+        self.waves = WaveSpawner(self.spawnEnemy)
+
+    def deterministic(self):  # ? Swaps the AI's time budget for a fixed amount of updates so replays come out the same
+        self.director.maxUpdates = self.replayAIUpdates
+
+    def record(self, path: str):
+        self.deterministic()
+        super().record(path)
+
+    def step(self, keys: int, fps: float, now: float):
+        with self.profiler.scope("ai"):
+            self.waves.update(len(self.director))
+            self.director.update(self.game.frame, self.player, self.game.broadphase)
+        super().step(keys, fps, now)
+
+    def labels(self, fontsize: int, color):
+        w, h = self.scrDimensions
+        self.renderer.label("wave", f"wave {self.waves.wave} | {len(self.director)} enemies", (w - 200, 0), color)
+        self.renderer.label("ai", f"ai {self.director.cost * 1000:.2f}ms | {self.director.deferred} deferred", (w - 200, fontsize), color)
+
+    def spawnEnemy(self):  # ? Somewhere along a random edge of the screen
+        w, h = self.scrDimensions
+        edge = self.rng.randrange(4)
+        along = self.rng.uniform(0, w if edge < 2 else h)
+        pos = [[along, 0], [along, h], [0, along], [w, along]][edge]
+
+        obj = SpaceObject(
+            pos=pos,
+            scr=self.screen,
+            sprite=self.enemySprite,
+            dead=self.enemyDead,
+            velocityQueue=[],
+            maxVelStack=1,
+            maxVelSpeed=self.enemySpeed,
+            onWallCollided=self.limitPlayers,
+            onCollision=self.onAllCollided,
+            givenID="Enemy",  # * Every enemy shares the id so onAllCollided doesn't have them killing each other
+            velocityFalloff=self.falloff,
+            wallMode=WALL_CLAMP
+        )
+        obj.group = ENEMY_GROUP
+        self.game.summon(obj)
+        self.director.add(obj, self.game.frame)
+
+    def enemyFire(self, obj, dx, dy):
+        # * Shot straight rather than through an impulse, the x and y of an impulse get clamped separately
+        # * so anything but a straight line would end up bent towards the diagonal
+        bullet = self.enemyBullets.acquire(list(obj.pos), [])
+        bullet.group = ENEMY_GROUP
+        bullet.velocity.x = dx * self.enemyBulletSpeed
+        bullet.velocity.y = dy * self.enemyBulletSpeed
+        self.game.summon(bullet)
+
+    def newEnemyBullet(self, pos, velocityQueue):  # ? Only called when the enemy bullet pool has nothing to recycle
+        return SpaceObject(
+            pos=pos,
+            scr=self.screen,
+            sprite=self.assets.image("enemy_bullet.png"),
+            dead=self.assets.blank((0, 0)),
+            velocityQueue=velocityQueue,
+            maxVelStack=1,
+            maxVelSpeed=self.enemyBulletSpeed,
+            onWallCollided=self.limitBullet,
+            onCollision=self.onAllCollided,
+            givenID="Enemy_Bullet",
+            velocityFalloff=0,
+            wallMode=WALL_KILL
+        )
+
+
 class NetworkController(GenericController):
-    def __init__(self):
-        super().__init__()
+    replayMode = MODE_NETWORK
 
-    def run(self, addr, port):
-        self.remoteAddr = (addr, port)
+    def __init__(self, headless: bool = False, seed: Optional[int] = None, useEntityStore: bool = False, pixelCollisions: bool = False):
+        super().__init__(headless, seed, useEntityStore, pixelCollisions)
+
+        # ? Inputs get sent this many times a second regardless of FPS, each one up to inputRedundancy times
+        self.networkRate = 30
+        self.inputRedundancy = 3
+
+        # ? Opponents are drawn this many seconds in the past so there's always a pair of states to interpolate between
+        self.interpolationDelay = 0.1
 
+        # ? Packets that can wait for the main loop before the oldest start getting dropped
+        self.inboxSize = 1024
+
+        # ? Only players in the same room get each other's packets through the relay
+        self.room = 0
+
+    def setup(self):  # ? Everything the network game needs apart from the socket itself
         self.opponents = {}
+        self.remoteBullets = {}  # ? Index -> bullet, everyone else's bullets an authoritative server sends
+
+        self.net = NetClient(self.simRate, self.networkRate, self.inputRedundancy, self.interpolationDelay)
+        self.inbox = Inbox(self.inboxSize)
 
-        self.opponentSprite = pygame.image.load("enemy.png")
-        self.opponentDead = pygame.image.load("enemy_death.png")
+        self.opponentSprite = self.assets.image("enemy.png")
+        self.opponentDead = self.assets.image("enemy_death.png")
+        self.opponentBullets = Pool(self.newOpponentBullet)
+        self.serverBullets = Pool(self.newServerBullet)
+
+    def connect(self, addr, port, room=0):
+        self.remoteAddr = (addr, port)
+        self.room = room
+
+        self.setup()
 
         self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-        self.client.sendto(b"\x00" + self.player.toBytes(), self.remoteAddr) #? Packet Type 0: Player Join
+        self.client.sendto(self.net.join(self.player, self.room, time.perf_counter()), self.remoteAddr) #? Packet Type 0: Player Join
 
         self.recvThread = threading.Thread(target=self.packetHandler, daemon=True)
         self.recvThread.start()
 
+    def run(self, addr, port, room=0):
+        self.connect(addr, port, room)
+
         WHITE = (255, 255, 255)
         BLACK = (0, 0, 0)
 
         fontsize = 20
-        font = pygame.font.SysFont(None, fontsize)
+        font = hudFont(fontsize)
         w, h = self.screen.get_size()
 
+        self.renderer = Renderer(self.screen, WHITE, font, profiler=self.profiler)
+        self.overlay = ProfilerOverlay(self.profiler, (60, 0), fontsize)
+
         self.clock = pygame.time.Clock()
 
         while True:
-            self.clock.tick(self.targetFPS)
+            elapsed = self.clock.tick(self.targetFPS) / 1000
 
             fps = self.clock.get_fps()
             if fps == 0:
                 fps = 1
 
             keystate = pygame.key.get_pressed()
-
-            if keystate[pygame.K_LEFT]:
-                self.player.addForce(
-                    Velocity(-self.speed * (self.gameSpeedFactor / fps), 0,
-                             self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), self.addForceNetworkCallback
-                )
-            if keystate[pygame.K_RIGHT]:
-                self.player.addForce(
-                    Velocity(self.speed * (self.gameSpeedFactor / fps), 0,
-                             self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), self.addForceNetworkCallback
-                )
-            if keystate[pygame.K_UP]:
-                self.player.addForce(
-                    Velocity(0, -self.speed * (self.gameSpeedFactor / fps),
-                             self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), self.addForceNetworkCallback
-                )
-            if keystate[pygame.K_DOWN]:
-                self.player.addForce(
-                    Velocity(0, self.speed * (self.gameSpeedFactor / fps),
-                             self.falloff * (self.gameSpeedFactor / fps), False, self.maxSpeed), self.addForceNetworkCallback
-                )
-            if keystate[pygame.K_SPACE]:  # ? Shoot
-                # * This is not a great solution especially for lower frame rates however it will do for now
-                if self.game.frame % round(self.targetFPS * 0.15, 0) == 0 and self.player.isDead == False:
-                    self.game.summon(SpaceObject(
-                        pos=self.player.pos,
-                        scr=self.screen,
-                        sprite=pygame.image.load("player_bullet.png"),
-                        dead=pygame.Surface((0, 0)),
-                        velocityQueue=[
-                            Velocity(0, -2 * (self.gameSpeedFactor / fps), 0, False, 6)],
-                        maxVelStack=2,
-                        maxVelSpeed=4,
-                        onWallCollided=self.limitBullet,
-                        onCollision=self.onAllCollided,
-                        givenID="Player_Bullet",
-                        velocityFalloff=self.falloff
-                    ))
             if keystate[pygame.K_ESCAPE]:
+                self.quit()
                 pygame.quit()
                 sys.exit()
 
-            for vel, i in zip(self.player.velocityQueue, range(len(self.player.velocityQueue))):
-                img = font.render(str(vel), True, BLACK)
-                self.screen.blit(
-                    img, (5, h-fontsize*len(self.player.velocityQueue) + fontsize*i)
-                )
+            keys = self.readKeys(keystate)
+            self.update(keys, elapsed)
 
-            img = font.render(str(int(fps)), True, BLACK)
-            self.screen.blit(img, (5, 0))
+            for i, vel in enumerate(self.player.forces):
+                self.renderer.label(
+                    ("velocity", i), str(vel), (5, h-fontsize*len(self.player.forces) + fontsize*i), BLACK
+                )
 
-            self.game.tick()
+            self.renderer.label("fps", str(int(fps)), (5, 0), BLACK)
+            self.overlay.label(self.renderer, BLACK)
+            self.renderer.label("inbox", f"inbox {self.inbox.depth} / {self.inbox.drainTime * 1000:.1f}ms", (5, fontsize), BLACK)
 
             for event in pygame.event.get():
                 if event.type == QUIT:
+                    self.quit()
                     pygame.quit()
                     sys.exit()
+                self.handleEvent(event)
+
+            self.renderer.draw(self.game.children, self.blend)
+            if self.startup is not None:
+                self.firstFrame()
+
+    def update(self, keys: int, elapsed: float) -> int:
+        # ? The one point in the frame where network packets get to touch the game
+        with self.profiler.scope("inbox"):
+            self.inbox.drain(self.handlePacket)
+        return self.advance(keys, elapsed)
+
+    def step(self, keys: int, fps: float, now: float):
+        with self.profiler.scope("input"):
+            self.applyInput(keys, fps, self.addForceNetworkCallback)
+
+            for index, receiver in list(self.net.peerInputs.items()):
+                opponent = self.opponents.get(index)
+                if opponent == None:
+                    continue
+                # ? Only peers that don't send their state (older clients) get driven by their inputs instead,
+                # ? everyone else just gets their fire presses played
+                driven = opponent if self.net.interpolator.has(index) == False else None
+                receiver.feed(driven, onButtons=lambda sequence, buttons: self.opponentShoot(opponent, buttons))
+
+        with self.profiler.scope("physics"):
+            self.game.tick()
 
-            pygame.display.update()
-            self.screen.fill(WHITE)
+        # ? Sending and interpolation, handling received packets is timed separately as "inbox"
+        with self.profiler.scope("network"):
+            for packet in self.net.endTick(self.player, self.game.frame, now):
+                self.client.sendto(packet, self.remoteAddr)
+            self.updateOpponents(now)
+
+    def addForceNetworkCallback(self, vel):  # ? Only queued up here, the whole tick's inputs get sent together as one frame
+        self.net.inputs.add(vel)
+
+    def shoot(self, fps: float):  # ? The bullet still shows up straight away, the fire press goes out with this tick's frame
+        super().shoot(fps)
+        self.net.inputs.press(BUTTON_FIRE)
+
+    def opponentShoot(self, opponent, buttons: int):
+        # ? Relay games only, a peer's fire press shoots from wherever it's drawn so it can hit the local player
+        if buttons & BUTTON_FIRE and opponent.isDead == False:
+            self.game.summon(self.opponentBullets.acquire(
+                list(opponent.pos),
+                [self.impulses.acquire(0, -2 * (self.gameSpeedFactor / self.simRate), 0, False, 6)]
+            ))
+
+    def newOpponentBullet(self, pos, velocityQueue):  # ? Only called when the opponent bullet pool has nothing to recycle
+        return SpaceObject(
+            pos=pos,
+            scr=self.screen,
+            sprite=self.assets.image("enemy_bullet.png"),
+            dead=self.assets.blank((0, 0)),
+            velocityQueue=velocityQueue,
+            maxVelStack=2,
+            maxVelSpeed=4,
+            onWallCollided=self.limitBullet,
+            onCollision=self.onAllCollided,
+            givenID="Opponent_Bullet",
+            velocityFalloff=self.falloff,
+            wallMode=WALL_KILL
+        )
 
-    def addForceNetworkCallback(self, vel): #? Packet type 1: Velocity
-        self.client.sendto(b"\x01" + vel.toBytes(), self.remoteAddr)
+    def newServerBullet(self, pos, velocityQueue):  # ? Only called when the server bullet pool has nothing to recycle
+        # * Only ever goes wherever snapshots put it, what it hits and when it leaves the screen is the server's call
+        return SpaceObject(
+            pos=pos,
+            scr=self.screen,
+            sprite=self.assets.image("enemy_bullet.png"),
+            dead=self.assets.blank((0, 0)),
+            velocityQueue=velocityQueue,
+            maxVelStack=1,
+            maxVelSpeed=0,
+            onWallCollided=lambda obj: None,
+            onCollision=lambda obj, target: None,
+            givenID="Server_Bullet",
+            velocityFalloff=self.falloff,
+            wallMode=WALL_KILL
+        )
+
+    def onAllCollided(self, obj, target):
+        # ? Opponents only ever die when their snapshot (or peer state) says so, on an authoritative server the
+        # ? local player does too, in relay games it's the one judging whether an opponent's bullet hit it
+        if self.net.index != None:
+            return
+        for victim, other in ((obj, target), (target, obj)):
+            if victim is self.player and other.id == "Opponent_Bullet":
+                self.game.kill(victim, other)
 
     def packetHandler(self):
+        # ? Runs on its own thread and does nothing but copy packets into the inbox, everything
+        # ? else happens in handlePacket on the main thread once the inbox gets drained
+        buffer = bytearray(MAX_PACKET)
+        b = memoryview(buffer)
+
         while True:
-            b, addr = self.client.recvfrom(256)
-            if b[1] == 0:
-                print(b)
-                buff = b[2:]
-                if self.opponents.get(b[0]) == None:
-                    self.client.sendto(b"\x00" + self.player.toBytes(), self.remoteAddr)
-                    self.opponents[b[0]] = spaceObjectFromBytes(buff, self.screen, self.opponentSprite, self.opponentDead, self.limitPlayers, self.onAllCollided, f"Player_{b[0]}")
-                    self.game.summon(self.opponents[b[0]])
-            elif b[1] == 1:
-                buff = b[2:]
-                self.opponents[b[0]].addForce(velocityFromBytes(buff))
-            else:
-                break
+            size, addr = self.client.recvfrom_into(buffer)
+            self.inbox.push(bytes(b[:size]), time.perf_counter())
+
+    def handlePacket(self, packet, now):
+        if self.recorder is not None:
+            self.recorder.packet(packet, now)
+
+        b = memoryview(packet)
+        if b[0] == SERVER_INDEX or b[1] == 6 or b[1] == 8:
+            reply = self.net.receive(b, now)
+            if reply is not None:
+                self.client.sendto(reply, self.remoteAddr)
+        elif b[1] == 0:
+            print(packet)
+            if self.opponents.get(b[0]) == None:
+                self.client.sendto(joinToBytes(self.player, self.room), self.remoteAddr)
+                self.opponents[b[0]] = spaceObjectFromBytes(b, self.screen, self.opponentSprite, self.opponentDead, self.limitPlayers, self.onAllCollided, f"Player_{b[0]}", WALL_CLAMP, 2)
+                self.game.summon(self.opponents[b[0]])
+        elif b[1] == 1:
+            opponent = self.opponents.get(b[0])
+            if opponent != None:
+                opponent.addForce(velocityFromBytes(b, 2))
+        elif b[1] == 4:  # ? Relayed Player Quit, also what the relay sends when it evicts someone who went silent
+            opponent = self.opponents.pop(b[0], None)
+            if opponent != None:
+                self.game.kill(opponent)
+            self.net.remove(b[0])
+
+    def updateOpponents(self, now):
+        # ? Local player deaths are the server's call, everyone else (and their bullets on an authoritative server)
+        # ? is drawn wherever the interpolator puts them
+        if self.net.ownDead and self.player.isDead == False:
+            self.player.pos = list(self.net.ownPos)  # ? Dies where the server had it, not wherever prediction got to
+            self.game.kill(self.player)
+
+        if self.net.index != None:  # ? Whatever the server stopped sending has left the game, relay peers leave with a Player Quit instead
+            for objs in (self.opponents, self.remoteBullets):
+                for index in [index for index in objs.keys() if self.net.interpolator.has(index) == False]:
+                    self.game.kill(objs.pop(index))
+        # * A dead bullet can finish its death frames here before the server drops it, once it's back in the pool
+        # * it could be handed out again for another index, so it's forgotten before anything gets acquired
+        for index in [index for index, obj in self.remoteBullets.items() if obj.pooled]:
+            del self.remoteBullets[index]
+
+        for index in list(self.net.interpolator.history.keys()):
+            sample = self.net.sample(index, now)
+            if sample == None:
+                continue
+            x, y, dead = sample
+
+            if bulletOwner(index) != None:
+                obj = self.remoteBullets.get(index)
+                if obj == None or (obj.isDead and dead == False):
+                    if dead:  # ? Nothing to show for a bullet that's only been seen dead
+                        continue
+                    obj = self.serverBullets.acquire([x, y], [])
+                    self.remoteBullets[index] = obj
+                    self.game.summon(obj)
+                obj.pos = [x, y]
+                if dead and obj.isDead == False:
+                    self.game.kill(obj)
+                continue
+
+            obj = self.opponents.get(index)
+            if obj == None or (obj.isDead and dead == False):  # ? Never seen before, or alive again
+                obj = SpaceObject(
+                    pos=[x, y],
+                    scr=self.screen,
+                    sprite=self.opponentSprite,
+                    dead=self.opponentDead,
+                    velocityQueue=[],
+                    maxVelStack=1,
+                    maxVelSpeed=self.maxSpeed,
+                    onWallCollided=self.limitPlayers,
+                    onCollision=self.onAllCollided,
+                    givenID=f"Player_{index}",
+                    velocityFalloff=self.falloff,
+                    wallMode=WALL_CLAMP
+                )
+                self.opponents[index] = obj
+                self.game.summon(obj)
+
+            obj.pos = [x, y]
+            if dead and obj.isDead == False:
+                self.game.kill(obj)
 
     def quit(self): #? Packet type 4: Player Quit
-        self.client.sendto(b"\x04")
+        self.client.sendto(b"\x04", self.remoteAddr)
+
+def splitController(mode: int, useEntityStore: bool = False, pixelCollisions: bool = False) -> GenericController:  # ? Menu mode -> the controller --split runs in the simulation process
+    if mode == 1:
+        return NetworkController(True, None, useEntityStore, pixelCollisions)
+    if mode == 4:
+        return WaveController(True, None, useEntityStore, pixelCollisions)
+    return SingleplayerController(True, None, useEntityStore, pixelCollisions)
+
+
+def simulate(mode: int, worldName: str, worldLock, inputsName: str, inputsLock, recordPath: Optional[str], connection: Optional[Tuple[str, int, int]], useEntityStore: bool = False, pixelCollisions: bool = False):
+    # ? Simulation half of --split, runs in its own process with no window and publishes every frame that ran a step
+    # ? into the shared world until the window process pushes INPUT_QUIT (or goes away)
+    world = SharedWorld(name=worldName, lock=worldLock)
+    inputs = InputRing(name=inputsName, lock=inputsLock)
+    parent = multiprocessing.parent_process()
+
+    game = splitController(mode, useEntityStore, pixelCollisions)
+    if connection != None:
+        game.connect(*connection)
+    if recordPath != None:
+        game.record(recordPath)
+
+    publisher = WorldPublisher(world, game.assets)
+    publisher.describe(game.simRate, game.targetFPS, game.scrDimensions)
+
+    keys = 0
+    last = time.perf_counter()
+    lastCheck = last
+    running = True
+    while running:
+        for record, flags in inputs.drain():
+            keys = record
+            if flags & INPUT_QUIT:
+                running = False
+
+        now = time.perf_counter()
+        if game.update(keys, now - last) != 0:
+            publisher.publish(game.game.children, game.game.frame, game.blend.previous, time.perf_counter() - now, time.perf_counter())
+        last = now
+
+        if now - lastCheck >= 1:  # ? A window process that crashed can't push INPUT_QUIT
+            lastCheck = now
+            if parent != None and not parent.is_alive():
+                running = False
+
+        # ? Sleeps until the next step is due, a step that ran long just makes this one shorter
+        time.sleep(max(0.0, (1 - game.timestep.alpha) * game.timestep.step))
+
+    game.quit()
+    publisher.stop()
+    if game.recorder != None:  # ? Child processes skip atexit, so the replay log has to be flushed by hand
+        game.recorder.close()
+    inputs.close()
+    world.close()
+
+
+class SplitController:
+    # ? Window half of --split, the game itself runs in a separate process (see simulate) so simulation and
+    # ? drawing each get a core to themselves and a slow frame on one side doesn't hold up the other.
+    # ? Keys go over an InputRing and the world comes back through a SharedWorld, drawn straight out of shared memory
+    # * The HUD only has what the shared world carries, mode specific lines (velocities, inbox, AI) stay in the simulation
+    def __init__(self, mode: int, recordPath: Optional[str] = None, connection: Optional[Tuple[str, int, int]] = None, useEntityStore: bool = False, pixelCollisions: bool = False):
+        self.world = SharedWorld()
+        self.inputs = InputRing()
+        self.process = multiprocessing.Process(
+            target=simulate, args=(mode, self.world.name, self.world.lock, self.inputs.name, self.inputs.lock, recordPath, connection, useEntityStore, pixelCollisions), daemon=True)
+
+        self.profiler = Profiler()
+        self.startup: Optional[StartupTimer] = None
+
+    handleEvent = GenericController.handleEvent  # ? Same F3/F4 profiler keys, they only profile the window process here
+
+    def run(self):
+        self.process.start()
+        control = self.world.control
+        while control[CONTROL_STATE] == STATE_STARTING:  # ? The simulation says how big the window should be once it's built the game
+            if not self.process.is_alive():
+                self.stop("The simulation process failed to start")
+            time.sleep(0.001)
+
+        WHITE = (255, 255, 255)
+        BLACK = (0, 0, 0)
+
+        simRate, targetFPS, size = self.world.settings()
+
+        pygame.display.init()
+        self.screen = pygame.display.set_mode(size)
+
+        fontsize = 20
+        self.renderer = Renderer(self.screen, WHITE, hudFont(fontsize), profiler=self.profiler)
+        self.overlay = ProfilerOverlay(self.profiler, (60, 0), fontsize)
+        self.view = WorldView(self.world, AssetManager())
+        self.clock = pygame.time.Clock()
+
+        keys = None
+        while True:
+            self.clock.tick(targetFPS)
+
+            keystate = pygame.key.get_pressed()
+            if keystate[pygame.K_ESCAPE]:
+                self.stop()
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    self.stop()
+                self.handleEvent(event)
+
+            # ? Only changes get pushed, the simulation keeps using the last keys it got
+            current = GenericController.readKeys(keystate)
+            if current != keys and self.inputs.push(current):
+                keys = current
+
+            with self.profiler.scope("sync"):
+                self.view.refresh()
+            if control[CONTROL_STATE] == STATE_STOPPED or not self.process.is_alive():
+                self.stop("The simulation process stopped")
+            self.view.blend.alpha = min(1.0, (time.perf_counter() - self.view.publishedAt) * simRate)
+
+            self.renderer.label("fps", str(int(self.clock.get_fps())), (5, 0), BLACK)
+            self.renderer.label("sim", str(self.view), (5, fontsize), BLACK)
+            self.overlay.label(self.renderer, BLACK)
+
+            self.renderer.draw(self.view.entities, self.view.blend)
+            if self.startup is not None:
+                self.startup.mark("frame")
+                self.stop()
+
+    def stop(self, message: Optional[str] = None):
+        self.inputs.push(0, INPUT_QUIT)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.inputs.close()
+        self.world.close()
+        pygame.quit()
+        sys.exit(message)
+
+
+def replayController(mode, seed, useEntityStore, pixelCollisions, headless=True):  # ? Builds the controller a replay log was recorded with
+    if mode == MODE_NETWORK:
+        controller = NetworkController(headless, seed, useEntityStore, pixelCollisions)
+        controller.setup()
+        controller.client = NullSocket()
+        controller.remoteAddr = None
+        return controller
+    if mode == MODE_WAVES:
+        controller = WaveController(headless, seed, useEntityStore, pixelCollisions)
+        controller.deterministic()
+        return controller
+    return SingleplayerController(headless, seed, useEntityStore, pixelCollisions)
+
 
 if __name__ == "__main__":
-    menu = open("menu.txt", "r")
-    print(menu.read())
+    # ? python main.py --record <path> writes the session to a replay log that mode 3 can play back
+    recordPath = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None
+    # ? python main.py --profile starts with the frame profiler already on (F3 toggles it either way)
+    profile = "--profile" in sys.argv
+    # ? python main.py --startup prints how long it took to get to the menu and to the first frame, then quits
+    startup = StartupTimer(LAUNCHED) if "--startup" in sys.argv else None
+    # ? python main.py --split runs the simulation in a second process and only draws in this one (modes 0, 1 and 4)
+    split = "--split" in sys.argv
+    # ? python main.py --store batches physics through NumPy, only worth it with a lot of objects on screen
+    store = "--store" in sys.argv
+    if store and not EntityStore.available:
+        print("--store needs NumPy installed, ignoring it")
+        store = False
+    # ? python main.py --pixel only counts hits where the sprites' opaque pixels overlap
+    pixel = "--pixel" in sys.argv
+    if startup != None:
+        atexit.register(startup.report)
+
+    print(AssetManager().text("menu.txt"))
+    if startup != None:
+        startup.mark("menu")
     mode = int(input(" > "))
-    if mode == 0:
-        game = SingleplayerController()
+    if split and mode in (0, 4):
+        game = SplitController(mode, recordPath, None, store, pixel)
+        game.profiler.enabled = profile
+        game.startup = startup
+        game.run()
+    elif mode == 0:
+        game = SingleplayerController(useEntityStore=store, pixelCollisions=pixel)
+        game.profiler.enabled = profile
+        game.startup = startup
+        if recordPath != None:
+            game.record(recordPath)
         game.run()
     elif mode == 1:
         print("Specify Multiplayer Server Address")
         addr = input(" > ")
         print("Specify Multiplayer Server Port")
         port = int(input(" > "))
-
-        game = NetworkController()
-        game.run(addr, port)
+        print("Specify Room (leave empty for 0)")
+        room = input(" > ")
+
+        room = int(room) if room.strip() != "" else 0
+
+        if split:
+            game = SplitController(mode, recordPath, (addr, port, room), store, pixel)
+            game.profiler.enabled = profile
+            game.startup = startup
+            game.run()
+        else:
+            game = NetworkController(useEntityStore=store, pixelCollisions=pixel)
+            game.profiler.enabled = profile
+            game.startup = startup
+            if recordPath != None:
+                game.record(recordPath)
+            game.run(addr, port, room)
+    elif mode == 2:
+        print("Specify Number of Ticks to Simulate")
+        ticks = int(input(" > "))
+
+        game = HeadlessController(useEntityStore=store, pixelCollisions=pixel)
+        if startup != None:
+            startup.mark("ready")
+        print(f"{game.run(ticks):.0f} ticks/s")
+    elif mode == 4:
+        game = WaveController(useEntityStore=store, pixelCollisions=pixel)
+        game.profiler.enabled = profile
+        game.startup = startup
+        if recordPath != None:
+            game.record(recordPath)
+        game.run()
+    elif mode == 3:
+        print("Specify Replay Log")
+        path = input(" > ")
+        print("Play in Real Time? (y/n)")
+        realtime = input(" > ").strip().lower() == "y"
+
+        # ? Only real time playback can seek, headless playback keeps no checkpoints
+        player = ReplayPlayer(path, lambda mode, seed, useEntityStore, pixelCollisions: replayController(mode, seed, useEntityStore, pixelCollisions, not realtime), realtime)
+        if realtime:
+            player.play(player.controller.simRate)
+        else:
+            print(f"{player.run():.0f} ticks/s over {player.ticks} ticks")
+        if len(player.desyncs) != 0:
+            print(f"Replay desynced at frames {player.desyncs}")
+        player.close()
@@ -0,0 +1,676 @@
+import collections
+import math
+import struct
+import time
+from typing import *
+
+from core import SERVER_INDEX, VELOCITY_STRUCT, SpaceObject, Velocity, velocityFromBytes
+
+# ? Snapshot as Bytes Protocol Description (version 4):
+# ? Max buffer size: MAX_PACKET Bytes, a snapshot that doesn't fit gets split into several chunks
+# ? [1 Byte SERVER_INDEX] | [1 Byte (int) Packet Type 2] | [1 Byte (int) version] | [4 Bytes (int) frame] | [4 Bytes (int) baseline frame]
+# ?     | [1 Byte (int) chunk] | [1 Byte (int) chunk count] | [1 Byte (int) entity count]
+# ?     | [4 Bytes (int) last input sequence applied] | [1 Byte (int) ticks since it was applied] | [1 Byte (int) recipient index]
+# ?     | entities...
+# ? Full entity:    [2 Bytes (int) index] | [1 Byte flags] | [2 Bytes (int) X * QUANTIZE] | [2 Bytes (int) Y * QUANTIZE]
+# ? Delta entity:   [2 Bytes (int) index] | [1 Byte flags] | [1 Byte (signed) X change] | [1 Byte (signed) Y change]
+# ? Removed entity: [2 Bytes (int) index] | [1 Byte flags]
+# ? Indices under 256 are players (their client index), bullets get (owner's client index + 1) << 8 | serial, see bulletIndex
+# * Deltas are against the baseline frame (the last snapshot the client acknowledged), entities that
+# * haven't changed since the baseline aren't sent at all
+# * The recipient index is the same one the Welcome (Packet Type 3) carries, repeated so a lost Welcome doesn't matter
+
+# ? Snapshot Ack as Bytes Protocol Description:
+# ? Buffer size: 5 Bytes
+# ? [1 Byte (int) Packet Type 5] | [4 Bytes (int) frame]
+
+SNAPSHOT_VERSION = 4
+MAX_PACKET = 1200  # ? Comfortably under the usual 1500 byte MTU
+NO_BASELINE = 0xFFFFFFFF
+NO_INPUT = 0xFFFFFFFF
+QUANTIZE = 16  # ? Positions are sent in 1/16ths of a pixel, which caps them at 4096 pixels
+
+FLAG_DEAD = 1
+FLAG_DELTA = 2
+FLAG_REMOVED = 4
+
+HEADER = struct.Struct("!BBBIIBBBIBB")
+ENTITY = struct.Struct("!HB")
+FULL = struct.Struct("!HH")
+DELTA = struct.Struct("!bb")
+ACK = struct.Struct("!BI")
+
+# ? Quantized state of one entity: (X, Y, dead)
+EntityState = Tuple[int, int, bool]
+
+
+def quantize(pos) -> Tuple[int, int]:
+    return (
+        max(0, min(0xFFFF, int(round(pos[0] * QUANTIZE)))),
+        max(0, min(0xFFFF, int(round(pos[1] * QUANTIZE))))
+    )
+
+
+def bulletIndex(owner: int, serial: int) -> int:
+    # * The serial only has to tell apart the owner's bullets that are alive at the same time, the fire rate
+    # * keeps that to a handful so it just wraps around at 256
+    return (owner + 1) << 8 | (serial & 0xFF)
+
+
+def bulletOwner(index: int) -> Optional[int]:  # ? Client index of whoever shot the bullet, None for players
+    return (index >> 8) - 1 if index > 0xFF else None
+
+
+def worldState(objs: Dict[int, SpaceObject]) -> Dict[int, EntityState]:
+    # ? Built once per snapshot and shared between every client's encoder
+    return {index: quantize(obj.pos) + (obj.isDead,) for index, obj in objs.items()}
+
+
+def ackToBytes(frame: int) -> bytes:
+    return ACK.pack(5, frame)
+
+
+def ackFromBytes(b, offset=0) -> int:
+    return ACK.unpack_from(b, offset)[1]
+
+
+class SnapshotEncoder:
+    # ? One per client since every client can be on a different baseline
+    def __init__(self, index: int = SERVER_INDEX, history: int = 32):
+        self.index = index  # ? Index of the client these snapshots go to, SERVER_INDEX if there isn't one
+        self.buffer = bytearray(MAX_PACKET)
+        self.view = memoryview(self.buffer)
+        self.history = history
+        self.sent: Dict[int, Dict[int, EntityState]] = {}  # ? Frame -> state, oldest first
+        self.acked = None
+        self.bytes = 0  # ? Total snapshot bytes produced, handy for measuring bandwidth
+
+    def ack(self, frame: int):
+        if frame in self.sent and (self.acked is None or frame > self.acked):
+            self.acked = frame
+
+    def encode(self, frame: int, state: Dict[int, EntityState], inputSequence: int = NO_INPUT, sinceInput: int = 0) -> Iterator[memoryview]:
+        # ? inputSequence/sinceInput tell the client which of its own inputs the snapshot already accounts for
+        # * Every chunk is written into the same buffer, so each one has to be sent before asking for the next
+        baseline = self.sent.get(self.acked) if self.acked is not None else None
+        baseFrame = self.acked if baseline is not None else NO_BASELINE
+
+        entries = []
+        for index, entity in state.items():
+            base = baseline.get(index) if baseline is not None else None
+            if base != entity:
+                entries.append((index, entity, base))
+        if baseline is not None:
+            for index in baseline.keys():
+                if index not in state:
+                    entries.append((index, None, None))
+
+        self.sent[frame] = state
+        while len(self.sent) > self.history:
+            del self.sent[next(iter(self.sent))]
+        if self.acked is not None and self.acked not in self.sent:
+            self.acked = None
+
+        # ? Worst case every entity is a full one, so that's what chunks get sized with
+        perChunk = (MAX_PACKET - HEADER.size) // (ENTITY.size + FULL.size)
+        chunks = max(1, -(-len(entries) // perChunk))
+        for chunk in range(chunks):
+            batch = entries[chunk * perChunk:(chunk + 1) * perChunk]
+            offset = HEADER.size
+            for index, entity, base in batch:
+                if entity is None:
+                    ENTITY.pack_into(self.buffer, offset, index, FLAG_REMOVED)
+                    offset += ENTITY.size
+                    continue
+
+                flags = FLAG_DEAD if entity[2] else 0
+                if base is not None and -128 <= entity[0] - base[0] <= 127 and -128 <= entity[1] - base[1] <= 127:
+                    ENTITY.pack_into(self.buffer, offset, index, flags | FLAG_DELTA)
+                    DELTA.pack_into(self.buffer, offset + ENTITY.size, entity[0] - base[0], entity[1] - base[1])
+                    offset += ENTITY.size + DELTA.size
+                else:
+                    ENTITY.pack_into(self.buffer, offset, index, flags)
+                    FULL.pack_into(self.buffer, offset + ENTITY.size, entity[0], entity[1])
+                    offset += ENTITY.size + FULL.size
+
+            HEADER.pack_into(self.buffer, 0, SERVER_INDEX, 2, SNAPSHOT_VERSION, frame, baseFrame, chunk, chunks, len(batch), inputSequence, min(sinceInput, 255), self.index)
+            self.bytes += offset
+            yield self.view[:offset]
+
+
+class SnapshotDecoder:
+    # ? Client side counterpart, rebuilds the full world state from chunks and deltas
+    def __init__(self, history: int = 64):
+        self.history = history
+        self.states: Dict[int, Dict[int, EntityState]] = {}  # ? Complete frames, oldest first
+        self.partial: Dict[int, Tuple[Dict[int, EntityState], Set[int], int]] = {}
+        self.latest = -1
+
+    def decode(self, b, offset: int = 0) -> Optional[Tuple[int, Dict[int, EntityState], int, int, int]]:
+        # ? Returns (frame, state, input sequence, ticks since input, recipient index) once every chunk of a frame
+        # ? newer than the latest one has arrived
+        # * b can be a memoryview over a reused receive buffer, nothing here keeps a reference to it
+        _, _, version, frame, baseFrame, chunk, chunks, count, inputSequence, sinceInput, recipient = HEADER.unpack_from(b, offset)
+        if version != SNAPSHOT_VERSION or frame <= self.latest:
+            return None
+
+        partial = self.partial.get(frame)
+        if partial is None:
+            if baseFrame == NO_BASELINE:
+                state = {}
+            elif baseFrame in self.states:
+                state = dict(self.states[baseFrame])
+            else:  # ? Baseline's gone, the server will fall back to a full snapshot once it stops getting acks
+                return None
+            partial = (state, set(), chunks)
+            self.partial[frame] = partial
+        state, received, _ = partial
+        if chunk in received:
+            return None
+        received.add(chunk)
+
+        offset += HEADER.size
+        for _ in range(count):
+            index, flags = ENTITY.unpack_from(b, offset)
+            offset += ENTITY.size
+            if flags & FLAG_REMOVED:
+                state.pop(index, None)
+            elif flags & FLAG_DELTA:
+                dx, dy = DELTA.unpack_from(b, offset)
+                offset += DELTA.size
+                base = state.get(index, (0, 0, False))
+                state[index] = (base[0] + dx, base[1] + dy, bool(flags & FLAG_DEAD))
+            else:
+                x, y = FULL.unpack_from(b, offset)
+                offset += FULL.size
+                state[index] = (x, y, bool(flags & FLAG_DEAD))
+
+        if len(received) != chunks:
+            return None
+
+        del self.partial[frame]
+        for stale in [f for f in self.partial.keys() if f < frame]:
+            del self.partial[stale]
+        self.states[frame] = state
+        while len(self.states) > self.history:
+            del self.states[next(iter(self.states))]
+        self.latest = frame
+        return frame, state, inputSequence, sinceInput, recipient
+
+
+# ? Input as Bytes Protocol Description:
+# ? Max buffer size: MAX_PACKET Bytes
+# ? [1 Byte (int) Packet Type 6] | [1 Byte (int) frame count] | frames...
+# ? Frame: [4 Bytes (int) sequence] | [1 Byte buttons] | [1 Byte (int) velocity count] | count * Velocity (17 Bytes, see Velocity.toBytes)
+# ? The sequence is the sender's tick, every tick makes a frame (empty ones included) so the receiver can play
+# ? them back on the same ticks they were made on, see InputReceiver
+# * Every packet repeats the frames that haven't been acknowledged yet (up to a few sends each)
+# * so a lost packet gets covered by the next one instead of being retransmitted
+
+# ? Input Ack as Bytes Protocol Description:
+# ? Buffer size: 7 Bytes
+# ? [1 Byte SERVER_INDEX] | [1 Byte (int) Packet Type 7] | [4 Bytes (int) sequence] | [1 Byte padding]
+
+INPUT_HEADER = struct.Struct("!BB")
+INPUT_FRAME = struct.Struct("!IBB")
+INPUT_ACK = struct.Struct("!BBIx")
+
+# ? Ticks of jitter buffer InputReceiver keeps on top of the wait for the next packet, one send interval (~5 ticks)
+# ? of slack means a single lost packet still gets covered by the next one in time
+INPUT_DELAY = 6
+INPUT_WINDOW = 1024  # ? Frames further ahead than this get dropped rather than buffered
+
+# ? Buttons a frame can carry, everything that isn't a velocity but still has to happen on the same tick
+BUTTON_FIRE = 1
+
+
+def inputAckToBytes(sequence: int) -> bytes:
+    return INPUT_ACK.pack(SERVER_INDEX, 7, sequence)
+
+
+def inputAckFromBytes(b, offset=0) -> int:
+    return INPUT_ACK.unpack_from(b, offset)[2]
+
+
+class InputSender:
+    # ? Collects every velocity added during a tick into one frame stamped with that tick and sends
+    # ? the pending frames at a fixed rate no matter how fast the game is rendering
+    def __init__(self, sendRate: float, redundancy: int = 3):
+        self.interval = 1 / sendRate
+        self.redundancy = redundancy
+        self.buffer = bytearray(MAX_PACKET)
+        self.view = memoryview(self.buffer)
+
+        self.current: List[bytes] = []
+        self.buttons = 0
+        self.pending: List[List] = []  # ? [sequence, buttons, velocities, times sent], oldest first
+        self.acked = -1
+        self.lastSend = 0.0
+        self.packets = 0
+
+    def add(self, vel):  # ? Meant to be used as addForce's callback
+        data = vel.toBytes()
+        self.current.append(data)  # * Stored as bytes since pooled velocities get reused
+        # * The receiver only ever sees the 32 bit floats that went over the wire, so that's what gets applied here too,
+        # * otherwise the two copies slowly drift apart in the last few bits
+        x, y, maxSpeed, falloff, persistent = VELOCITY_STRUCT.unpack(data)
+        vel.reset(x, y, falloff, persistent, maxSpeed)
+
+    def press(self, buttons: int):  # ? Adds buttons (BUTTON_FIRE...) to this tick's frame
+        self.buttons |= buttons
+
+    def endTick(self, tick: int):  # ? Closes the frame for tick, empty or not
+        self.pending.append([tick & 0xFFFFFFFF, self.buttons, self.current, 0])
+        self.current = []
+        self.buttons = 0
+
+    def ack(self, sequence: int):
+        self.acked = max(self.acked, sequence)
+        self.pending = [frame for frame in self.pending if frame[0] > self.acked]
+
+    def due(self, now: float) -> bool:
+        return len(self.pending) != 0 and now - self.lastSend >= self.interval
+
+    def packet(self, now: float) -> memoryview:
+        # * The newest frames matter most, so if they don't all fit it's the oldest that get left out
+        offset = MAX_PACKET
+        count = 0
+        for frame in reversed(self.pending):
+            size = INPUT_FRAME.size + sum(len(vel) for vel in frame[2])
+            if offset - size < INPUT_HEADER.size or count == 255:
+                break
+            offset -= size
+            INPUT_FRAME.pack_into(self.buffer, offset, frame[0], frame[1], len(frame[2]))
+            velOffset = offset + INPUT_FRAME.size
+            for vel in frame[2]:
+                self.buffer[velOffset:velOffset + len(vel)] = vel
+                velOffset += len(vel)
+            frame[3] += 1
+            count += 1
+
+        # ? Frames were written back to front, so the header goes right before the oldest one
+        offset -= INPUT_HEADER.size
+        INPUT_HEADER.pack_into(self.buffer, offset, 6, count)
+
+        self.pending = [frame for frame in self.pending if frame[3] < self.redundancy]
+        self.lastSend = now
+        self.packets += 1
+        return self.view[offset:]
+
+
+class InputReceiver:
+    # ? Jitter buffer for one sender's frames, they get played back one per tick at a fixed offset from the sender's
+    # ? ticks (set off the first frame that shows up, `delay` ticks behind it) so the copy here gets every input on
+    # ? the same tick the sender's own copy did, no matter how packets happened to bunch up on the way
+    # * A frame that's still missing when its tick comes up gets played as empty if anything newer made it (it was lost),
+    # * otherwise playback stalls a tick to wait for it, and when frames keep showing up with time to spare it catches back up
+    def __init__(self, delay: int = INPUT_DELAY, window: int = 288):
+        self.delay = delay
+        self.window = window  # ? Ticks between catch up checks
+        self.frames: Dict[int, Tuple[int, List[Velocity]]] = {}  # ? Sender tick -> (buttons, velocities), waiting to be played
+        self.lastSequence = -1  # ? Newest frame received, acked back to the sender
+        self.nextSequence = None  # ? Sender tick that gets played next, None until the first frame shows up
+        self.offset = 0  # ? Local tick minus the sender tick played on it
+
+        self.ticks = 0
+        self.windowTicks = 0
+        self.windowSlack = None  # ? Fewest ticks any frame had to spare since the last catch up check
+
+        # ? Which input was last played and how many ticks ago, reported back to the sender for reconciliation
+        self.appliedSequence = NO_INPUT
+        self.appliedTick = 0
+
+        self.missed = 0  # ? Frames that weren't there in time and got played as empty
+        self.stalls = 0
+
+    def receive(self, b, offset: int = 0) -> int:  # ? Returns how many new frames were in the packet
+        _, count = INPUT_HEADER.unpack_from(b, offset)
+        offset += INPUT_HEADER.size
+
+        frames = []
+        for _ in range(count):
+            sequence, buttons, velCount = INPUT_FRAME.unpack_from(b, offset)
+            offset += INPUT_FRAME.size
+            frames.append((sequence, buttons, [velocityFromBytes(b, offset + i * VELOCITY_STRUCT.size) for i in range(velCount)]))
+            offset += velCount * VELOCITY_STRUCT.size
+        if len(frames) == 0:
+            return 0
+
+        if self.nextSequence is None:  # ? Frames are oldest first, the first one sets how far behind the sender playback runs
+            self.nextSequence = frames[0][0]
+            self.offset = self.ticks + 1 + self.delay - self.nextSequence
+
+        new = 0
+        for sequence, buttons, vels in frames:
+            if sequence < self.nextSequence or sequence in self.frames or sequence - self.nextSequence >= INPUT_WINDOW:
+                continue
+            self.frames[sequence] = (buttons, vels)
+            self.lastSequence = max(self.lastSequence, sequence)
+            slack = sequence + self.offset - (self.ticks + 1)
+            if self.windowSlack is None or slack < self.windowSlack:
+                self.windowSlack = slack
+            new += 1
+        return new
+
+    def feed(self, obj: Optional[SpaceObject], maxImpulse: float = math.inf, minFalloff: float = 0.0, maxSpeed: float = math.inf,
+             onButtons: Callable[[int, int], None] = lambda sequence, buttons: None):
+        # ? Called once per tick, before the game ticks, every velocity gets reined in with Velocity.limit on the way
+        # ? and onButtons(sequence, buttons) gets called for frames with buttons held, obj can be None to only play buttons
+        self.ticks += 1
+        if self.nextSequence is None:
+            return
+
+        self.windowTicks += 1
+        if self.windowTicks >= self.window:
+            # * Catching up throws the copy here a tick off from the sender (a correction on their end), so it waits
+            # * until the buffer's well past where it should be rather than chasing every tick of slack
+            if self.windowSlack is not None and self.windowSlack > self.delay + self.delay // 2:
+                self.offset -= 1  # ? Two frames get played on this tick
+            self.windowTicks = 0
+            self.windowSlack = None
+
+        while self.nextSequence + self.offset <= self.ticks:
+            sequence = self.nextSequence
+            frame = self.frames.pop(sequence, None)
+            if frame is None:
+                if self.lastSequence < sequence:
+                    self.offset += 1
+                    self.stalls += 1
+                    break
+                self.missed += 1
+                frame = (0, [])
+
+            self.nextSequence += 1
+            self.appliedSequence = sequence
+            self.appliedTick = self.ticks
+            buttons, vels = frame
+            if obj is not None:
+                if obj.isDead:
+                    continue
+                for vel in vels:
+                    if vel.limit(maxImpulse, minFalloff, maxSpeed):
+                        obj.addForce(vel)
+            if buttons != 0:
+                onButtons(sequence, buttons)
+
+    def sinceApplied(self) -> int:
+        return self.ticks - self.appliedTick
+
+
+# ? Peer State as Bytes Protocol Description:
+# ? Buffer size: 10 Bytes
+# ? [1 Byte (int) Packet Type 8] | [4 Bytes (int) frame] | [2 Bytes (int) X * QUANTIZE] | [2 Bytes (int) Y * QUANTIZE] | [1 Byte (Bool) dead]
+# * Only sent when playing through the relay, it's what peers interpolate each other from since there's no server snapshot
+
+PEER_STATE = struct.Struct("!BIHH?")
+
+# ? Player Join as Bytes Protocol Description:
+# ? Buffer size: 25 Bytes
+# ? [1 Byte (int) Packet Type 0] | [20 Bytes SpaceObject (see SpaceObject.toBytes)] | [4 Bytes (int) room]
+# * The relay only looks at the room on the first packet it gets from a client, older clients leave it out and get room 0
+
+# ? Heartbeat as Bytes Protocol Description:
+# ? Buffer size: 1 Byte
+# ? [1 Byte (int) Packet Type 9]
+# * Sent whenever a client has gone HEARTBEAT_INTERVAL without sending anything else, the server evicts silent clients
+
+ROOM_STRUCT = struct.Struct("!I")
+HEARTBEAT = b"\x09"
+HEARTBEAT_INTERVAL = 1.0
+
+# ? A join that never got an index back (a Welcome or a snapshot) gets sent again this often, up to JOIN_ATTEMPTS times in all
+# * The relay never hands out indices, so relay games just send a few harmless extra joins
+JOIN_INTERVAL = 1.0
+JOIN_ATTEMPTS = 5
+
+
+def joinToBytes(player: SpaceObject, room: int = 0) -> bytes:
+    return b"\x00" + player.toBytes() + ROOM_STRUCT.pack(room)
+
+
+class Predictor:
+    # ? Ring buffer of where the local player was predicted to be every tick, when the server says where it
+    # ? actually was at one of those ticks the difference gets eased back in over the next few ticks
+    def __init__(self, size: int = 256, smoothing: float = 0.2, tolerance: float = 0.5):
+        self.size = size
+        self.smoothing = smoothing
+        self.tolerance = tolerance  # ? Errors under this many pixels are just quantization, not worth correcting
+
+        self.states: List[Optional[Tuple[int, float, float]]] = [None] * size  # ? (tick, X, Y)
+        self.correction = [0.0, 0.0]
+        self.errors = collections.deque(maxlen=size)
+        self.corrections = 0  # ? Every reconcile that found an error, errors only keeps the last few
+
+    def record(self, tick: int, pos):
+        # * Recorded with the pending correction included so ticks that are still easing in don't get corrected twice
+        self.states[tick % self.size] = (tick, pos[0] + self.correction[0], pos[1] + self.correction[1])
+
+    def reconcile(self, sequence: int, sinceInput: int, pos) -> float:  # ? Returns the size of the error in pixels
+        # ? Input sequences are the ticks they were made on, so the server's state lines up with tick sequence + sinceInput
+        target = sequence + sinceInput
+        state = self.states[target % self.size]
+        if state is None or state[0] != target:
+            return 0.0
+
+        ex = pos[0] - state[1]
+        ey = pos[1] - state[2]
+        if abs(ex) < self.tolerance and abs(ey) < self.tolerance:
+            return 0.0
+
+        self.correction[0] += ex
+        self.correction[1] += ey
+        for i, state in enumerate(self.states):  # ? Everything from then on was predicted off the wrong position as well
+            if state is not None and state[0] >= target:
+                self.states[i] = (state[0], state[1] + ex, state[2] + ey)
+
+        error = math.hypot(ex, ey)
+        self.errors.append(error)
+        self.corrections += 1
+        return error
+
+    def correct(self, obj: SpaceObject):  # ? Called once per tick before record()
+        if self.correction[0] == 0 and self.correction[1] == 0:
+            return
+        if abs(self.correction[0]) < self.tolerance and abs(self.correction[1]) < self.tolerance:
+            dx, dy = self.correction
+        else:
+            dx = self.correction[0] * self.smoothing
+            dy = self.correction[1] * self.smoothing
+        obj.pos[0] += dx
+        obj.pos[1] += dy
+        self.correction[0] -= dx
+        self.correction[1] -= dy
+
+
+class Interpolator:
+    # ? Buffers the last few known states of every remote entity and renders them slightly in the past,
+    # ? in between two of those states, so how smooth they look doesn't depend on when packets show up
+    def __init__(self, tickRate: float, delay: float = 0.1, size: int = 32):
+        self.tickRate = tickRate
+        self.delay = delay
+        self.size = size
+        self.history: Dict[int, collections.deque] = {}  # ? Index -> (remote time, X, Y, dead), oldest first
+        self.offsets: Dict[int, float] = {}  # ? Index -> estimated remote clock minus local clock
+
+    def push(self, index: int, frame: int, x: float, y: float, dead: bool, now: float):
+        remoteTime = frame / self.tickRate
+        history = self.history.get(index)
+        if history is None:
+            history = collections.deque(maxlen=self.size)
+            self.history[index] = history
+        elif len(history) != 0 and remoteTime <= history[-1][0]:
+            return  # ? Out of order or duplicate
+        history.append((remoteTime, x, y, dead))
+
+        # * The least delayed packet gives the best estimate of the clock offset, so the estimate jumps
+        # * forward straight away but only drifts back slowly (for when the remote clock restarts or lags)
+        offset = remoteTime - now
+        current = self.offsets.get(index)
+        if current is None or offset > current:
+            self.offsets[index] = offset
+        else:
+            self.offsets[index] = current + (offset - current) * 0.01
+
+    def has(self, index: int) -> bool:
+        return index in self.history
+
+    def remove(self, index: int):
+        self.history.pop(index, None)
+        self.offsets.pop(index, None)
+
+    def renderTime(self, index: int, now: float) -> float:  # ? The remote time an entity gets drawn at right now
+        return now + self.offsets[index] - self.delay
+
+    def sample(self, index: int, now: float) -> Optional[Tuple[float, float, bool]]:
+        history = self.history.get(index)
+        if history is None or len(history) == 0:
+            return None
+        t = self.renderTime(index, now)
+
+        if t <= history[0][0]:
+            return history[0][1], history[0][2], history[0][3]
+        if t >= history[-1][0]:  # ? Out of buffered states, hold the newest instead of guessing
+            return history[-1][1], history[-1][2], history[-1][3]
+
+        for i in range(len(history) - 1, 0, -1):
+            before = history[i - 1]
+            if before[0] <= t:
+                after = history[i]
+                amount = (t - before[0]) / (after[0] - before[0])
+                return (
+                    before[1] + (after[1] - before[1]) * amount,
+                    before[2] + (after[2] - before[2]) * amount,
+                    after[3] if amount >= 1 else before[3]
+                )
+        return history[0][1], history[0][2], history[0][3]
+
+
+class Inbox:
+    # ? Hand-off between the receive thread and the main loop, the receive thread only ever copies packets in
+    # ? and the main loop drains them all at one point every frame, so nothing touches the game mid-tick
+    # * deque.append and deque.popleft are atomic, no lock is needed with one producer and one consumer
+    def __init__(self, maxSize: int = 1024):
+        self.packets = collections.deque(maxlen=maxSize)  # ? (received at, packet), the oldest gets pushed out when full
+        self.maxSize = maxSize
+        self.received = 0
+        self.dropped = 0
+
+        self.depth = 0  # ? Packets waiting at the start of the last drain
+        self.maxDepth = 0
+        self.drainTime = 0.0  # ? Seconds the last drain took
+        self.maxDrainTime = 0.0
+
+    def push(self, packet: bytes, now: float):
+        if len(self.packets) == self.maxSize:
+            self.dropped += 1
+        self.packets.append((now, packet))
+        self.received += 1
+
+    def drain(self, handler: Callable[[bytes, float], None]) -> int:  # ? Returns how many packets got handled
+        start = time.perf_counter()
+        # * Only what's queued right now gets handled, packets arriving mid-drain wait for the next frame
+        count = len(self.packets)
+        self.depth = count
+        self.maxDepth = max(self.maxDepth, count)
+        for _ in range(count):
+            now, packet = self.packets.popleft()
+            handler(packet, now)
+        self.drainTime = time.perf_counter() - start
+        self.maxDrainTime = max(self.maxDrainTime, self.drainTime)
+        return count
+
+    def __str__(self):
+        return f"Inbox depth {self.depth} (max {self.maxDepth}), drain {self.drainTime * 1000:.2f}ms (max {self.maxDrainTime * 1000:.2f}ms), dropped {self.dropped}/{self.received}"
+
+
+class NetClient:
+    # ? Everything the network client does with packets that doesn't need pygame or a socket,
+    # ? NetworkController wraps it with a real socket and netharness.py with a simulated one
+    def __init__(self, tickRate: float, sendRate: float, redundancy: int = 3, delay: float = 0.1):
+        self.index = None  # ? Only ever known when playing on an authoritative server
+        self.ownDead = False
+        self.ownPos = (0.0, 0.0)  # ? Where the server last had the local player
+
+        self.inputs = InputSender(sendRate, redundancy)
+        self.decoder = SnapshotDecoder()
+        self.predictor = Predictor()
+        self.interpolator = Interpolator(tickRate, delay)
+        self.peerInputs: Dict[int, InputReceiver] = {}
+        self.lastPeerState = 0.0
+        self.lastSent = 0.0
+
+        self.room = 0
+        self.joins = 0
+        self.lastJoin = 0.0
+
+    def join(self, player: SpaceObject, room: int, now: float) -> bytes:  # ? Packet Type 0: Player Join, endTick resends it if it got lost
+        self.room = room
+        self.joins = 1
+        self.lastJoin = now
+        return joinToBytes(player, room)
+
+    def receive(self, b, now: float) -> Optional[bytes]:
+        # ? Handles server packets (prefixed with SERVER_INDEX) and relayed input/peer state packets,
+        # ? returns a reply that has to be sent back to the server if there is one
+        if b[0] == SERVER_INDEX:
+            if b[1] == 2:
+                snapshot = self.decoder.decode(b)
+                if snapshot is None:
+                    return None
+                frame, state, inputSequence, sinceInput, recipient = snapshot
+                if recipient != SERVER_INDEX:
+                    self.index = recipient
+                for index, (x, y, dead) in state.items():
+                    if self.index is not None and bulletOwner(index) == self.index:
+                        continue  # ? Own bullets are already on screen, shoot() shows them straight away
+                    if index == self.index:
+                        # * Nothing to reconcile once the server says it's dead, the player just gets put where it died
+                        if inputSequence != NO_INPUT and not dead:
+                            self.predictor.reconcile(inputSequence, sinceInput, (x / QUANTIZE, y / QUANTIZE))
+                        self.ownDead = dead
+                        self.ownPos = (x / QUANTIZE, y / QUANTIZE)
+                    else:
+                        self.interpolator.push(index, frame, x / QUANTIZE, y / QUANTIZE, dead, now)
+                # ? Anything the server stopped sending has left the game (players that quit, bullets past their death frames)
+                for index in [index for index in self.interpolator.history.keys() if index not in state]:
+                    self.remove(index)
+                return ackToBytes(frame)  # ? Packet Type 5: Snapshot Ack
+            elif b[1] == 3:
+                self.index = b[2]
+            elif b[1] == 7:
+                self.inputs.ack(inputAckFromBytes(b))
+        elif b[1] == 6:
+            self.peerInputs.setdefault(b[0], InputReceiver()).receive(b, 1)
+        elif b[1] == 8:
+            _, frame, x, y, dead = PEER_STATE.unpack_from(b, 1)
+            self.interpolator.push(b[0], frame, x / QUANTIZE, y / QUANTIZE, dead, now)
+        return None
+
+    def endTick(self, player: SpaceObject, frame: int, now: float) -> List:
+        # ? Called right after the local game ticks, returns the packets that are due to be sent
+        self.inputs.endTick(frame)
+        self.predictor.correct(player)
+        self.predictor.record(frame, player.pos)
+
+        packets = []
+        if self.index is None and 0 < self.joins < JOIN_ATTEMPTS and now - self.lastJoin >= JOIN_INTERVAL:
+            packets.append(joinToBytes(player, self.room))  # ? From wherever the player is now, not where it first joined
+            self.joins += 1
+            self.lastJoin = now
+        if self.inputs.due(now):
+            packets.append(bytes(self.inputs.packet(now)))  # ? Packet Type 6: Input
+        if self.index is None and now - self.lastPeerState >= self.inputs.interval:  # ? Packet Type 8: Peer State
+            packets.append(PEER_STATE.pack(8, frame, *quantize(player.pos), player.isDead))
+            self.lastPeerState = now
+        if len(packets) == 0 and now - self.lastSent >= HEARTBEAT_INTERVAL:  # ? Packet Type 9: Heartbeat
+            packets.append(HEARTBEAT)
+        if len(packets) != 0:
+            self.lastSent = now
+        return packets
+
+    def remove(self, index: int):  # ? Forgets everything about a peer that quit (or got evicted by the relay) or a bullet that's gone
+        self.interpolator.remove(index)
+        self.peerInputs.pop(index, None)
+
+    def sample(self, index: int, now: float) -> Optional[Tuple[float, float, bool]]:
+        return self.interpolator.sample(index, now)
@@ -0,0 +1,251 @@
+# ? Deterministic netcode test harness, runs an authoritative server and a couple of bot clients in
+# ? simulated time with every packet going through LossyLink, a stand-in for UDP that delays, jitters
+# ? and drops packets off a seeded RNG, so the same settings always give the same numbers
+# ? Every scenario gets checked against LIMITS and the exit code is 1 if any of them went over, it's the
+# ? netcode's regression check
+# ?   python netharness.py [seconds per scenario]
+
+import heapq
+import math
+import os
+import random
+import sys
+from typing import *
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from assets import AssetManager
+from core import *
+from netcode import *
+from server import DEATH_FRAMES, FIRE_INTERVAL, MAX_SPEED, SCR_DIMENSIONS, SNAPSHOT_RATE, TICK_RATE, AuthoritativeServer
+
+SERVER_ADDR = ("127.0.0.1", 9000)
+
+# ? (name, latency in seconds, jitter in seconds, loss chance)
+SCENARIOS = [
+    ("LAN", 0.0, 0.0, 0.0),
+    ("Broadband", 0.04, 0.01, 0.01),
+    ("Wifi", 0.08, 0.03, 0.05),
+    ("Mobile", 0.15, 0.06, 0.15),
+]
+
+# ? Scenario -> metric -> the most it's allowed to be, tuned on the default 20 seconds with some headroom
+# * A clean link has to predict perfectly, on the lossy ones a correction only comes from an input that
+# * was lost outright or a jitter spike stalling the server's playback, so there can't be many of them
+LIMITS = {
+    "LAN": {"correctionsPerMinute": 0, "inputLatencyP95": 0.1, "remoteErrorP95": 2.0},
+    "Broadband": {"correctionsPerMinute": 6, "correctionMax": 10, "inputLatencyP95": 0.16, "remoteErrorP95": 2.0},
+    "Wifi": {"correctionsPerMinute": 30, "correctionMax": 25, "inputLatencyP95": 0.25, "remoteErrorP95": 2.5},
+    "Mobile": {"correctionsPerMinute": 180, "correctionMax": 40, "inputLatencyP95": 0.45, "remoteErrorP95": 4.0},
+}
+
+
+class LossyLink:
+    # ? Every datagram gets delivered after latency + some random jitter, or gets dropped altogether
+    def __init__(self, rng: random.Random, latency: float, jitter: float, loss: float):
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.now = 0.0
+        self.inFlight = []
+        self.count = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, data, src, dst):
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        deliverAt = self.now + self.latency + self.rng.uniform(0, self.jitter)
+        heapq.heappush(self.inFlight, (deliverAt, self.count, bytes(data), src, dst))
+        self.count += 1
+
+    def deliver(self) -> List[Tuple[bytes, Tuple[str, int], Tuple[str, int]]]:
+        due = []
+        while len(self.inFlight) != 0 and self.inFlight[0][0] <= self.now:
+            _, _, data, src, dst = heapq.heappop(self.inFlight)
+            due.append((data, src, dst))
+        return due
+
+
+class LinkTransport:  # ? What AuthoritativeServer gets instead of an asyncio transport
+    def __init__(self, link: LossyLink, addr):
+        self.link = link
+        self.addr = addr
+
+    def sendto(self, data, addr):
+        self.link.send(data, self.addr, addr)
+
+
+class BotClient:
+    # ? Headless stand-in for NetworkController, same NetClient but inputs come from a seeded RNG
+    def __init__(self, addr, pos, rng: random.Random, assets: AssetManager):
+        self.addr = addr
+        self.rng = rng
+        self.net = NetClient(TICK_RATE, 30)
+        self.player = SpaceObject(
+            pos=list(pos),
+            scr=None,
+            sprite=assets.image("player.png"),
+            dead=assets.image("player_death.png"),
+            velocityQueue=[],
+            maxVelStack=1,
+            maxVelSpeed=MAX_SPEED,
+            onWallCollided=self.limitPlayers,
+            onCollision=lambda obj, target: None,
+            givenID="Player",
+            velocityFalloff=0.1,
+            wallMode=WALL_CLAMP
+        )
+        self.game = Game(None, [self.player], DEATH_FRAMES)
+        self.direction = (0, 0)
+        self.firing = False
+
+    def limitPlayers(self, obj):
+        obj.pos[0] = clamp(obj.pos[0], 0, SCR_DIMENSIONS[0])
+        obj.pos[1] = clamp(obj.pos[1], 0, SCR_DIMENSIONS[1])
+
+    def tick(self, link: LossyLink):
+        # ? Same impulse GenericController makes for a held arrow key, with the direction changing now and then,
+        # ? and the fire key held down every so often (only the server has the bullets, same as a real client)
+        if self.net.ownDead and self.player.isDead == False:
+            self.player.pos = list(self.net.ownPos)
+            self.game.kill(self.player)
+        if self.rng.random() < 1 / 60:
+            self.direction = self.rng.choice([(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)])
+        if self.rng.random() < 1 / 120:
+            self.firing = not self.firing
+        if self.firing and self.game.frame % FIRE_INTERVAL == 0 and self.player.isDead == False:
+            self.net.inputs.press(BUTTON_FIRE)
+        if self.direction != (0, 0):
+            scale = 1000 / TICK_RATE
+            self.player.addForce(
+                Velocity(self.direction[0] * 0.2 * scale, self.direction[1] * 0.2 * scale, 0.1 * scale, False, MAX_SPEED),
+                self.net.inputs.add
+            )
+
+        self.game.tick()
+        for packet in self.net.endTick(self.player, self.game.frame, link.now):
+            link.send(packet, self.addr, SERVER_ADDR)
+
+
+def truthAt(history: List[Tuple[float, float]], frame: float) -> Optional[Tuple[float, float]]:
+    # ? Where the server actually had an entity at a (fractional) frame
+    if frame < 0 or frame >= len(history) - 1:
+        return None
+    i = int(frame)
+    amount = frame - i
+    return (
+        history[i][0] + (history[i + 1][0] - history[i][0]) * amount,
+        history[i][1] + (history[i + 1][1] - history[i][1]) * amount
+    )
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if len(samples) == 0:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def runScenario(latency: float, jitter: float, loss: float, seconds: float, seed: int = 0) -> Dict[str, float]:
+    rng = random.Random(seed)
+    link = LossyLink(rng, latency, jitter, loss)
+
+    server = AuthoritativeServer(TICK_RATE, SNAPSHOT_RATE)
+    server.connection_made(LinkTransport(link, SERVER_ADDR))
+
+    assets = AssetManager()
+    bots = [
+        BotClient(("127.0.0.1", 9001), (200, 400), random.Random(seed + 1), assets),
+        BotClient(("127.0.0.1", 9002), (600, 400), random.Random(seed + 2), assets)
+    ]
+    for bot in bots:
+        link.send(bot.net.join(bot.player, 0, link.now), bot.addr, SERVER_ADDR)  # ? Packet Type 0: Player Join
+
+    history: Dict[int, List[Tuple[float, float]]] = {}
+    inputLatencies = []
+    remoteErrors = []
+    jumps = []
+    lastSample = None
+
+    for tick in range(int(seconds * TICK_RATE)):
+        link.now = tick / TICK_RATE
+
+        for data, src, dst in link.deliver():
+            if dst == SERVER_ADDR:
+                server.datagram_received(data, src)
+            else:
+                bot = bots[0] if dst == bots[0].addr else bots[1]
+                reply = bot.net.receive(memoryview(data), link.now)
+                if reply is not None:
+                    link.send(reply, bot.addr, SERVER_ADDR)
+
+        server.step()
+        for index, player in server.players.items():
+            history.setdefault(index, []).append((float(player.pos[0]), float(player.pos[1])))
+
+        for bot in bots:
+            bot.tick(link)
+
+        # ? How many ticks behind the client the server is playing its inputs (bots and server tick in lockstep here)
+        for bot in bots:
+            receiver = server.inputs.get(bot.net.index)
+            if receiver is not None and receiver.appliedSequence != NO_INPUT:
+                inputLatencies.append((bot.game.frame - receiver.appliedSequence) / TICK_RATE)
+
+        # ? How far off (and how jumpy) bot 0's view of bot 1 is, compared to where the server really had it
+        # * history[i] is the state after server frame i + 1, which is what a snapshot for frame i + 1 carries
+        remote = bots[1].net.index
+        if remote is not None and bots[0].net.interpolator.has(remote):
+            sample = bots[0].net.sample(remote, link.now)
+            frame = bots[0].net.interpolator.renderTime(remote, link.now) * TICK_RATE - 1
+            truth = truthAt(history.get(remote, []), frame - (server.game.frame - len(history[remote])))
+            if truth is not None:
+                remoteErrors.append(math.hypot(sample[0] - truth[0], sample[1] - truth[1]))
+            if lastSample is not None:
+                jumps.append(math.hypot(sample[0] - lastSample[0], sample[1] - lastSample[1]))
+            lastSample = sample
+
+    corrections = [error for bot in bots for error in bot.net.predictor.errors]
+    return {
+        "delivered": 1 - link.dropped / max(1, link.sent),
+        "correctionsPerMinute": sum(bot.net.predictor.corrections for bot in bots) / (seconds / 60),
+        "correctionMean": sum(corrections) / len(corrections) if len(corrections) != 0 else 0.0,
+        "correctionMax": max(corrections) if len(corrections) != 0 else 0.0,
+        "remoteErrorP50": percentile(remoteErrors, 0.5),
+        "remoteErrorP95": percentile(remoteErrors, 0.95),
+        "jumpMax": max(jumps) if len(jumps) != 0 else 0.0,
+        "inputLatencyP95": percentile(inputLatencies, 0.95),
+    }
+
+
+def check(name: str, result: Dict[str, float]) -> List[str]:  # ? Returns every metric that went over its limit
+    return [
+        f"{metric} {result[metric]:.3f} > {limit}"
+        for metric, limit in LIMITS.get(name, {}).items() if result[metric] > limit
+    ]
+
+
+def run(seconds: float = 20) -> bool:  # ? Returns whether every scenario stayed within its limits
+    print(f"{'scenario':>10} | {'delivered':>9} | {'corrections/min':>15} | {'correction mean/max (px)':>24} | "
+          f"{'remote error p50/p95 (px)':>25} | {'max jump (px)':>13} | {'input latency p95':>17} | result")
+    failures = []
+    for name, latency, jitter, loss in SCENARIOS:
+        result = runScenario(latency, jitter, loss, seconds)
+        failed = check(name, result)
+        failures += [f"{name}: {failure}" for failure in failed]
+        print(f"{name:>10} | {result['delivered'] * 100:>8.1f}% | {result['correctionsPerMinute']:>15.1f} | "
+              f"{result['correctionMean']:>11.2f} / {result['correctionMax']:<10.2f} | "
+              f"{result['remoteErrorP50']:>12.2f} / {result['remoteErrorP95']:<10.2f} | "
+              f"{result['jumpMax']:>13.2f} | {result['inputLatencyP95'] * 1000:>15.0f}ms | {'FAIL' if failed else 'ok'}")
+
+    for failure in failures:
+        print(failure)
+    return len(failures) == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(float(sys.argv[1]) if len(sys.argv) > 1 else 20) else 1)
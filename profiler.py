@@ -0,0 +1,219 @@
+import array
+import json
+import sys
+import time
+from typing import *
+
+# ? Chrome trace files open in chrome://tracing or ui.perfetto.dev, speedscope files in speedscope.app
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class Phase:
+    # ? Fixed size ring buffer of the last `size` timings of one named part of the frame,
+    # ? starts are kept as well as durations so the exporters can lay them out on a timeline
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.starts = array.array("d", bytes(8 * size))
+        self.durations = array.array("d", bytes(8 * size))
+        self.count = 0  # ? Total samples ever recorded, count % size is where the next one goes
+
+    def record(self, start: float, duration: float):
+        i = self.count % self.size
+        self.starts[i] = start
+        self.durations[i] = duration
+        self.count += 1
+
+    def samples(self) -> List[Tuple[float, float]]:  # ? (start, duration) of everything still in the buffer, oldest first
+        if self.count <= self.size:
+            order = range(self.count)
+        else:
+            head = self.count % self.size
+            order = list(range(head, self.size)) + list(range(head))
+        return [(self.starts[i], self.durations[i]) for i in order]
+
+    def percentiles(self, *ps: float) -> Tuple[float, ...]:  # ? Nearest rank percentiles in seconds, all 0 before the first sample
+        n = min(self.count, self.size)
+        if n == 0:
+            return tuple(0.0 for _ in ps)
+        ordered = sorted(self.durations[:n])
+        return tuple(ordered[min(n - 1, int(p / 100 * n))] for p in ps)
+
+
+class Scope:
+    # ? Context manager timing one phase, there's one per phase and it gets reused so entering it doesn't allocate
+    # * Which also means a phase can't be nested inside itself, the inner one would overwrite the start time
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase: Phase):
+        self.phase = phase
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.phase.record(self.start, end - self.start)
+        return False
+
+
+class NullScope:  # ? What a disabled profiler hands out, entering and leaving it does nothing
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class Profiler:
+    # ? Named timing scopes for the parts of a frame, used as:
+    # ?   with profiler.scope("physics"):
+    # ?       game.tick()
+    # * While disabled scope() is a single attribute check returning NULL_SCOPE, nothing gets timed or stored
+    def __init__(self, enabled: bool = False, size: int = 1024):
+        self.enabled = enabled
+        self.size = size
+        self.phases: Dict[str, Phase] = {}
+        self.scopes: Dict[str, Scope] = {}
+        self.origin = time.perf_counter()  # ? Exported timestamps are relative to this
+
+    def scope(self, name: str):
+        if not self.enabled:
+            return NULL_SCOPE
+        scope = self.scopes.get(name)
+        if scope is None:
+            phase = Phase(name, self.size)
+            self.phases[name] = phase
+            scope = self.scopes[name] = Scope(phase)
+        return scope
+
+    def toggle(self) -> bool:
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def reset(self):
+        self.phases.clear()
+        self.scopes.clear()
+        self.origin = time.perf_counter()
+
+    def stats(self) -> Dict[str, Tuple[float, float, float]]:  # ? p50, p95 and p99 of every phase, in seconds
+        return {name: phase.percentiles(50, 95, 99) for name, phase in self.phases.items()}
+
+    def intervals(self) -> List[Tuple[float, float, str]]:
+        # ? (start, end, phase) in microseconds since origin for every buffered sample, sorted so
+        # ? enclosing phases come before whatever ran inside them
+        result = []
+        for name, phase in self.phases.items():
+            for start, duration in phase.samples():
+                begin = (start - self.origin) * 1e6
+                result.append((begin, begin + duration * 1e6, name))
+        result.sort(key=lambda interval: (interval[0], -interval[1]))
+        return result
+
+    def chromeTrace(self) -> dict:
+        return {
+            "traceEvents": [
+                {"name": name, "ph": "X", "ts": start, "dur": end - start, "pid": 0, "tid": 0}
+                for start, end, name in self.intervals()
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def speedscope(self, title: str = "Blastar Remastered") -> dict:
+        # * Speedscope's evented profiles have to nest perfectly, a phase that starts inside
+        # * another one but outlives it (shouldn't happen, but timers aren't perfect) gets cut off at its parent's end
+        names = list(self.phases.keys())
+        frameIndex = {name: i for i, name in enumerate(names)}
+
+        events = []
+        stack: List[Tuple[float, int]] = []  # ? (end, frame) of every phase that's still open
+        start = end = 0.0
+        for i, (begin, finish, name) in enumerate(self.intervals()):
+            if i == 0:
+                start = begin
+            while len(stack) != 0 and stack[-1][0] <= begin:
+                at, frame = stack.pop()
+                events.append({"type": "C", "frame": frame, "at": at})
+            if len(stack) != 0:
+                finish = min(finish, stack[-1][0])
+            events.append({"type": "O", "frame": frameIndex[name], "at": begin})
+            stack.append((finish, frameIndex[name]))
+            end = max(end, finish)
+        while len(stack) != 0:
+            at, frame = stack.pop()
+            events.append({"type": "C", "frame": frame, "at": at})
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": [{"name": name} for name in names]},
+            "profiles": [{
+                "type": "evented",
+                "name": title,
+                "unit": "microseconds",
+                "startValue": start,
+                "endValue": end,
+                "events": events,
+            }],
+            "name": title,
+            "exporter": "blastar-profiler",
+        }
+
+    def export(self, path: str) -> Tuple[str, str]:
+        # ? Writes <path>.trace.json (Chrome trace) and <path>.speedscope.json, returns both file names
+        tracePath = f"{path}.trace.json"
+        speedscopePath = f"{path}.speedscope.json"
+        with open(tracePath, "w") as f:
+            json.dump(self.chromeTrace(), f)
+        with open(speedscopePath, "w") as f:
+            json.dump(self.speedscope(), f)
+        return tracePath, speedscopePath
+
+
+class ProfilerOverlay:
+    # ? Puts a line per phase with its p50/p95/p99 onto a Renderer's HUD, the percentiles only get
+    # ? recomputed every `every` frames since sorting every ring buffer each frame would show up in the profile
+    def __init__(self, profiler: Profiler, pos: Tuple[int, int], lineHeight: int, every: int = 30):
+        self.profiler = profiler
+        self.pos = pos
+        self.lineHeight = lineHeight
+        self.every = every
+        self.frame = 0
+        self.lines: List[str] = []
+
+    def label(self, renderer, color: Tuple[int, int, int] = (0, 0, 0)):
+        if not self.profiler.enabled:
+            return
+        if self.frame % self.every == 0:
+            self.lines = [
+                f"{name} {p50 * 1000:.2f} / {p95 * 1000:.2f} / {p99 * 1000:.2f} ms"
+                for name, (p50, p95, p99) in self.profiler.stats().items()
+            ]
+        self.frame += 1
+
+        renderer.label(("profiler", -1), "phase p50 / p95 / p99", self.pos, color)
+        for i, line in enumerate(self.lines):
+            renderer.label(("profiler", i), line, (self.pos[0], self.pos[1] + self.lineHeight * (i + 1)), color)
+
+
+class StartupTimer:
+    # ? Milestones of a launch (menu printed, first frame drawn...) relative to origin, only the first mark of each name counts
+    # * report() also prints the raw perf_counter() of every mark, that clock is system wide so benchmarks.startup
+    # * can measure from before the process even existed
+    def __init__(self, origin: float):
+        self.origin = origin
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter()
+
+    def report(self, out=None):
+        for name, at in self.marks.items():
+            print(f"startup {name} {(at - self.origin) * 1000:.1f}ms {at:.6f}", file=sys.stderr if out is None else out)
@@ -0,0 +1,170 @@
+from typing import *
+
+import pygame
+
+from core import SpaceObject
+from profiler import Profiler
+
+
+def hudFont(size: int) -> pygame.font.Font:
+    # ? pygame's default font, starting the font module on first use
+    # * Same font SysFont(None, size) ends up with, minus the scan of every font installed on the system it does first
+    if not pygame.font.get_init():
+        pygame.font.init()
+    return pygame.font.Font(None, size)
+
+
+class TextCache:
+    # ? font.render is slow, and the HUD mostly shows the same few strings over and over
+    def __init__(self, font: pygame.font.Font, maxSize: int = 256):
+        self.font = font
+        self.maxSize = maxSize
+        self.surfaces: Dict[Tuple[str, Tuple[int, int, int]], pygame.Surface] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text: str, color: Tuple[int, int, int]) -> pygame.Surface:
+        key = (text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        if len(self.surfaces) >= self.maxSize:  # ? Not worth an LRU, the FPS counter only ever cycles through a few hundred values
+            self.surfaces.clear()
+        surface = self.font.render(text, True, color)
+        self.surfaces[key] = surface
+        return surface
+
+
+class FrameBlend:
+    # ? Remembers where everything was before the latest simulation step, frames drawn in between two steps
+    # ? get every object at a blend of its last two positions (see FixedTimestep.alpha) so motion stays smooth
+    # ? when the display runs faster or slower than the simulation
+    def __init__(self, snapDistance: float = 64):
+        self.previous: Dict[SpaceObject, Tuple[float, float]] = {}
+        self.alpha = 1.0
+        self.snapDistance = snapDistance  # ? Anything that moved further than this in one step teleported, it doesn't get blended
+
+    def capture(self, objs: List[SpaceObject]):  # ? Called right before the step that'll be drawn next
+        self.previous = {obj: (obj.pos[0], obj.pos[1]) for obj in objs}
+
+    def position(self, obj: SpaceObject) -> Tuple[float, float]:
+        pos = obj.pos
+        last = self.previous.get(obj)
+        if last is None:  # ? Spawned during the step
+            return pos
+        return self.between(last, pos)
+
+    def between(self, last: Tuple[float, float], pos: Tuple[float, float]) -> Tuple[float, float]:  # ? alpha of the way from last to pos
+        dx = pos[0] - last[0]
+        dy = pos[1] - last[1]
+        if abs(dx) > self.snapDistance or abs(dy) > self.snapDistance:
+            return pos
+        return (last[0] + dx * self.alpha, last[1] + dy * self.alpha)
+
+
+class Renderer:
+    # ? Dirty rectangle renderer, only the parts of the screen where something moved, changed sprite,
+    # ? appeared or disappeared get erased and pushed to the display
+    def __init__(self, screen: pygame.Surface, background: Tuple[int, int, int], font: pygame.font.Font, fullUpdateRatio: float = 0.5, profiler: Optional[Profiler] = None):
+        self.screen = screen
+        self.background = background
+        self.text = TextCache(font)
+
+        # ? Once the dirty area covers this much of the screen a single full update is cheaper than a long list of rects
+        self.fullUpdateRatio = fullUpdateRatio
+        self.screenRect = self.screen.get_rect()
+        self.screenArea = self.screenRect.w * self.screenRect.h
+
+        self.previous: Dict[SpaceObject, Tuple[pygame.Rect, pygame.Surface]] = {}
+        self.hud: Dict[Any, Tuple[str, Tuple[int, int], Tuple[int, int, int]]] = {}
+        self.previousHud: Dict[Any, Tuple[pygame.Rect, pygame.Surface]] = {}
+
+        self.firstFrame = True
+        self.full = True  # ? Whether the last blit() wants the whole screen pushed rather than its dirty rects
+        self.dirtyPixels = 0
+        self.pixelsPushed = 0  # ? Pixels sent to the display by the last draw()
+
+        # ? Blitting and pushing to the display get timed as separate phases
+        self.profiler = profiler if profiler is not None else Profiler()
+
+    def label(self, slot, text: str, pos: Tuple[int, int], color: Tuple[int, int, int] = (0, 0, 0)):
+        # ? Puts a line of text on the HUD for the next draw(), slots that aren't labelled again get erased
+        self.hud[slot] = (text, pos, color)
+
+    def draw(self, objs: List[SpaceObject], blend: Optional[FrameBlend] = None) -> int:
+        with self.profiler.scope("blit"):
+            dirty = self.blit(objs, blend)
+        with self.profiler.scope("display"):
+            return self.present(dirty)
+
+    def blit(self, objs: List[SpaceObject], blend: Optional[FrameBlend] = None) -> List[pygame.Rect]:  # ? Erases and redraws everything that changed, returns the rects that need pushing
+        dirty: List[pygame.Rect] = []
+        current: Dict[SpaceObject, Tuple[pygame.Rect, pygame.Surface]] = {}
+
+        for obj in objs:
+            pos = obj.pos if blend is None else blend.position(obj)
+            sprite = obj.active
+            rect = sprite.get_rect(topleft=(int(pos[0]), int(pos[1])))
+            current[obj] = (rect, sprite)
+
+            last = self.previous.pop(obj, None)
+            if last is None:
+                dirty.append(rect)
+            elif last[0] != rect or last[1] is not sprite:
+                dirty.append(last[0])
+                dirty.append(rect)
+        for rect, _ in self.previous.values():  # ? Whatever's left got removed from the game since last frame
+            dirty.append(rect)
+        self.previous = current
+
+        currentHud: Dict[Any, Tuple[pygame.Rect, pygame.Surface]] = {}
+        for slot, (text, pos, color) in self.hud.items():
+            img = self.text.render(text, color)
+            rect = img.get_rect(topleft=pos)
+            currentHud[slot] = (rect, img)
+
+            last = self.previousHud.pop(slot, None)
+            if last is None:
+                dirty.append(rect)
+            elif last[0] != rect or last[1] is not img:
+                dirty.append(last[0])
+                dirty.append(rect)
+        for rect, _ in self.previousHud.values():
+            dirty.append(rect)
+        self.previousHud = currentHud
+        self.hud = {}
+
+        dirty = [rect.clip(self.screenRect) for rect in dirty]
+        pixels = sum(rect.w * rect.h for rect in dirty)
+        full = self.firstFrame or pixels >= self.screenArea * self.fullUpdateRatio
+
+        # * Everything gets erased first and blitted after so objects sharing a dirty area
+        # * can't wipe each other out, objects are cheap to blit so all of them get redrawn
+        if full:
+            self.screen.fill(self.background)
+        else:
+            for rect in dirty:
+                self.screen.fill(self.background, rect)
+
+        for obj, (rect, sprite) in current.items():
+            self.screen.blit(sprite, rect)
+        for rect, img in currentHud.values():
+            self.screen.blit(img, rect)
+
+        self.full = full
+        self.dirtyPixels = pixels
+        return dirty
+
+    def present(self, dirty: List[pygame.Rect]) -> int:
+        if self.full:
+            pygame.display.update()
+            self.pixelsPushed = self.screenArea
+        else:
+            pygame.display.update(dirty)
+            self.pixelsPushed = self.dirtyPixels
+        self.firstFrame = False
+
+        return self.pixelsPushed
@@ -0,0 +1,243 @@
+import atexit
+import copy
+import mmap
+import struct
+import time
+import zlib
+from typing import *
+
+import pygame
+
+from core import Game
+from render import Renderer, hudFont
+
+# ? Replay Log Protocol Description (version 1):
+# ? Header:         [4 Bytes "BLRP"] | [1 Byte (int) version] | [1 Byte (int) mode] | [1 Byte flags] | [4 Bytes (int) RNG seed]
+# ?                 | [4 Bytes (int) checkpoint interval in ticks]
+# ? Then records, each starting with a 1 Byte (int) record type:
+# ? Tick (0):       [1 Byte keys held] | [8 Bytes (double) FPS] | [8 Bytes (double) time]
+# ? Packet (1):     [8 Bytes (double) time received] | [2 Bytes (int) size] | [size Bytes packet]
+# ? Checkpoint (2): [4 Bytes (int) frame] | [4 Bytes (int) CRC32 of the world state]
+# * Packets belong to the tick record that comes after them, they're handled before that tick runs.
+# * FPS and time get recorded since impulses are scaled by the FPS and netcode runs off the clock,
+# * with those and the seed a session plays back exactly the same way every time
+
+REPLAY_MAGIC = b"BLRP"
+REPLAY_VERSION = 1
+
+MODE_SINGLEPLAYER = 0
+MODE_NETWORK = 1
+MODE_WAVES = 2
+
+FLAG_ENTITY_STORE = 1
+FLAG_PIXEL_COLLISIONS = 2
+
+KEY_LEFT = 1
+KEY_RIGHT = 2
+KEY_UP = 4
+KEY_DOWN = 8
+KEY_SPACE = 16
+
+RECORD_TICK = 0
+RECORD_PACKET = 1
+RECORD_CHECKPOINT = 2
+
+REPLAY_HEADER = struct.Struct("!4sBBBII")
+TICK = struct.Struct("!BBdd")
+PACKET = struct.Struct("!BdH")
+CHECKPOINT = struct.Struct("!BII")
+CHILD_STATE = struct.Struct("!ii?")
+
+
+def stateChecksum(game: Game) -> int:
+    # ? Cheap fingerprint of the world, positions are rounded to 1/16th of a pixel like in snapshots
+    crc = zlib.crc32(struct.pack("!I", game.frame))
+    for child in game.children:
+        crc = zlib.crc32(CHILD_STATE.pack(int(round(child.pos[0] * 16)), int(round(child.pos[1] * 16)), child.isDead), crc)
+    return crc
+
+
+class ReplayRecorder:
+    # ? Writes a session to a replay log as it's being played, the controller calls packet() for every
+    # ? packet it handles, tick() once per tick and checkpoint() after every tick
+    def __init__(self, path: str, mode: int, seed: int, useEntityStore: bool, pixelCollisions: bool = False, checkpointEvery: int = 600):
+        self.path = path
+        self.checkpointEvery = checkpointEvery
+        self.file = open(path, "wb", buffering=1 << 16)
+        flags = (FLAG_ENTITY_STORE if useEntityStore else 0) | (FLAG_PIXEL_COLLISIONS if pixelCollisions else 0)
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, mode, flags, seed, checkpointEvery))
+        self.ticks = 0
+        atexit.register(self.close)  # ? Sessions usually end through sys.exit(), this makes sure the buffer still gets written
+
+    def tick(self, keys: int, fps: float, now: float):
+        self.file.write(TICK.pack(RECORD_TICK, keys, fps, now))
+        self.ticks += 1
+
+    def packet(self, data: bytes, now: float):
+        self.file.write(PACKET.pack(RECORD_PACKET, now, len(data)))
+        self.file.write(data)
+
+    def checkpoint(self, game: Game):
+        if game.frame % self.checkpointEvery == 0:
+            self.file.write(CHECKPOINT.pack(RECORD_CHECKPOINT, game.frame, stateChecksum(game)))
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class ReplayPlayer:
+    # ? Re-drives a controller from a replay log, either headless as fast as possible or in real time
+    # ? with a window. makeController(mode, seed, useEntityStore, pixelCollisions) has to build the controller the session was
+    # ? recorded with, it gets fed through step(keys, fps, now) and handlePacket(packet, now)
+    def __init__(self, path: str, makeController, seekable: bool = False, maxCheckpoints: int = 32):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        magic, version, self.mode, flags, self.seed, self.checkpointEvery = REPLAY_HEADER.unpack_from(self.view)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} isn't a version {REPLAY_VERSION} replay log")
+        self.useEntityStore = bool(flags & FLAG_ENTITY_STORE)
+        self.pixelCollisions = bool(flags & FLAG_PIXEL_COLLISIONS)
+
+        self.makeController = makeController
+        self.controller = makeController(self.mode, self.seed, self.useEntityStore, self.pixelCollisions)
+        self.offset = REPLAY_HEADER.size
+        self.tick = 0
+        self.ticks = self.countTicks()
+
+        # ? Tick -> (log offset, copy of the controller), only taken when seekable, every interval ticks so seeking
+        # ? backwards only has to replay from the nearest one instead of from the start. Without them seeking
+        # ? backwards rebuilds the controller and replays the log from the start
+        # * They only ever live in memory, the log itself just has the CRCs. Once there would be more than
+        # * maxCheckpoints the interval doubles and every other one gets dropped, so a long log doesn't keep
+        # * a copy of the whole game for every checkpointEvery ticks it has
+        self.seekable = seekable
+        self.maxCheckpoints = maxCheckpoints
+        self.interval = self.checkpointEvery
+        self.checkpoints: Dict[int, Tuple[int, Any]] = {}
+        if self.seekable:
+            self.takeCheckpoint()
+
+        self.desyncs: List[int] = []  # ? Frames where the replayed world didn't match what got recorded
+
+    def countTicks(self) -> int:
+        ticks = 0
+        offset = REPLAY_HEADER.size
+        while offset < len(self.view):
+            kind = self.view[offset]
+            if kind == RECORD_TICK:
+                ticks += 1
+                offset += TICK.size
+            elif kind == RECORD_PACKET:
+                offset += PACKET.size + PACKET.unpack_from(self.view, offset)[2]
+            else:
+                offset += CHECKPOINT.size
+        return ticks
+
+    def takeCheckpoint(self):
+        # * Surfaces, sockets and windows can't be copied (and don't change), so they're shared with the copy
+        controller = self.controller
+        shared = [controller.screen, controller.assets, *controller.assets.surfaces.values()]
+        shared += [getattr(controller, name) for name in ("renderer", "clock", "client", "recvThread", "masks") if hasattr(controller, name)]
+        if hasattr(controller, "net"):  # ? Scratch send buffer, only one controller ever plays at a time so it can be shared too
+            shared += [controller.net.inputs.buffer, controller.net.inputs.view]
+        memo = {id(obj): obj for obj in shared}
+        self.checkpoints[self.tick] = (self.offset, copy.deepcopy(controller, memo))
+
+        while len(self.checkpoints) > self.maxCheckpoints:
+            self.interval *= 2
+            for tick in [tick for tick in self.checkpoints.keys() if tick % self.interval != 0]:
+                del self.checkpoints[tick]
+
+    def restore(self, tick: int):
+        if tick not in self.checkpoints:  # ? Only ever tick 0 when there are no checkpoints, a fresh controller is where the log starts
+            self.offset = REPLAY_HEADER.size
+            self.tick = 0
+            self.controller = self.makeController(self.mode, self.seed, self.useEntityStore, self.pixelCollisions)
+            return
+
+        offset, controller = self.checkpoints[tick]
+        self.offset = offset
+        self.tick = tick
+        self.controller = controller
+        self.takeCheckpoint()  # ? The stored copy has to stay untouched for the next seek
+
+    def step(self) -> bool:  # ? Plays the log up to and including the next tick, False once the log has run out
+        view = self.view
+        while self.offset < len(view):
+            kind = view[self.offset]
+            if kind == RECORD_PACKET:
+                _, now, size = PACKET.unpack_from(view, self.offset)
+                start = self.offset + PACKET.size
+                self.offset = start + size
+                self.controller.handlePacket(bytes(view[start:self.offset]), now)
+            elif kind == RECORD_CHECKPOINT:
+                _, frame, crc = CHECKPOINT.unpack_from(view, self.offset)
+                self.offset += CHECKPOINT.size
+                if self.controller.game.frame == frame and stateChecksum(self.controller.game) != crc and frame not in self.desyncs:
+                    self.desyncs.append(frame)
+            else:
+                _, keys, fps, now = TICK.unpack_from(view, self.offset)
+                self.offset += TICK.size
+                self.controller.step(keys, fps, now)
+                self.tick += 1
+                if self.seekable and self.tick % self.interval == 0 and self.tick not in self.checkpoints:
+                    self.takeCheckpoint()
+                return True
+        return False
+
+    def seek(self, tick: int):
+        tick = max(0, min(tick, self.ticks))
+        nearest = max((t for t in self.checkpoints.keys() if t <= tick), default=0)
+        if tick < self.tick or nearest > self.tick:
+            self.restore(nearest)
+        while self.tick < tick and self.step():
+            pass
+
+    def run(self, ticks: Optional[int] = None) -> float:  # ? Headless playback at full speed, returns the ticks per second achieved
+        end = self.ticks if ticks is None else min(self.ticks, self.tick + ticks)
+        start = time.perf_counter()
+        played = 0
+        while self.tick < end and self.step():
+            played += 1
+        elapsed = time.perf_counter() - start
+        return played / elapsed if elapsed > 0 else float("inf")
+
+    def play(self, fps: int):
+        # ? Real time playback in the controller's window, left/right seek 5 seconds, escape quits
+        WHITE = (255, 255, 255)
+        BLACK = (0, 0, 0)
+
+        fontsize = 20
+        renderer = Renderer(self.controller.screen, WHITE, hudFont(fontsize))
+        clock = pygame.time.Clock()
+
+        while True:
+            clock.tick(fps)
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT:
+                    self.seek(self.tick - fps * 5)
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
+                    self.seek(self.tick + fps * 5)
+
+            self.step()
+
+            renderer.label("tick", f"{self.tick}/{self.ticks}", (5, 0), BLACK)
+            if len(self.desyncs) != 0:
+                renderer.label("desync", f"desynced at frame {self.desyncs[0]}", (5, fontsize), (255, 0, 0))
+            renderer.draw(self.controller.game.children)
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+class NullSocket:  # ? Stands in for the client socket while a network session gets played back, replies go nowhere
+    def sendto(self, data, addr=None):
+        pass
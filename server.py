@@ -1,68 +1,596 @@
+import asyncio
+import collections
+import ipaddress
+import multiprocessing
+import os
 import socket
+import struct
+import sys
+import time
+from typing import *
 
+from assets import AssetManager
+from core import *
+from netcode import *
 
-def player(conn, addr):
-    print('Connected ', addr)
+# ? Server Side Relay Protocol Description:
+# ? Max Buffer Size: 256
+# ? [1 Byte (Index of Client that sent message)] | [0 - 255 Bytes (Payload)]
 
-    # ? Server Side Relay Protocol Description:
-    # ? Max Buffer Size: 256
-    # ? [1 Byte (Index of Client that sent message)] | [0 - 255 Bytes (Payload)]
+# * Note to self:
+# * In the multiplayer mode, player ids are associated with the slot they were given when they joined
+# * Ex. Player 0, Player 1, Player 2... (slots of players that left get handed out again)
+
+MAX_CLIENTS = 255  # ? The client index has to fit in a single byte, 255 is SERVER_INDEX
+STATS_INTERVAL = 5.0
+
+# ? Clients that haven't sent anything (not even a heartbeat, Packet Type 9) for this long get evicted
+CLIENT_TIMEOUT = 5.0
+SWEEP_INTERVAL = 1.0
+# * Writing the last seen time into the shared table on every packet would be a lot of cross process
+# * traffic for nothing, it only gets refreshed once it's this stale
+TOUCH_INTERVAL = 0.5
+
+# ? Token bucket every client's packets go through, a client sends about 60 packets/s (inputs and peer states)
+RATE_LIMIT = 120
+RATE_BURST = 60
+
+# ? Authoritative mode settings, these should match GenericController's
+SCR_DIMENSIONS = (800, 800)
+TICK_RATE = 144
+SNAPSHOT_RATE = 30
+DEATH_FRAMES = round(TICK_RATE * 0.5)
+MAX_SPEED = 5
+SPEED = 0.2
+FALLOFF = 0.1
+GAME_SPEED_FACTOR = 1000
+
+# ? The biggest impulse a held key makes in one tick and the quickest it has to die down, client velocities get held to these
+MAX_IMPULSE = SPEED * GAME_SPEED_FACTOR / TICK_RATE
+MIN_FALLOFF = FALLOFF * GAME_SPEED_FACTOR / TICK_RATE
+
+# ? Bullets get shot at most every FIRE_INTERVAL of the client's own ticks, same as a held fire key in GenericController
+FIRE_INTERVAL = round(TICK_RATE * 0.15)
+BULLET_SPEED = 2 * GAME_SPEED_FACTOR / TICK_RATE
+
+# ? Layout of one slot in the shared directory: [active] | [ipv4 address] | [port] | [room] | [last seen (ms)]
+# * Last seen comes from time.monotonic(), which is system wide on Linux so every worker agrees on it
+SLOT_SIZE = 5
+
+
+def joinRoom(b) -> int:  # ? Room a join packet asks for, older clients don't send one and end up in room 0
+    if len(b) >= 1 + SPACE_OBJECT_STRUCT.size + ROOM_STRUCT.size and b[0] == 0:
+        return ROOM_STRUCT.unpack_from(b, 1 + SPACE_OBJECT_STRUCT.size)[0]
+    return 0
+
+
+class TokenBucket:
+    # ? Lets through `rate` packets a second on average and bursts of up to `burst`
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Session:  # ? What a worker keeps about a client on top of the shared table
+    __slots__ = ("bucket", "touched")
+
+    def __init__(self, now: float):
+        self.bucket = TokenBucket(RATE_LIMIT, RATE_BURST, now)
+        self.touched = now
+
+
+class RoomDirectory:
+    # ? Table of every client shared between all worker processes, a client can land on any worker
+    # ? but has to receive packets relayed by all of them so every worker needs the full picture
+    # * Workers keep a local copy and only rebuild it when the version counter changes,
+    # * which is just one shared int read per packet
+    def __init__(self, table=None):
+        self.table = table if table is not None else multiprocessing.Array("q", 1 + MAX_CLIENTS * SLOT_SIZE)
+        self.version = -1
+        self.indices: Dict[Tuple[str, int], int] = {}
+        self.rooms: Dict[int, List[Tuple[str, int]]] = {}
+        self.roomOf: Dict[Tuple[str, int], int] = {}
+
+    def refresh(self):
+        table = self.table.get_obj()
+        if table[0] == self.version:
+            return
+        with self.table.get_lock():
+            self.version = table[0]
+            self.indices = {}
+            self.rooms = {}
+            self.roomOf = {}
+            for index in range(MAX_CLIENTS):
+                base = 1 + index * SLOT_SIZE
+                if table[base] == 0:
+                    continue
+                addr = (str(ipaddress.IPv4Address(table[base + 1])), table[base + 2])
+                self.indices[addr] = index
+                self.roomOf[addr] = table[base + 3]
+                self.rooms.setdefault(table[base + 3], []).append(addr)
+
+    def join(self, addr: Tuple[str, int], room: int = 0, now: Optional[float] = None) -> Optional[int]:  # ? Returns None when the server is full
+        now = time.monotonic() if now is None else now
+        table = self.table.get_obj()
+        with self.table.get_lock():
+            free = None
+            for index in range(MAX_CLIENTS):
+                base = 1 + index * SLOT_SIZE
+                if table[base] == 0:
+                    if free is None:
+                        free = index
+                elif (table[base + 1], table[base + 2]) == (int(ipaddress.IPv4Address(addr[0])), addr[1]):
+                    return index  # ? Another worker beat us to it
+            if free is None:
+                return None
+
+            base = 1 + free * SLOT_SIZE
+            table[base + 1] = int(ipaddress.IPv4Address(addr[0]))
+            table[base + 2] = addr[1]
+            table[base + 3] = room
+            table[base + 4] = int(now * 1000)
+            table[base] = 1
+            table[0] += 1
+        self.refresh()
+        return free
+
+    def leave(self, addr: Tuple[str, int]):
+        index = self.indices.get(addr)
+        if index is None:
+            return
+        with self.table.get_lock():
+            self.table.get_obj()[1 + index * SLOT_SIZE] = 0
+            self.table.get_obj()[0] += 1
+        self.refresh()
+
+    def touch(self, index: int, now: float):  # ? Marks a client as still alive
+        # * A single aligned int write, no lock needed, the worst a race can do is keep the older time
+        self.table.get_obj()[1 + index * SLOT_SIZE + 4] = int(now * 1000)
+
+    def expire(self, now: float, timeout: float) -> List[Tuple[int, Tuple[str, int], int]]:
+        # ? Frees the slot of every client that's been silent for longer than timeout, returns (index, address, room)
+        # ? of each one so the caller can tell the rest of the room, only one worker ever gets a given client back
+        expired = []
+        cutoff = int((now - timeout) * 1000)
+        table = self.table.get_obj()
+        with self.table.get_lock():
+            for index in range(MAX_CLIENTS):
+                base = 1 + index * SLOT_SIZE
+                if table[base] != 0 and table[base + 4] < cutoff:
+                    table[base] = 0
+                    expired.append((index, (str(ipaddress.IPv4Address(table[base + 1])), table[base + 2]), table[base + 3]))
+            if len(expired) != 0:
+                table[0] += 1
+        self.refresh()
+        return expired
+
+    def lookup(self, addr: Tuple[str, int]) -> Optional[int]:
+        self.refresh()
+        return self.indices.get(addr)
+
+    def peers(self, addr: Tuple[str, int]) -> List[Tuple[str, int]]:  # ? Everyone in the same room as addr (addr included)
+        return self.rooms.get(self.roomOf.get(addr), [])
+
+    def __len__(self):
+        return len(self.indices)
+
+
+class RelayStats:
+    # ? Per worker counters, flushed into a shared array so the parent process can print totals
+    # ? Layout per worker: [packets] | [datagrams sent] | [fan-out p50 (us)] | [fan-out p99 (us)] | [rate limited] | [evicted]
+    FIELDS = 6
+
+    def __init__(self, shared, worker: int):
+        self.shared = shared
+        self.worker = worker
+        self.packets = 0
+        self.sent = 0
+        self.limited = 0
+        self.evicted = 0
+        self.latencies = collections.deque(maxlen=4096)
+
+    def record(self, fanOut: int, seconds: float):
+        self.packets += 1
+        self.sent += fanOut
+        self.latencies.append(seconds)
+
+    def flush(self):
+        samples = sorted(self.latencies)
+        base = self.worker * self.FIELDS
+        with self.shared.get_lock():
+            self.shared[base] = self.packets
+            self.shared[base + 1] = self.sent
+            self.shared[base + 4] = self.limited
+            self.shared[base + 5] = self.evicted
+            if len(samples) != 0:
+                self.shared[base + 2] = samples[len(samples) // 2] * 1e6
+                self.shared[base + 3] = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+
+
+class RelayProtocol(asyncio.DatagramProtocol):
+    # * Every packet only goes to the members of the sender's room and dead clients get evicted,
+    # * so what a packet costs depends on how big its room is rather than on how many clients ever connected
+    def __init__(self, directory: RoomDirectory, stats: RelayStats):
+        self.directory = directory
+        self.stats = stats
+        self.transport = None
+        self.sessions: Dict[Tuple[str, int], Session] = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, b, addr):
+        start = time.perf_counter()
+        now = time.monotonic()
+
+        index = self.directory.lookup(addr)
+        if index is None:
+            index = self.directory.join(addr, joinRoom(b), now)
+            if index is None:  # ? Server full
+                return
+            print(f"Client {index} joined room {self.directory.roomOf.get(addr)} from {addr}")
+
+        session = self.sessions.get(addr)
+        if session is None:
+            session = self.sessions[addr] = Session(now)
+        if not session.bucket.take(now):
+            self.stats.limited += 1
+            return
+        if now - session.touched >= TOUCH_INTERVAL:
+            self.directory.touch(index, now)
+            session.touched = now
+
+        if len(b) == 0 or b[0] == 9:  # ? Packet Type 9: Heartbeat, only there to keep the client from being evicted
+            self.stats.record(0, time.perf_counter() - start)
+            return
+
+        packet = bytes([index]) + b
+        fanOut = 0
+        for client in self.directory.peers(addr):
+            if client != addr:
+                self.transport.sendto(packet, client)
+                fanOut += 1
+
+        if b[0] == 4:  # ? Packet Type 4: Player Quit, still relayed so everyone else finds out
+            self.directory.leave(addr)
+            self.sessions.pop(addr, None)
+            print(f"Client {index} left")
+
+        self.stats.record(fanOut, time.perf_counter() - start)
+
+    def sweep(self, now: float):
+        # ? Evicts timed out clients and tells the rest of their room they quit, the same as if they'd sent Packet Type 4 themselves
+        for index, addr, room in self.directory.expire(now, CLIENT_TIMEOUT):
+            packet = bytes([index, 4])
+            for client in self.directory.rooms.get(room, []):
+                self.transport.sendto(packet, client)
+            self.stats.evicted += 1
+            print(f"Client {index} timed out")
+
+        # * Sessions of clients that left or got evicted through another worker
+        for addr in [addr for addr in self.sessions if addr not in self.directory.indices]:
+            del self.sessions[addr]
+
+
+class AuthoritativeServer(asyncio.DatagramProtocol):
+    # ? Runs the one true copy of the game, clients only send their inputs (velocities and fire presses) and get
+    # ? snapshots of the whole world back which they render and predict from
+    # * Bullets and what they hit only ever get simulated here, every death a client shows comes from a snapshot
+    def __init__(self, tickRate: int, snapshotRate: int, useEntityStore: bool = False):
+        self.tickRate = tickRate
+        self.snapshotEvery = max(1, round(tickRate / snapshotRate))
+        self.directory = RoomDirectory()
+        self.transport = None
+
+        self.assets = AssetManager()
+        self.sprite = self.assets.image("player.png")
+        self.dead = self.assets.image("player_death.png")
+        self.bulletSprite = self.assets.image("player_bullet.png")
+
+        self.impulses = Pool(Velocity)
+        self.bullets = Pool(self.newBullet)
+
+        self.players: Dict[int, SpaceObject] = {}
+        self.lastShot: Dict[int, int] = {}  # ? Index -> client tick of the last bullet it shot
+        self.shots: Dict[int, int] = {}  # ? Index -> bullets it has shot, for the next one's bulletIndex
+        self.bulletIndices: Dict[SpaceObject, int] = {}  # ? Bullet -> the index snapshots carry it under, pooled bullets get a new one every shot
+        self.encoders: Dict[Tuple[str, int], SnapshotEncoder] = {}
+        self.inputs: Dict[int, InputReceiver] = {}
+        # ? A handful of players is far below where batching physics through NumPy pays off, see GenericController
+        self.game = Game(None, [], DEATH_FRAMES, store=EntityStore(SCR_DIMENSIONS) if useEntityStore else None)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, b, addr):
+        if not b:
+            return
+
+        index = self.directory.lookup(addr)
+        if index is None:
+            # ? Strangers only get a slot (and a Welcome) for a join that actually parses, anything else is dropped
+            if b[0] != 0 or len(b) < 1 + SPACE_OBJECT_STRUCT.size:
+                return
+            index = self.directory.join(addr)
+            if index is None:  # ? Server full
+                return
+            print(f"Client {index} joined from {addr}")
+            self.transport.sendto(bytes([SERVER_INDEX, 3, index]), addr)  # ? Packet Type 3: Welcome
+            self.encoders[addr] = SnapshotEncoder(index)
+
+        self.directory.touch(index, time.monotonic())
 
-    while True:  # ? This merely relays client messages to each other
         try:
-            data = conn.recv(256)
-        except:
-            break
-        if not data:
-            break
-        for client in clients.values():
-            if client[0] != conn:
-                try:
-                    client[0].send(bytes([client[1]]) + data)
-                except:
-                    clients.pop(client[0].getsockname(), None)
+            self.handle(b, addr, index)
+        except struct.error:  # ? Truncated packet from a client we know, nothing in it can be trusted
+            pass
 
+    def handle(self, b, addr: Tuple[str, int], index: int):
+        if b[0] == 0 and self.players.get(index) is None:  # ? Packet Type 0: Player Join
+            player = spaceObjectFromBytes(b, None, self.sprite, self.dead, self.limitPlayers, self.onAllCollided, f"Player_{index}", WALL_CLAMP, 1)
+            player.maxVelSpeed = MAX_SPEED  # ? Don't trust whatever speed limit the client asked for
+            player.velocity.maxSpeed = MAX_SPEED
+            player.group = index + 1  # ? Shared with its bullets so they can't hit it
+            self.players[index] = player
+            self.game.summon(player)
+        elif b[0] == 1:  # ? Packet Type 1: Velocity
+            player = self.players.get(index)
+            vel = velocityFromBytes(b, 1)
+            if player is not None and player.isDead == False and vel.limit(MAX_IMPULSE, MIN_FALLOFF, MAX_SPEED):
+                player.addForce(vel)
+        elif b[0] == 6:  # ? Packet Type 6: Input
+            receiver = self.inputs.setdefault(index, InputReceiver())
+            receiver.receive(b)
+            if receiver.lastSequence >= 0:
+                self.transport.sendto(inputAckToBytes(receiver.lastSequence), addr)  # ? Packet Type 7: Input Ack
+        elif b[0] == 4:  # ? Packet Type 4: Player Quit
+            self.removeClient(index, addr)
+            print(f"Client {index} left")
+        elif b[0] == 5:  # ? Packet Type 5: Snapshot Ack
+            encoder = self.encoders.get(addr)
+            if encoder is not None:
+                encoder.ack(ackFromBytes(b))
 
-# * Note to self:
-# * In the multiplayer mode, player ids are associated with the order they joined in
-# * Ex. Player 0, Player 1, Player 2...
+    def removeClient(self, index: int, addr: Tuple[str, int]):
+        # * The player just stops showing up in snapshots, which clients already read as it having left
+        self.inputs.pop(index, None)
+        self.lastShot.pop(index, None)
+        self.shots.pop(index, None)
+        player = self.players.pop(index, None)
+        if player is not None:
+            self.game.kill(player)
+        self.directory.leave(addr)
+        self.encoders.pop(addr, None)
+
+    def sweep(self, now: float):  # ? Evicts clients that stopped sending anything, heartbeats (Packet Type 9) included
+        for index, addr, _ in self.directory.expire(now, CLIENT_TIMEOUT):
+            # ? expire() already freed the slot, removeClient's leave() just finds nothing to do
+            self.removeClient(index, addr)
+            print(f"Client {index} timed out")
+
+    def broadcast(self):  # ? Packet Type 2: World Snapshot, delta encoded separately for every client
+        # ? Bullets go out under their own indices (see bulletIndex) until they're removed from the game,
+        # ? dead ones included so clients see where they hit
+        objs: Dict[int, SpaceObject] = dict(self.players)
+        for obj in self.game.children:
+            index = self.bulletIndices.get(obj)
+            if index is not None:
+                objs[index] = obj
+        state = worldState(objs)
+        for client, encoder in self.encoders.items():
+            receiver = self.inputs.get(self.directory.indices.get(client))
+            if receiver is not None:
+                chunks = encoder.encode(self.game.frame, state, receiver.appliedSequence, receiver.sinceApplied())
+            else:
+                chunks = encoder.encode(self.game.frame, state)
+            for chunk in chunks:
+                self.transport.sendto(chunk, client)
+
+    def step(self):  # ? One simulation tick, split out of tickLoop so netharness.py can drive it in simulated time
+        for index, receiver in self.inputs.items():
+            player = self.players.get(index)
+            if player is not None:
+                receiver.feed(player, MAX_IMPULSE, MIN_FALLOFF, MAX_SPEED,
+                              lambda sequence, buttons: self.fire(index, player, sequence, buttons))
+
+        self.game.tick()
+        if self.game.frame % self.snapshotEvery == 0:
+            self.broadcast()
 
-print("Address to host on")
-addr = input(" > ")
+    async def tickLoop(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tickRate
+        nextTick = loop.time()
+        lastSweep = nextTick
+        while True:
+            self.step()
 
-# ? Here, the person hosting should actually insert the address of the interface they're using or the one that's currently connected to the network (ie. Wifi address is usually 192.168.1.0/8 etc...)
-# ? Likewise if you're hosting a LAN party and you have one ethernet interface connected to a switch you'd want to use that ethernet interface's address instead of wifi address
-# ? On windows you can find the address by running "ipconfig" in command prompt and checking for ipv4 (avoid 127.0.0.1)/ipv6 (avoid ::1) addresses under the interface you wish to use (Be careful not use addresses under "subnet mask (this is not an address)" or "default gateway (this is usually your router's address)")
+            if loop.time() - lastSweep >= SWEEP_INTERVAL:
+                lastSweep = loop.time()
+                self.sweep(time.monotonic())
 
-print("Specify port to host on")
-port = int(input(" > "))
+            # ? Scheduling off the previous deadline (rather than now) keeps the tick rate from drifting
+            nextTick += interval
+            await asyncio.sleep(max(0, nextTick - loop.time()))
 
-clients = {}
-index = 0
+    def fire(self, index: int, player: SpaceObject, sequence: int, buttons: int):
+        # ? Same bullet GenericController.shoot makes, fire presses coming quicker than a held key could shoot get ignored
+        if buttons & BUTTON_FIRE == 0 or sequence - self.lastShot.get(index, -FIRE_INTERVAL) < FIRE_INTERVAL:
+            return
+        self.lastShot[index] = sequence
+        bullet = self.bullets.acquire(list(player.pos), [self.impulses.acquire(0, -BULLET_SPEED, 0, False, 6)])
+        bullet.group = player.group
+        serial = self.shots.get(index, 0)
+        self.shots[index] = serial + 1
+        self.bulletIndices[bullet] = bulletIndex(index, serial)
+        self.game.summon(bullet)
 
-s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-s.settimeout(0.5)
-s.bind((addr, port))
+    def newBullet(self, pos, velocityQueue):  # ? Only called when the bullet pool has nothing to recycle
+        return SpaceObject(
+            pos=pos,
+            scr=None,
+            sprite=self.bulletSprite,
+            dead=self.assets.blank((0, 0)),
+            velocityQueue=velocityQueue,
+            maxVelStack=2,
+            maxVelSpeed=4,
+            onWallCollided=self.limitBullet,
+            onCollision=self.onAllCollided,
+            givenID="Player_Bullet",
+            velocityFalloff=FALLOFF,
+            wallMode=WALL_KILL
+        )
 
-print(f"Listening to connections on port {port}")
-while True:
+    def limitPlayers(self, obj):
+        obj.pos[0] = clamp(obj.pos[0], 0, SCR_DIMENSIONS[0])
+        obj.pos[1] = clamp(obj.pos[1], 0, SCR_DIMENSIONS[1])
+
+    def limitBullet(self, obj):
+        if (obj.pos[0] <= 0 or obj.pos[0] >= SCR_DIMENSIONS[0]) or (obj.pos[1] <= 0 or obj.pos[1] >= SCR_DIMENSIONS[1]):
+            self.game.kill(obj)
+
+    def onAllCollided(self, obj, target):
+        # ? A bullet kills whichever player it hits (other than the one that shot it, see group), players bumping
+        # ? into each other or bullets crossing paths is harmless, same as on the clients
+        if (obj.id == "Player_Bullet") != (target.id == "Player_Bullet"):
+            self.game.kill(obj, target)
+
+
+def bindSocket(addr: str, port: int, reusePort: bool) -> socket.socket:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reusePort:
+        # * With SO_REUSEPORT the kernel hashes each client's address onto one of the bound sockets,
+        # * so a client always ends up on the same worker without any extra routing on our side
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((addr, port))
+    s.setblocking(False)
+    return s
+
+
+async def serve(addr: str, port: int, reusePort: bool, directory: RoomDirectory, stats: RelayStats):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: RelayProtocol(directory, stats), sock=bindSocket(addr, port, reusePort))
     try:
-        try:
-            b, addr = s.recvfrom(256)
-        except:
-            continue
+        lastFlush = time.monotonic()
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.monotonic()
+            protocol.sweep(now)
+            if now - lastFlush >= STATS_INTERVAL:
+                stats.flush()
+                lastFlush = now
+    finally:
+        transport.close()
+
+
+def worker(addr: str, port: int, reusePort: bool, table, sharedStats, index: int):
+    try:
+        asyncio.run(serve(addr, port, reusePort, RoomDirectory(table), RelayStats(sharedStats, index)))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serveAuthoritative(addr: str, port: int, tickRate: int, snapshotRate: int, useEntityStore: bool = False):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: AuthoritativeServer(tickRate, snapshotRate, useEntityStore), sock=bindSocket(addr, port, False))
+    try:
+        await server.tickLoop()
+    finally:
+        transport.close()
+
+
+def runAuthoritative(addr: str, port: int, tickRate: int = TICK_RATE, snapshotRate: int = SNAPSHOT_RATE, useEntityStore: bool = False):
+    # * The simulation is a single process, multiple workers would each end up with their own world
+    print(f"Simulating on port {port} at {tickRate} ticks/s ({snapshotRate} snapshots/s)")
+    try:
+        asyncio.run(serveAuthoritative(addr, port, tickRate, snapshotRate, useEntityStore))
     except KeyboardInterrupt:
         print("Stopping!")
-        break
 
-    if clients.get(addr) == None:
-        clients[addr] = index
-        index += 1
-        print(clients)
 
-    if b[0] == 4:
-        clients.pop(addr, None)
+def startWorkers(addr: str, port: int, workers: int, reusePort: bool, target=worker) -> Tuple[List[multiprocessing.Process], Any]:
+    # ? Starts the relay's worker processes around one shared room directory, returns them and the array their stats get flushed to
+    table = multiprocessing.Array("q", 1 + MAX_CLIENTS * SLOT_SIZE)
+    sharedStats = multiprocessing.Array("d", workers * RelayStats.FIELDS)
+
+    processes = [
+        multiprocessing.Process(target=target, args=(addr, port, reusePort, table, sharedStats, i), daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    return processes, sharedStats
+
+
+def run(addr: str, port: int, workers: int):
+    reusePort = hasattr(socket, "SO_REUSEPORT")
+    if not reusePort and workers > 1:
+        print("SO_REUSEPORT isn't available on this platform, falling back to a single worker")
+        workers = 1
+
+    processes, sharedStats = startWorkers(addr, port, workers, reusePort)
+
+    print(f"Listening to connections on port {port} with {workers} worker(s)")
+
+    lastPackets = 0
+    lastTime = time.perf_counter()
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+
+            with sharedStats.get_lock():
+                values = list(sharedStats)
+            packets = sum(values[i * RelayStats.FIELDS] for i in range(workers))
+            sent = sum(values[i * RelayStats.FIELDS + 1] for i in range(workers))
+            p50 = max(values[i * RelayStats.FIELDS + 2] for i in range(workers))
+            p99 = max(values[i * RelayStats.FIELDS + 3] for i in range(workers))
+            limited = sum(values[i * RelayStats.FIELDS + 4] for i in range(workers))
+            evicted = sum(values[i * RelayStats.FIELDS + 5] for i in range(workers))
+
+            now = time.perf_counter()
+            print(f"{(packets - lastPackets) / (now - lastTime):.0f} packets/s | {int(sent)} datagrams sent | fan-out p50 {p50:.0f}us p99 {p99:.0f}us (worst worker) | {int(limited)} rate limited | {int(evicted)} evicted")
+            lastPackets = packets
+            lastTime = now
+    except KeyboardInterrupt:
+        print("Stopping!")
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    print("Address to host on")
+    addr = input(" > ")
+
+    # ? Here, the person hosting should actually insert the address of the interface they're using or the one that's currently connected to the network (ie. Wifi address is usually 192.168.1.0/8 etc...)
+    # ? Likewise if you're hosting a LAN party and you have one ethernet interface connected to a switch you'd want to use that ethernet interface's address instead of wifi address
+    # ? On windows you can find the address by running "ipconfig" in command prompt and checking for ipv4 (avoid 127.0.0.1)/ipv6 (avoid ::1) addresses under the interface you wish to use (Be careful not use addresses under "subnet mask (this is not an address)" or "default gateway (this is usually your router's address)")
+
+    print("Specify port to host on")
+    port = int(input(" > "))
+
+    print("Select a Mode:\n(0): Relay\n(1): Authoritative Simulation")
+    mode = int(input(" > "))
+
+    if mode == 0:
+        print(f"Specify number of worker processes (leave empty for {os.cpu_count()})")
+        workers = input(" > ")
 
-    for client in clients.keys():
-        if addr != client:
-            s.sendto(bytes([clients[addr]]) + b, client)
+        run(addr, port, int(workers) if workers.strip() != "" else os.cpu_count())
+    elif mode == 1:
+        # ? python server.py --store batches the simulation's physics through NumPy
+        runAuthoritative(addr, port, useEntityStore="--store" in sys.argv and EntityStore.available)
@@ -0,0 +1,413 @@
+import multiprocessing
+import struct
+from multiprocessing import shared_memory
+from typing import *
+
+import pygame
+
+from assets import AssetManager
+from core import SpaceObject
+from render import FrameBlend
+
+# ? Shared World Layout Description:
+# ? Control:    [CONTROL_FIELDS x 8 Bytes (int)], see the CONTROL_ constants
+# ? Sprites:    [SPRITE_SLOTS x SPRITE_NAME Bytes] asset names (or "blank W H"), NUL padded, a sprite's id is its index
+# ? Buffers:    BUFFERS x [5 x 8 Bytes (double) frame | count | published at | step cost | sprite names written]
+# ?             | [capacity x 8 Bytes (double) X] | [capacity x 8 Bytes (double) Y]
+# ?             | [capacity x 8 Bytes (double) X a step earlier] | [capacity x 8 Bytes (double) Y a step earlier]
+# ?             | [capacity x 4 Bytes (int) sprite id] | [capacity x 4 Bytes (int) generation] | [capacity x 1 Byte flags]
+# * Entities keep their slot for as long as they're in the game, so the reader can keep one view object per entity
+# * (which is what Renderer tracks dirty rects by), a slot handed to a new entity gets a new generation
+# * The reader draws straight out of the buffer it has claimed (CONTROL_READING) and the writer only ever fills
+# * a buffer that's neither that one nor CONTROL_LATEST, so with three of them the writer always has one free and
+# * neither side waits on the other. Claiming and flipping happen under SharedWorld.lock, a process shared
+# * semaphore that's only held for those few reads and writes and also orders the buffer's contents against
+# * the flip on any CPU (plain stores into shared memory only land in order on x86)
+
+BUFFERS = 3
+
+CONTROL_FIELDS = 16
+CONTROL_LATEST = 0  # ? Buffer with the newest complete frame, -1 until the first one
+CONTROL_READING = 1  # ? Buffer the window is drawing from, -1 until it's claimed one
+CONTROL_STATE = 2
+CONTROL_SIM_RATE = 3
+CONTROL_TARGET_FPS = 4
+CONTROL_WIDTH = 5
+CONTROL_HEIGHT = 6
+CONTROL_CAPACITY = 7
+CONTROL_OVERFLOW = 8  # ? Entities left out of the last frame because every slot was taken
+
+STATE_STARTING = 0
+STATE_RUNNING = 1
+STATE_STOPPED = 2
+
+SPRITE_SLOTS = 64
+SPRITE_NAME = 32
+
+META_FIELDS = 5
+META_FRAME = 0
+META_COUNT = 1  # ? Slots in use, everything past it is empty
+META_PUBLISHED_AT = 2  # ? perf_counter() when it was published, system wide on Linux
+META_STEP_COST = 3  # ? Seconds the simulation spent producing it
+META_SPRITES = 4  # ? Sprite names in the table by the time it was published, the only ones its sprite ids can point at
+
+FLAG_PRESENT = 1
+FLAG_DEAD = 2
+
+# ? Input Ring Layout Description:
+# ? [8 Bytes (int) head, only written by the producer] | [8 Bytes (int) tail, only written by the consumer]
+# ? | [8 Bytes (int) capacity] | [capacity x 1 Byte keys] | [capacity x 1 Byte flags]
+# * Single producer single consumer, a record is written before head moves past it and read before tail does.
+# * Like SharedWorld's flip, head and tail only ever move under InputRing.lock, which is what makes the record
+# * (written outside it) visible to the other end before the index that publishes it on CPUs that reorder stores,
+# * and keeps the consumer's reads done before the producer can reuse the slot. Only the two counters are
+# * read or written under it, so neither end holds it for more than a moment
+
+INPUT_QUIT = 1
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    # ? Opens a block another process created, that process is the one that unlinks it
+    # * Only meant for children of the creator, they share its resource tracker so attaching doesn't register
+    # * the block a second time (an unrelated process would unlink it when it exits)
+    return shared_memory.SharedMemory(name=name)
+
+
+def spriteName(key) -> str:  # ? AssetManager key -> name that fits in the sprite table
+    if isinstance(key, tuple) and key[0] == "blank":
+        return f"blank {key[1][0]} {key[1][1]}"
+    return key
+
+
+def loadSprite(assets: AssetManager, name: str) -> pygame.Surface:
+    if name.startswith("blank "):
+        _, w, h = name.split(" ")
+        return assets.blank((int(w), int(h)))
+    return assets.image(name)
+
+
+class SharedWorld:
+    # ? Triple buffered entity state in a shared memory block, the simulation process publishes
+    # ? into it (WorldPublisher) and the window process renders straight out of it (WorldView)
+    # * Attaching takes the creator's lock as well as the name, it can only be handed to child processes when they start
+    def __init__(self, capacity: int = 4096, name: Optional[str] = None, lock=None):
+        self.owner = name is None
+        if self.owner:
+            size = CONTROL_FIELDS * 8 + SPRITE_SLOTS * SPRITE_NAME + BUFFERS * self.bufferSize(capacity)
+            self.block = shared_memory.SharedMemory(create=True, size=size)
+            self.lock = multiprocessing.Lock()
+        else:
+            self.block = attach(name)
+            self.lock = lock
+
+        buf = self.block.buf
+        self.control = buf[:CONTROL_FIELDS * 8].cast("q")
+        if self.owner:
+            self.control[CONTROL_LATEST] = -1
+            self.control[CONTROL_READING] = -1
+            self.control[CONTROL_CAPACITY] = capacity
+        self.capacity = capacity = self.control[CONTROL_CAPACITY]
+
+        offset = CONTROL_FIELDS * 8
+        self.sprites = buf[offset:offset + SPRITE_SLOTS * SPRITE_NAME]
+        offset += SPRITE_SLOTS * SPRITE_NAME
+
+        # ? Per buffer: (meta, x, y, previous x, previous y, sprite, generation, flags)
+        self.buffers = []
+        for _ in range(BUFFERS):
+            fields = []
+            for code, count in self.layout(capacity):
+                size = struct.calcsize(code) * count
+                fields.append(buf[offset:offset + size].cast(code))
+                offset += size + (-size % 8)
+            self.buffers.append(tuple(fields))
+
+    @staticmethod
+    def layout(capacity: int) -> List[Tuple[str, int]]:
+        return [("d", META_FIELDS), ("d", capacity), ("d", capacity), ("d", capacity), ("d", capacity), ("i", capacity), ("i", capacity), ("B", capacity)]
+
+    @staticmethod
+    def bufferSize(capacity: int) -> int:  # ? Every field starts 8 Byte aligned
+        return sum(size + (-size % 8) for size in (struct.calcsize(code) * count for code, count in SharedWorld.layout(capacity)))
+
+    @property
+    def name(self) -> str:
+        return self.block.name
+
+    def spriteName(self, index: int) -> str:
+        raw = bytes(self.sprites[index * SPRITE_NAME:(index + 1) * SPRITE_NAME])
+        return raw.rstrip(b"\x00").decode("utf-8")
+
+    def settings(self) -> Tuple[int, int, Tuple[int, int]]:  # ? (sim rate, target FPS, window size) from WorldPublisher.describe()
+        with self.lock:
+            control = self.control
+            return control[CONTROL_SIM_RATE], control[CONTROL_TARGET_FPS], (control[CONTROL_WIDTH], control[CONTROL_HEIGHT])
+
+    def close(self):
+        # * Every view into the block has to go before it can be closed
+        for fields in self.buffers:
+            for field in fields:
+                field.release()
+        self.buffers = []
+        self.sprites.release()
+        self.control.release()
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+
+class WorldPublisher:
+    # ? Simulation side of a SharedWorld, writes the whole world into a free buffer and then flips it to the front
+    def __init__(self, world: SharedWorld, assets: AssetManager):
+        self.world = world
+        self.assets = assets
+
+        self.slots: Dict[SpaceObject, int] = {}
+        self.free: List[int] = []
+        self.count = 0  # ? Slots ever handed out
+        self.generations = [0] * world.capacity
+        self.spriteCount = 0  # ? Names written to the sprite table
+        self.spriteIds: Dict[int, Tuple[pygame.Surface, int]] = {}  # ? id(surface) -> (surface, sprite id), the surface keeps its id from being reused
+
+    def describe(self, simRate: int, targetFPS: int, size: Tuple[int, int]):  # ? Tells the window process what to open, then lets it
+        with self.world.lock:
+            control = self.world.control
+            control[CONTROL_SIM_RATE] = simRate
+            control[CONTROL_TARGET_FPS] = targetFPS
+            control[CONTROL_WIDTH] = size[0]
+            control[CONTROL_HEIGHT] = size[1]
+            control[CONTROL_STATE] = STATE_RUNNING
+
+    def stop(self):
+        self.world.control[CONTROL_STATE] = STATE_STOPPED
+
+    def spriteId(self, surface: pygame.Surface) -> int:  # ? -1 for surfaces that didn't come out of the AssetManager (or once the table's full)
+        entry = self.spriteIds.get(id(surface))
+        if entry is not None:
+            return entry[1]
+
+        # * Misses get remembered too, a surface that isn't in the AssetManager now never will be
+        # * and the table only ever fills up, so nothing gets scanned for more than once
+        key = next((key for key, value in self.assets.surfaces.items() if value is surface), None)
+        if key is None or self.spriteCount == SPRITE_SLOTS:
+            index = -1
+        else:
+            name = spriteName(key).encode("utf-8")[:SPRITE_NAME]
+            index = self.spriteCount
+            self.world.sprites[index * SPRITE_NAME:index * SPRITE_NAME + len(name)] = name
+            self.spriteCount += 1  # ? Readers only find out with the next frame that gets flipped (META_SPRITES)
+        self.spriteIds[id(surface)] = (surface, index)
+        return index
+
+    def publish(self, objs: List[SpaceObject], frame: int, previous: Dict[SpaceObject, Tuple[float, float]], stepCost: float, now: float):
+        # ? previous is where everything was a step earlier (FrameBlend.previous), the window blends between the two
+        world = self.world
+        control = world.control
+        with world.lock:
+            latest = control[CONTROL_LATEST]
+            reading = control[CONTROL_READING]
+        target = next(i for i in range(BUFFERS) if i != latest and i != reading)
+        meta, xs, ys, pxs, pys, sprites, generations, flags = world.buffers[target]
+
+        slots = self.slots
+        current = {}
+        overflow = 0
+        flags[:self.count] = bytes(self.count)
+        for obj in objs:
+            slot = slots.pop(obj, None)
+            if slot is None:
+                if len(self.free) != 0:
+                    slot = self.free.pop()
+                elif self.count < world.capacity:
+                    slot = self.count
+                    self.count += 1
+                else:
+                    overflow += 1
+                    continue
+                self.generations[slot] += 1
+            current[obj] = slot
+
+            pos = obj.pos
+            last = previous.get(obj, pos)
+            xs[slot] = pos[0]
+            ys[slot] = pos[1]
+            pxs[slot] = last[0]
+            pys[slot] = last[1]
+            sprites[slot] = self.spriteId(obj.active)
+            generations[slot] = self.generations[slot]
+            flags[slot] = FLAG_PRESENT | FLAG_DEAD if obj.isDead else FLAG_PRESENT
+        for slot in slots.values():  # ? Whatever's left isn't in the game anymore
+            self.free.append(slot)
+        self.slots = current
+
+        meta[META_FRAME] = float(frame)
+        meta[META_COUNT] = float(self.count)
+        meta[META_PUBLISHED_AT] = now
+        meta[META_STEP_COST] = stepCost
+        meta[META_SPRITES] = float(self.spriteCount)
+
+        with world.lock:
+            control[CONTROL_OVERFLOW] = overflow
+            control[CONTROL_LATEST] = target
+
+
+class EntityView:
+    # ? What Renderer draws in the window process, one per entity for as long as it keeps its slot
+    # ? Nothing gets copied into it, every attribute is read out of the buffer its WorldView has claimed when it's asked for
+    __slots__ = ("world", "slot", "generation")
+
+    def __init__(self, world: "WorldView", slot: int, generation: int):
+        self.world = world
+        self.slot = slot
+        self.generation = generation
+
+    @property
+    def pos(self) -> Tuple[float, float]:
+        world = self.world
+        return (world.xs[self.slot], world.ys[self.slot])
+
+    @property
+    def previous(self) -> Tuple[float, float]:  # ? Where it was a step earlier
+        world = self.world
+        return (world.pxs[self.slot], world.pys[self.slot])
+
+    @property
+    def active(self) -> pygame.Surface:
+        world = self.world
+        return world.sprites[world.spriteIds[self.slot]]
+
+    @property
+    def isDead(self) -> bool:
+        return self.world.flags[self.slot] & FLAG_DEAD != 0
+
+
+class ViewBlend(FrameBlend):
+    # ? FrameBlend for EntityViews, where everything was a step earlier comes out of the frame rather than capture()
+    def position(self, view: EntityView) -> Tuple[float, float]:
+        return self.between(view.previous, view.pos)
+
+
+class WorldView:
+    # ? Window side of a SharedWorld, refresh() claims the newest complete frame and entities reads straight out of it
+    # ? until the next refresh(), so everything drawn in between comes from the same frame
+    def __init__(self, world: SharedWorld, assets: AssetManager):
+        self.world = world
+        self.assets = assets
+
+        self.views: List[Optional[EntityView]] = [None] * world.capacity
+        self.sprites: List[pygame.Surface] = []
+        self.entities: List[EntityView] = []
+        # ? Fields of the claimed buffer, see SharedWorld.layout()
+        self.xs = self.ys = self.pxs = self.pys = self.spriteIds = self.flags = None
+        self.blend = ViewBlend()
+
+        self.frame = -1
+        self.publishedAt = 0.0
+        self.stepCost = 0.0
+
+    def refresh(self) -> bool:  # ? Whether there was a new frame
+        control = self.world.control
+        with self.world.lock:
+            latest = control[CONTROL_LATEST]
+            control[CONTROL_READING] = latest
+        if latest < 0:
+            return False
+        fields = self.world.buffers[latest]
+        meta, _, _, _, _, sprites, generations, flags = fields
+        if int(meta[META_FRAME]) == self.frame:  # ? Still the buffer that was already claimed
+            return False
+        _, self.xs, self.ys, self.pxs, self.pys, self.spriteIds, _, self.flags = fields
+
+        while len(self.sprites) < int(meta[META_SPRITES]):
+            self.sprites.append(loadSprite(self.assets, self.world.spriteName(len(self.sprites))))
+
+        # * Only what's needed to know which slots are drawn gets looked at here, the rest is read as it's drawn
+        views = self.views
+        loaded = len(self.sprites)
+        entities = []
+        for slot in range(int(meta[META_COUNT])):
+            if flags[slot] & FLAG_PRESENT == 0:
+                continue
+            sprite = sprites[slot]
+            if sprite < 0 or sprite >= loaded:
+                continue
+            generation = generations[slot]
+            view = views[slot]
+            if view is None or view.generation != generation:
+                view = views[slot] = EntityView(self, slot, generation)
+            entities.append(view)
+
+        self.entities = entities
+        self.frame = int(meta[META_FRAME])
+        self.publishedAt = meta[META_PUBLISHED_AT]
+        self.stepCost = meta[META_STEP_COST]
+        return True
+
+    def __str__(self):
+        return f"sim frame {self.frame} | step {self.stepCost * 1000:.2f}ms | {len(self.entities)} entities"
+
+
+class InputRing:
+    # ? Keys going from the window process to the simulation process
+    # * Attaching takes the creator's lock as well as the name, same as SharedWorld
+    def __init__(self, capacity: int = 256, name: Optional[str] = None, lock=None):
+        self.owner = name is None
+        if self.owner:
+            self.block = shared_memory.SharedMemory(create=True, size=24 + 2 * capacity)
+            self.lock = multiprocessing.Lock()
+        else:
+            self.block = attach(name)
+            self.lock = lock
+
+        # * Blocks can come back rounded up to a whole page, so the capacity is read from the block rather than from its size
+        buf = self.block.buf
+        self.counters = buf[:24].cast("q")
+        if self.owner:
+            self.counters[2] = capacity
+        self.capacity = capacity = self.counters[2]
+        self.keys = buf[24:24 + capacity]
+        self.flags = buf[24 + capacity:24 + 2 * capacity]
+        self.dropped = 0
+
+    @property
+    def name(self) -> str:
+        return self.block.name
+
+    def push(self, keys: int, flags: int = 0) -> bool:  # ? Producer only, False (and the record dropped) when the ring's full
+        counters = self.counters
+        with self.lock:
+            head = counters[0]
+            tail = counters[1]
+        if head - tail >= self.capacity:
+            self.dropped += 1
+            return False
+        i = head % self.capacity
+        self.keys[i] = keys
+        self.flags[i] = flags
+        with self.lock:
+            counters[0] = head + 1
+        return True
+
+    def drain(self) -> List[Tuple[int, int]]:  # ? Consumer only, (keys, flags) of every record pushed since the last drain
+        counters = self.counters
+        with self.lock:
+            head = counters[0]
+            tail = counters[1]
+        if tail == head:  # ? Nearly every step, nothing to hand back
+            return []
+        records = []
+        while tail < head:
+            i = tail % self.capacity
+            records.append((self.keys[i], self.flags[i]))
+            tail += 1
+        with self.lock:
+            counters[1] = tail
+        return records
+
+    def close(self):
+        self.keys.release()
+        self.flags.release()
+        self.counters.release()
+        self.block.close()
+        if self.owner:
+            self.block.unlink()